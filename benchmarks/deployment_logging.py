@@ -0,0 +1,88 @@
+"""
+Measures the cost of a log call within the deployment monitor while more and more deployments have been run.
+
+Each simulated deployment creates its log sink like `Deployment` does and writes a few records. With `--leak` the
+sinks are not removed afterwards (the behaviour before sinks were closed), to compare both.
+
+Usage:
+
+    python benchmarks/deployment_logging.py [--deployments 1000] [--leak] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def measure(calls: int) -> float:
+    """
+    Returns the average duration of a log call of the monitor in microseconds.
+    """
+
+    from loguru import logger
+
+    started = time.perf_counter()
+
+    for _ in range(calls):
+        logger.info("Waiting for deployments.")
+
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--deployments", type=int, default=1000)
+    parser.add_argument("--checkpoints", type=int, default=5)
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--leak", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    os.environ["MQ_SERVER__WORKING_DIRECTORY"] = tempfile.mkdtemp()
+    os.environ["MQ_SERVER__LOGS__COMPRESS"] = "false"
+    os.chdir(ROOT)
+
+    from loguru import logger
+
+    from mq.deployment.Deployment import Deployment
+
+    # The monitor logs to stdout, a sink which discards records keeps the benchmark output readable.
+    logger.remove()
+    logger.add(lambda message: None, level="INFO")
+
+    results: List[dict] = []
+    step = max(args.deployments // args.checkpoints, 1)
+
+    for count in range(0, args.deployments + 1):
+        if count % step == 0:
+            results.append({"deployments": count, "log_call_us": measure(args.calls)})
+
+        if count == args.deployments:
+            break
+
+        deployment = Deployment(f"benchmark-{count:06d}")
+        deployment.log.info("Started deployment {}", deployment.id)
+        deployment.log.info("Deployment {} finished.", deployment.id)
+
+        if not args.leak:
+            deployment.close_log()
+
+    if args.json:
+        print(json.dumps({"leak": args.leak, "results": results}, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"after {result['deployments']:>6} deployments: "
+            f"{result['log_call_us']:>8.2f} us per log call"
+        )
+
+
+if __name__ == "__main__":
+    main()
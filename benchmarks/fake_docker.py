@@ -0,0 +1,330 @@
+"""
+An in-memory stand-in for the Docker engine, used by the benchmarks instead of a Docker daemon.
+
+`FakeDocker.install()` replaces `docker.from_env`. The fake implements the parts of the Docker SDK which are used by
+Maquette Apps: listing, inspecting, starting, stopping and removing containers, running containers (with a start
+delay), building images (with a build delay), looking up and tagging images by label and the container events stream.
+Containers and images are returned as the SDK's own model classes.
+"""
+import queue
+import threading
+import time
+import uuid
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+import docker
+import yaml
+from docker.models.containers import Container
+from docker.models.images import Image
+
+
+def _matches(labels: Dict[str, str], label: str) -> bool:
+    """
+    Whether labels match a label filter, either `key` or `key=value`.
+    """
+
+    key, separator, value = label.partition("=")
+    return key in labels and (not separator or labels[key] == value)
+
+
+class _Api:
+    """
+    The low-level API of the engine (`client.api`).
+    """
+
+    def __init__(self, engine: "FakeDocker") -> None:
+        self.engine = engine
+
+    def containers(
+        self, all: bool = False, filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        self.engine.count("containers")
+        label = (filters or {}).get("label")
+        ids = (filters or {}).get("id")
+
+        with self.engine.lock:
+            return list(
+                [
+                    {
+                        "Id": c["Id"],
+                        "Names": [f"/{c['Name']}"],
+                        "Labels": dict(c["Labels"]),
+                        "State": c["State"],
+                        "Created": c["Created"],
+                    }
+                    for c in self.engine.store.values()
+                    if (all or c["State"] == "running")
+                    and (label is None or _matches(c["Labels"], label))
+                    and (ids is None or any(c["Id"].startswith(i) for i in ids))
+                ]
+            )
+
+    def inspect_container(self, id: str) -> Dict[str, Any]:
+        self.engine.count("inspect_container")
+        c = self.engine.container(id)
+
+        return {
+            "Id": c["Id"],
+            "Name": f"/{c['Name']}",
+            "Config": {"Labels": dict(c["Labels"])},
+            "State": {"Status": c["State"]},
+        }
+
+    def start(self, id: str) -> None:
+        self.engine.count("start")
+        time.sleep(self.engine.start_delay)
+        self.engine.set_state(id, "running", "start")
+
+    def stop(self, id: str, timeout: Optional[int] = None) -> None:
+        self.engine.count("stop")
+        self.engine.set_state(id, "exited", "die")
+
+    def remove_container(self, id: str, v: bool = False, force: bool = False) -> None:
+        self.engine.count("remove_container")
+        c = self.engine.container(id)
+
+        with self.engine.lock:
+            del self.engine.store[id]
+
+        self.engine.emit("destroy", c)
+
+    def build(
+        self,
+        path: str,
+        tag: str,
+        rm: bool = True,
+        labels: Optional[Dict[str, str]] = None,
+        decode: bool = True,
+    ) -> Iterator[Dict[str, Any]]:
+        self.engine.count("build")
+        steps = 5
+
+        for step in range(steps):
+            yield {"stream": f"Step {step + 1}/{steps} : RUN simulated\n"}
+            time.sleep(self.engine.build_delay / steps)
+            yield {"stream": f" ---> {uuid.uuid4().hex[:12]}\n"}
+
+        image_id = f"sha256:{uuid.uuid4().hex}{uuid.uuid4().hex}"
+
+        with self.engine.lock:
+            self.engine.image_store[image_id] = {
+                "Id": image_id,
+                "RepoTags": [tag],
+                "Config": {"Labels": dict(labels or {})},
+            }
+
+        yield {"aux": {"ID": image_id}}
+        yield {"stream": f"Successfully tagged {tag}\n"}
+
+    def tag(
+        self, image: str, repository: str, tag: Optional[str] = None, **kwargs: Any
+    ) -> bool:
+        self.engine.count("tag")
+
+        with self.engine.lock:
+            self.engine.image_store[image]["RepoTags"].append(
+                f"{repository}:{tag}" if tag else repository
+            )
+
+        return True
+
+    def remove_image(self, image: str, force: bool = False) -> None:
+        self.engine.count("remove_image")
+
+        with self.engine.lock:
+            for id, attrs in list(self.engine.image_store.items()):
+                if image in attrs["RepoTags"]:
+                    attrs["RepoTags"].remove(image)
+
+                    if not attrs["RepoTags"]:
+                        del self.engine.image_store[id]
+
+                    return
+
+        raise docker.errors.ImageNotFound(f"No such image: {image}")
+
+
+class _Containers:
+    """
+    The container collection (`client.containers`).
+    """
+
+    def __init__(self, engine: "FakeDocker") -> None:
+        self.engine = engine
+
+    def run(
+        self, image: str, name: str, labels: Dict[str, str], **kwargs: Any
+    ) -> Container:
+        self.engine.count("run")
+        id = self.engine.add_container(name, labels, "created")
+        self.engine.api.start(id)
+
+        return self.get(id)
+
+    def get(self, id: str) -> Container:
+        return Container(self.engine.api.inspect_container(id), client=self.engine)
+
+
+class _Images:
+    """
+    The image collection (`client.images`).
+    """
+
+    def __init__(self, engine: "FakeDocker") -> None:
+        self.engine = engine
+
+    def list(self, filters: Optional[Dict[str, Any]] = None) -> List[Image]:
+        self.engine.count("images")
+        key, _, value = str((filters or {}).get("label", "")).partition("=")
+
+        with self.engine.lock:
+            return list(
+                [
+                    Image(attrs, client=self.engine)
+                    for attrs in self.engine.image_store.values()
+                    if not key or attrs["Config"]["Labels"].get(key) == value
+                ]
+            )
+
+
+class FakeDocker:
+    """
+    The fake engine, it also acts as the client which is returned by `docker.from_env()`.
+
+    Parameters
+    ----------
+    build_delay : float
+        Seconds an image build takes.
+    start_delay : float
+        Seconds a container start takes.
+    """
+
+    def __init__(self, build_delay: float = 0, start_delay: float = 0) -> None:
+        self.build_delay = build_delay
+        self.start_delay = start_delay
+
+        self.lock = threading.Lock()
+        self.store: Dict[str, Dict[str, Any]] = {}
+        self.image_store: Dict[str, Dict[str, Any]] = {}
+        self.calls: Dict[str, int] = {}
+        self.subscribers: List["queue.Queue[Dict[str, Any]]"] = []
+
+        self.api = _Api(self)
+        self.containers = _Containers(self)
+        self.images = _Images(self)
+
+    def install(self) -> "FakeDocker":
+        """
+        Replaces `docker.from_env`, thus all Docker clients created by Maquette Apps use this engine.
+        """
+
+        docker.from_env = lambda **kwargs: self
+        return self
+
+    def events(self, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Returns a blocking stream of all container events, like the Docker SDK with `decode=True`. Filters are not
+        applied, consumers of the stream check the events anyway.
+        """
+
+        self.count("events")
+        subscriber: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+
+        with self.lock:
+            self.subscribers.append(subscriber)
+
+        def stream() -> Iterator[Dict[str, Any]]:
+            try:
+                while True:
+                    yield subscriber.get()
+            finally:
+                with self.lock:
+                    self.subscribers.remove(subscriber)
+
+        return stream()
+
+    def add_container(
+        self, name: str, labels: Dict[str, str], state: str = "running"
+    ) -> str:
+        """
+        Creates a container without delay, e.g. to simulate instances which are already running.
+        """
+
+        id = uuid.uuid4().hex + uuid.uuid4().hex
+        attrs = {
+            "Id": id,
+            "Name": name,
+            "Labels": dict(labels),
+            "State": state,
+            "Created": int(time.time()),
+        }
+
+        with self.lock:
+            self.store[id] = attrs
+
+        self.emit("create", attrs)
+        return id
+
+    def add_instance(
+        self, application: Dict[str, Any], deployment_id: str, index: int = 0
+    ) -> str:
+        """
+        Creates a running container labeled like an instance started by a deployment.
+        """
+
+        return self.add_container(
+            f"mq--{application['name']}--{deployment_id}--{index}",
+            {
+                "MQ__APPLICATION": yaml.safe_dump(application),
+                "MQ__DEPLOYMENT_ID": deployment_id,
+                "MQ__INSTANCE": str(index),
+                "MQ__PORT": "3000",
+            },
+        )
+
+    def container(self, id: str) -> Dict[str, Any]:
+        with self.lock:
+            if id not in self.store:
+                raise docker.errors.NotFound(f"No such container: {id}")
+
+            return self.store[id]
+
+    def set_state(self, id: str, state: str, action: str) -> None:
+        c = self.container(id)
+
+        with self.lock:
+            c["State"] = state
+
+        self.emit(action, c)
+
+    def emit(self, action: str, c: Dict[str, Any]) -> None:
+        event = {
+            "Type": "container",
+            "Action": action,
+            "time": int(time.time()),
+            "Actor": {"ID": c["Id"], "Attributes": dict(c["Labels"], name=c["Name"])},
+        }
+
+        with self.lock:
+            subscribers = list(self.subscribers)
+
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    def count(self, call: str) -> None:
+        with self.lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+
+    def reset(self) -> None:
+        """
+        Removes all containers, images and recorded calls.
+        """
+
+        with self.lock:
+            self.store = {}
+            self.image_store = {}
+            self.calls = {}
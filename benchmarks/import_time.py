@@ -0,0 +1,120 @@
+"""
+Measures the startup cost of the CLI.
+
+Each scenario is run in a fresh interpreter several times, the median wall-clock time is reported. With `--modules`
+the slowest imports of each scenario are listed as well (from `python -X importtime`).
+
+Usage:
+
+    python benchmarks/import_time.py [--runs 10] [--modules 10] [--json]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS: Dict[str, List[str]] = {
+    "python": ["-c", "pass"],
+    "mq --help": ["-m", "mq.main", "--help"],
+    "mq push --help": ["-m", "mq.main", "push", "--help"],
+    # Everything `mq push` imports and reads before it starts to scan the project directory.
+    "mq push (imports)": [
+        "-c",
+        "import mq.main; from mq.cli.push import Push; from mq.config import Config; Config.CLI.Target.endpoint",
+    ],
+}
+
+
+def run(arguments: List[str]) -> float:
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *arguments],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - started
+
+
+def slowest_imports(arguments: List[str], count: int) -> List[Tuple[str, float]]:
+    """
+    Returns the top-level imports with the highest cumulative import time in milliseconds.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *arguments],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+    imports: List[Tuple[str, float]] = []
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:") :].split("|")
+
+        # Only modules imported directly by the scenario, nested imports are indented.
+        if not name.startswith("  "):
+            imports.append((name.strip(), int(cumulative) / 1000))
+
+    return sorted(imports, key=lambda i: i[1], reverse=True)[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--modules", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = []
+
+    for name, arguments in SCENARIOS.items():
+        run(arguments)  # Warm up file system caches and bytecode.
+        timings = [run(arguments) for _ in range(args.runs)]
+
+        results.append(
+            {
+                "scenario": name,
+                "runs": args.runs,
+                "median_ms": round(statistics.median(timings) * 1000, 1),
+                "min_ms": round(min(timings) * 1000, 1),
+                "slowest_imports": [
+                    {"module": module, "cumulative_ms": ms}
+                    for module, ms in (
+                        slowest_imports(arguments, args.modules) if args.modules else []
+                    )
+                ],
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for result in results:
+        print(
+            f"{result['scenario']:<20} median {result['median_ms']:>7.1f} ms   "
+            f"min {result['min_ms']:>7.1f} ms"
+        )
+
+        for module in result["slowest_imports"]:
+            print(f"    {module['module']:<30} {module['cumulative_ms']:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""
+Measures how the platform scales, without a Docker daemon and without NGINX.
+
+Docker is replaced by the in-memory engine of `fake_docker.py`, which simulates any number of `mq--` containers as well
+as build and start delays. The scenarios are:
+
+* `zip_directory` - `Push._zip_directory` on a synthetic project tree (including ignored files).
+* `push_upload` - `/api/push` upload and extraction throughput of the API server.
+* `monitor_dispatch` - Latency from announcing a scheduled deployment to the monitor claiming it.
+* `instances` - `Infrastructure.list_instances`/`list_apps` and `discard_old_instances` with N containers.
+* `load_balancer` - `Infrastructure.update_load_balancer` for many apps: first render, unchanged and changed routes.
+* `deployment` - A complete deployment of several apps with simulated build and start delays, uncached and cached.
+
+Results are written as JSON with `--output`, thus they can be compared between commits.
+
+Usage:
+
+    python benchmarks/suite.py [--only instances] [--containers 5000] [--apps 1000] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_docker import FakeDocker  # noqa: E402
+
+SCENARIOS = [
+    "zip_directory",
+    "push_upload",
+    "monitor_dispatch",
+    "instances",
+    "load_balancer",
+    "deployment",
+]
+
+WORDS = (
+    "maquette apps deploys static webapps with docker and nginx load balancing".split()
+)
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def average(fn: Callable[[], Any], repeat: int) -> float:
+    return statistics.mean([timed(fn) for _ in range(repeat)])
+
+
+def percentile(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def settle(engine: FakeDocker) -> None:
+    """
+    Waits until the instance registry applied all pending container events and reloads it.
+    """
+
+    from mq.deployment.InstanceRegistry import InstanceRegistry
+
+    InstanceRegistry.instances()
+
+    while any(not s.empty() for s in list(engine.subscribers)):
+        time.sleep(0.01)
+
+    InstanceRegistry._load()
+
+
+def create_project(directory: Path, files: int, size: int) -> int:
+    """
+    Creates a project with text files, incompressible binaries and an ignored `node_modules` directory.
+
+    Returns
+    -------
+    The size of all files which are not ignored in bytes.
+    """
+
+    total = 0
+    (directory / ".gitignore").write_text("node_modules/\n*.log\n")
+
+    for i in range(files):
+        folder = directory / "src" / f"module-{i // 100:04d}"
+        folder.mkdir(parents=True, exist_ok=True)
+
+        if i % 5 == 0:
+            content = os.urandom(size)
+            (folder / f"image-{i}.png").write_bytes(content)
+        else:
+            text = " ".join(WORDS[(i + j) % len(WORDS)] for j in range(size // 6))
+            content = text.encode("utf-8")[:size]
+            (folder / f"page-{i}.html").write_bytes(content)
+
+        total += len(content)
+
+    for i in range(files // 2):
+        folder = directory / "node_modules" / f"package-{i // 100:04d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"index-{i}.js").write_text("module.exports = {};\n")
+
+    (directory / "index.html").write_text("<html>Hello</html>\n")
+    return total
+
+
+def bench_zip_directory(args: argparse.Namespace, temp: Path) -> Dict[str, Any]:
+    from mq.cli.push import Push
+
+    project = temp / "project"
+    project.mkdir()
+    size = create_project(project, args.files, args.file_size)
+    target = temp / "project.zip"
+    seconds = timed(lambda: Push._zip_directory(project, target))
+
+    return {
+        "parameters": {"files": args.files, "file_size": args.file_size},
+        "metrics": {
+            "seconds": seconds,
+            "files_per_second": args.files / seconds,
+            "input_mib_per_second": size / 1024**2 / seconds,
+            "archive_bytes": target.stat().st_size,
+        },
+    }
+
+
+def bench_push_upload(args: argparse.Namespace, temp: Path) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+
+    from mq.deployment.DeploymentStore import DeploymentStore
+    from mq.server import app
+
+    archive = temp / "project.zip"
+
+    if not archive.exists():
+        from mq.cli.push import Push
+
+        project = temp / "project"
+        project.mkdir(exist_ok=True)
+        create_project(project, args.files, args.file_size)
+        Push._zip_directory(project, archive)
+
+    client = TestClient(app)
+    durations: List[float] = []
+
+    for _ in range(args.uploads):
+        with open(archive, "rb") as f:
+            started = time.perf_counter()
+
+            # Background tasks (the extraction) complete before the test client returns.
+            response = client.post("/api/push", files={"files": f})
+            durations.append(time.perf_counter() - started)
+
+        response.raise_for_status()
+        info = DeploymentStore.get(response.json()["id"])
+        assert info is not None and info.status.value == "scheduled", info
+
+    size = archive.stat().st_size
+
+    return {
+        "parameters": {"uploads": args.uploads, "archive_bytes": size},
+        "metrics": {
+            "seconds_mean": statistics.mean(durations),
+            "seconds_max": max(durations),
+            "archive_mib_per_second": size / 1024**2 / statistics.mean(durations),
+        },
+    }
+
+
+def bench_monitor_dispatch(args: argparse.Namespace, temp: Path) -> Dict[str, Any]:
+    from mq.deployment.DeploymentInfo import DeploymentStatus
+    from mq.deployment.DeploymentQueue import DeploymentQueue
+    from mq.deployment.DeploymentStore import DeploymentStore
+
+    queue = DeploymentQueue()
+    latencies: List[float] = []
+
+    for i in range(args.dispatches):
+        deployment_id = f"dispatch-{i:06d}-{uuid.uuid4().hex[:4]}"
+        DeploymentStore.create(deployment_id)
+        DeploymentStore.transition(deployment_id, DeploymentStatus.scheduled)
+
+        started = time.perf_counter()
+        DeploymentQueue.put(deployment_id)
+        claimed = DeploymentStore.transition(
+            queue.get(), DeploymentStatus.running, [DeploymentStatus.scheduled]
+        )
+        latencies.append(time.perf_counter() - started)
+
+        assert claimed
+
+    return {
+        "parameters": {"dispatches": args.dispatches},
+        "metrics": {
+            "latency_ms_p50": percentile(latencies, 0.5) * 1000,
+            "latency_ms_p95": percentile(latencies, 0.95) * 1000,
+            "latency_ms_p99": percentile(latencies, 0.99) * 1000,
+            "latency_ms_max": max(latencies) * 1000,
+        },
+    }
+
+
+def bench_instances(args: argparse.Namespace, engine: FakeDocker) -> Dict[str, Any]:
+    from loguru import logger
+
+    from mq.deployment.DeploymentStore import DeploymentStore
+    from mq.deployment.Infrastructure import Infrastructure
+    from mq.deployment.InstanceRegistry import InstanceRegistry
+
+    # Each app has an instance of a previous and of its active deployment.
+    engine.reset()
+    apps = max(args.containers // 2, 1)
+
+    for i in range(apps):
+        application = {"name": f"app-{i:05d}", "buildback": "static-webapp"}
+        engine.add_instance(application, "20240101000000-0000")
+        engine.add_instance(application, "20240102000000-0000")
+
+    DeploymentStore.set_active_deployments(
+        {f"app-{i:05d}": "20240102000000-0000" for i in range(apps)}
+    )
+
+    settle(engine)
+    load = timed(InstanceRegistry._load)
+    list_instances = average(Infrastructure.list_instances, 10)
+    list_apps = average(Infrastructure.list_apps, 10)
+
+    engine.calls = {}
+    discard = timed(lambda: Infrastructure.discard_old_instances(None, logger, False))
+    calls = dict(engine.calls)
+    settle(engine)
+
+    assert len(Infrastructure.list_instances()) == apps
+
+    return {
+        "parameters": {"containers": apps * 2},
+        "metrics": {
+            "registry_load_seconds": load,
+            "list_instances_seconds": list_instances,
+            "list_apps_seconds": list_apps,
+            "discard_old_instances_seconds": discard,
+        },
+        "docker_calls": calls,
+    }
+
+
+def bench_load_balancer(args: argparse.Namespace, engine: FakeDocker) -> Dict[str, Any]:
+    from mq.config import Config
+    from mq.deployment import Infrastructure as infrastructure
+    from mq.deployment.DeploymentStore import DeploymentStore
+    from mq.deployment.Infrastructure import Infrastructure
+
+    engine.reset()
+
+    for i in range(args.apps):
+        application = {"name": f"app-{i:05d}", "buildback": "static-webapp"}
+        engine.add_instance(application, "20240101000000-0000")
+
+    DeploymentStore.set_active_deployments(
+        {f"app-{i:05d}": "20240101000000-0000" for i in range(args.apps)}
+    )
+
+    settle(engine)
+    infrastructure._last_routes = None
+    Path(Config.Server.NGINX.config_file).unlink(missing_ok=True)
+
+    first = timed(lambda: Infrastructure.update_load_balancer(reload_nginx=False))
+    unchanged = average(lambda: Infrastructure.update_load_balancer(False), 10)
+
+    application = {"name": "app-00000", "buildback": "static-webapp"}
+    engine.add_instance(application, "20240102000000-0000")
+    DeploymentStore.set_active_deployments({"app-00000": "20240102000000-0000"})
+    settle(engine)
+    changed = timed(lambda: Infrastructure.update_load_balancer(reload_nginx=False))
+
+    return {
+        "parameters": {"apps": args.apps},
+        "metrics": {
+            "first_update_seconds": first,
+            "unchanged_update_seconds": unchanged,
+            "changed_update_seconds": changed,
+            "config_bytes": Path(Config.Server.NGINX.config_file).stat().st_size,
+        },
+    }
+
+
+def bench_deployment(args: argparse.Namespace, engine: FakeDocker) -> Dict[str, Any]:
+    import yaml
+
+    from mq.config import Config
+    from mq.deployment.Deployment import Deployment
+    from mq.deployment.DeploymentInfo import DeploymentStatus
+    from mq.deployment.DeploymentStore import DeploymentStore
+
+    engine.reset()
+    engine.build_delay = args.build_delay
+    engine.start_delay = args.start_delay
+    settle(engine)
+
+    manifest = {
+        "applications": [
+            {
+                "name": f"deployed-{i:03d}",
+                "buildback": "static-webapp",
+                "readiness": {"type": "none"},
+            }
+            for i in range(args.deployment_apps)
+        ]
+    }
+
+    deployments: List[str] = []
+
+    def deploy() -> None:
+        deployment_id = datetime.now().strftime("%Y%m%d%H%M%S-") + uuid.uuid4().hex[:4]
+        working_dir = Config.Server.working_directory / "deployments" / deployment_id
+        (working_dir / "files").mkdir(parents=True)
+        (working_dir / "files" / "index.html").write_text("<html>Hello</html>\n")
+        (working_dir / "manifest.yml").write_text(yaml.safe_dump(manifest))
+
+        DeploymentStore.create(deployment_id)
+        DeploymentStore.transition(deployment_id, DeploymentStatus.scheduled)
+        DeploymentStore.transition(deployment_id, DeploymentStatus.running)
+        Deployment(deployment_id).run()
+
+        status = DeploymentStore.status(deployment_id)
+        assert status == DeploymentStatus.succeeded, f"Deployment {status}."
+        deployments.append(deployment_id)
+
+    uncached = timed(deploy)
+
+    # Deployment ids must differ in their timestamp to order instances.
+    time.sleep(1)
+    engine.calls = {}
+    cached = timed(deploy)
+    calls = dict(engine.calls)
+    info = DeploymentStore.get(deployments[-1])
+
+    return {
+        "parameters": {
+            "apps": args.deployment_apps,
+            "build_delay": args.build_delay,
+            "start_delay": args.start_delay,
+        },
+        "metrics": {"uncached_seconds": uncached, "cached_seconds": cached},
+        "docker_calls": calls,
+        "deployment_docker_calls": info.docker_calls if info else {},
+    }
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--only", action="append", choices=SCENARIOS)
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--file-size", type=int, default=8192)
+    parser.add_argument("--uploads", type=int, default=3)
+    parser.add_argument("--dispatches", type=int, default=500)
+    parser.add_argument("--containers", type=int, default=5000)
+    parser.add_argument("--apps", type=int, default=1000)
+    parser.add_argument("--deployment-apps", type=int, default=10)
+    parser.add_argument("--build-delay", type=float, default=0.5)
+    parser.add_argument("--start-delay", type=float, default=0.1)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    temp = Path(tempfile.mkdtemp())
+    os.environ["MQ_SERVER__WORKING_DIRECTORY"] = str(temp / "working-directory")
+    os.environ["MQ_SERVER__DRAIN_PERIOD_IN_SECONDS"] = "0"
+    os.environ["MQ_SERVER__LOGS__COMPRESS"] = "false"
+    os.environ["MQ_SERVER__NGINX__CONFIG_FILE"] = str(temp / "nginx.conf")
+    os.environ["MQ_SERVER__NGINX__PID_FILE"] = str(temp / "nginx.pid")
+    os.environ["MQ_SERVER__NGINX__VALIDATE"] = "false"
+    os.environ["MQ_SERVER__NGINX__RELOAD_WINDOW_IN_SECONDS"] = "0"
+    os.chdir(ROOT)
+
+    from loguru import logger
+
+    engine = FakeDocker().install()
+
+    # Keep the output readable, warnings of the missing NGINX are expected.
+    logger.remove()
+    logger.add(sys.stderr, level="ERROR")
+
+    scenarios: Dict[str, Callable[[], Dict[str, Any]]] = {
+        "zip_directory": lambda: bench_zip_directory(args, temp),
+        "push_upload": lambda: bench_push_upload(args, temp),
+        "monitor_dispatch": lambda: bench_monitor_dispatch(args, temp),
+        "instances": lambda: bench_instances(args, engine),
+        "load_balancer": lambda: bench_load_balancer(args, engine),
+        "deployment": lambda: bench_deployment(args, engine),
+    }
+
+    results: List[Dict[str, Any]] = []
+
+    for name in args.only or SCENARIOS:
+        result = {"name": name, **scenarios[name]()}
+        results.append(result)
+
+        if not args.json:
+            print(name)
+
+            for metric, value in result["metrics"].items():
+                print(f"    {metric:<32} {value:>14.6g}")
+
+    report = {
+        "commit": commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import hashlib
+from typing import Dict
+from typing import Optional
+
+from docker.models.images import Image
+
+from mq.buildpacks.Buildpack import Buildpack
+from mq.deployment.DockerGateway import DockerGateway
+
+LABEL = "MQ__BUILD_CACHE_KEY"
+
+
+class BuildCache:
+    """
+    Cache of built images, keyed by buildpack name, buildpack version and the content of the project files.
+
+    The key is stored as a label of the built image. Thus the cache is the local Docker image store itself and survives
+    restarts of the server. On a hit the existing image is tagged for the new deployment instead of building it again.
+    """
+
+    @staticmethod
+    def key(buildpack: Buildpack, files_hash: str) -> str:
+        """
+        Returns the cache key of an image built by a buildpack from project files.
+
+        Parameters
+        ----------
+        buildpack : Buildpack
+            The buildpack which builds the image.
+        files_hash : str
+            The hash of the project files, see `ProjectIndex.hash`.
+        """
+
+        return hashlib.sha256(
+            f"{buildpack.name}\n{buildpack.version}\n{files_hash}".encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def labels(key: str) -> Dict[str, str]:
+        """
+        Returns the labels which must be set on an image to register it in the cache.
+        """
+
+        return {LABEL: key}
+
+    @staticmethod
+    def lookup(key: str) -> Optional[Image]:
+        """
+        Returns a previously built image with the given cache key, if any.
+        """
+
+        images = DockerGateway.images(f"{LABEL}={key}")
+
+        if images:
+            return images[0]
+        else:
+            return None
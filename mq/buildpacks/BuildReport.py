@@ -0,0 +1,81 @@
+from typing import List
+from typing import Optional
+
+
+class BuildStep:
+    """
+    A step of an image build, e.g. a single instruction of a Dockerfile.
+
+    Parameters
+    ----------
+    name : str
+        The name of the step as reported by the builder, e.g. `Step 2/7 : ENV PORT 3000`.
+    duration_in_seconds : float
+        The time from the start of the step until the start of the next step (or the end of the build).
+    """
+
+    def __init__(self, name: str, duration_in_seconds: float) -> None:
+        self.name = name
+        self.duration_in_seconds = duration_in_seconds
+
+    @staticmethod
+    def from_dict(data: dict) -> "BuildStep":
+        return BuildStep(data["name"], float(data["duration_in_seconds"]))
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "duration_in_seconds": round(self.duration_in_seconds, 3),
+        }
+
+
+class BuildReport:
+    """
+    Structured summary of an image build.
+
+    Parameters
+    ----------
+    tag : str
+        The tag of the image.
+    duration_in_seconds : float
+        The total duration of the build.
+    steps : List[BuildStep]
+        The timings of the single build steps.
+    image_id : Optional[str]
+        The id of the created image, if reported by the builder.
+    cached : bool
+        Whether the image was taken from the build cache instead of being built.
+    """
+
+    def __init__(
+        self,
+        tag: str,
+        duration_in_seconds: float,
+        steps: List[BuildStep] = [],
+        image_id: Optional[str] = None,
+        cached: bool = False,
+    ) -> None:
+        self.tag = tag
+        self.duration_in_seconds = duration_in_seconds
+        self.steps = steps
+        self.image_id = image_id
+        self.cached = cached
+
+    @staticmethod
+    def from_dict(data: dict) -> "BuildReport":
+        return BuildReport(
+            data["tag"],
+            float(data["duration_in_seconds"]),
+            list([BuildStep.from_dict(step) for step in data.get("steps", [])]),
+            data.get("image_id"),
+            bool(data.get("cached", False)),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "tag": self.tag,
+            "image_id": self.image_id,
+            "cached": self.cached,
+            "duration_in_seconds": round(self.duration_in_seconds, 3),
+            "steps": list([step.to_dict() for step in self.steps]),
+        }
@@ -1,36 +1,130 @@
 import abc
+import re
+import time
 from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
 
 import loguru
 
+from mq.buildpacks.BuildReport import BuildReport
+from mq.buildpacks.BuildReport import BuildStep
+from mq.deployment.DockerGateway import DockerGateway
+from mq.deployment.ProjectIndex import ProjectIndex
+
+_STEP = re.compile(r"^Step \d+/\d+ : ")
+
 
 class Buildpack(abc.ABC):
-    def __init__(self, name: str) -> None:
+    def __init__(self, name: str, version: str) -> None:
+        """
+        Parameters
+        ----------
+        name : str
+            The name of the buildpack, referenced in manifests.
+        version : str
+            The version of the buildpack. It is part of the build cache key, thus it must be changed whenever the
+            buildpack produces different images from the same project files.
+        """
+
         super().__init__()
 
         self.name = name
+        self.version = version
 
-    def autodect(self, path: Path) -> bool:
+    def autodect(self, index: ProjectIndex) -> bool:
         """
-        Check a direcory whether it can be handled by this buildback.
+        Check a project whether it can be handled by this buildback.
 
-        This function is used to autodetect a buildpack if now buildpack is provided.
+        This function is used to autodetect a buildpack if now buildpack is provided. Implementations should query the
+        project index (e.g. `index.markers`) instead of reading the project directory.
         """
 
         return False
 
     @abc.abstractmethod
-    def build(self, path: Path, tag: str, logger: "loguru.Logger") -> None:
+    def build(
+        self,
+        path: Path,
+        tag: str,
+        logger: "loguru.Logger",
+        labels: Optional[Dict[str, str]] = None,
+    ) -> BuildReport:
         """
         Run the buildpack and create a docker image in the local docker registry.
 
+        The build output must be written to the logger line by line while the build is running.
+
         Parameters
         ----------
         path : Path
             The path to the working directory which contains the project files.
         tag : str
             The image tag which should be created.
+        logger : loguru.Logger
+            The logger of the deployment.
+        labels : Optional[Dict[str, str]]
+            Labels which must be set on the created image, e.g. the build cache key.
+
+        Returns
+        -------
+        BuildReport
+            The timings of the build and its steps.
+        """
+
+    def _docker_build(
+        self,
+        path: Path,
+        tag: str,
+        logger: "loguru.Logger",
+        labels: Optional[Dict[str, str]] = None,
+    ) -> BuildReport:
         """
+        Builds an image from the Dockerfile within `path`. The builder's output is logged line by line as it arrives
+        and the start of each Dockerfile step is recorded to report step timings.
+        """
+
+        started = time.monotonic()
+        steps: List[BuildStep] = []
+        step: Optional[str] = None
+        step_started = started
+        image_id: Optional[str] = None
+        pending = ""
+
+        def finish_step(now: float) -> None:
+            if step is not None:
+                steps.append(BuildStep(step, now - step_started))
+
+        for chunk in DockerGateway.build(
+            path=str(path), tag=tag, rm=True, labels=labels or {}
+        ):
+            if "error" in chunk:
+                raise Exception(f"Image build failed: {str(chunk['error']).strip()}")
+
+            if "aux" in chunk and "ID" in chunk["aux"]:
+                image_id = chunk["aux"]["ID"]
+
+            # A chunk might contain several lines or only a part of a line.
+            lines = (pending + chunk.get("stream", "")).split("\n")
+            pending = lines.pop()
+
+            for line in lines:
+                if _STEP.match(line):
+                    now = time.monotonic()
+                    finish_step(now)
+                    step, step_started = line, now
+
+                if line.strip():
+                    logger.info("{}", line.rstrip())
+
+        if pending.strip():
+            logger.info("{}", pending.rstrip())
+
+        finished = time.monotonic()
+        finish_step(finished)
+
+        return BuildReport(tag, finished - started, steps, image_id)
 
     def webapp_port(self) -> int:
         return 3000
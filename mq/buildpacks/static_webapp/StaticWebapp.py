@@ -1,31 +1,40 @@
+import os
+import uuid
 from importlib import resources
 from pathlib import Path
+from typing import Dict
+from typing import Optional
 
-import docker
 import loguru
 
 from mq.buildpacks import static_webapp
 from mq.buildpacks.Buildpack import Buildpack
+from mq.buildpacks.BuildReport import BuildReport
+from mq.deployment.ProjectIndex import ProjectIndex
 
 
 class StaticWebapp(Buildpack):
     def __init__(self) -> None:
-        super().__init__("static-webapp")
+        super().__init__("static-webapp", "1")
 
-    def autodect(self, path: Path) -> bool:
+    def autodect(self, index: ProjectIndex) -> bool:
         return True
 
-    def build(self, path: Path, tag: str, logger: "loguru.Logger") -> None:
+    def build(
+        self,
+        path: Path,
+        tag: str,
+        logger: "loguru.Logger",
+        labels: Optional[Dict[str, str]] = None,
+    ) -> BuildReport:
         self._create_dockerfile(path)
 
         logger.info("Building image `{}`.", tag)
-
-        client = docker.from_env()
-        (_, log) = client.images.build(path=str(path), tag=tag, rm=True)
-
-        log_complete = "".join([line["stream"] for line in log if "stream" in line])
-        logger.info("Image build logs:\n{}", log_complete)
+        return self._docker_build(path, tag, logger, labels)
 
     def _create_dockerfile(self, target_dir: Path) -> None:
+        # Applications of a deployment are built in parallel from the same directory, replace the file atomically.
         dockerfile = resources.read_text(static_webapp, "Dockerfile")
-        (target_dir / "Dockerfile").write_text(dockerfile)
+        temp = target_dir / f".Dockerfile.{uuid.uuid4()}"
+        temp.write_text(dockerfile)
+        os.replace(temp, target_dir / "Dockerfile")
@@ -0,0 +1,103 @@
+import math
+import zlib
+from collections import Counter
+from pathlib import Path
+
+# Formats which are compressed already, deflating them again costs CPU time without reducing their size.
+COMPRESSED_EXTENSIONS = set(
+    [
+        ".7z",
+        ".avif",
+        ".br",
+        ".bz2",
+        ".docx",
+        ".gif",
+        ".gz",
+        ".heic",
+        ".jar",
+        ".jpeg",
+        ".jpg",
+        ".mkv",
+        ".mov",
+        ".mp3",
+        ".mp4",
+        ".ogg",
+        ".png",
+        ".rar",
+        ".tgz",
+        ".webm",
+        ".webp",
+        ".whl",
+        ".woff",
+        ".woff2",
+        ".xlsx",
+        ".xz",
+        ".zip",
+        ".zst",
+    ]
+)
+
+
+class CompressionPolicy:
+    """
+    Decides per file whether it is deflated or stored without compression.
+
+    Files are stored if their extension denotes a compressed format or if a sample of their content looks random
+    (high byte entropy), which is the case for most compressed or encrypted data.
+
+    Parameters
+    ----------
+    level : int
+        The deflate level used for compressible files.
+    sample_size : int
+        The number of bytes read from the beginning of a file to estimate its entropy. Smaller files are always
+        deflated.
+    max_entropy : float
+        Files whose sample has a higher entropy (in bits per byte) are stored.
+    """
+
+    def __init__(
+        self,
+        level: int = zlib.Z_DEFAULT_COMPRESSION,
+        sample_size: int = 4096,
+        max_entropy: float = 7.5,
+    ) -> None:
+        self.level = level
+        self.sample_size = sample_size
+        self.max_entropy = max_entropy
+
+    def compress(self, file: Path, size: int) -> bool:
+        """
+        Returns whether a file should be deflated.
+
+        Parameters
+        ----------
+        file : Path
+            The file.
+        size : int
+            The file's size in bytes.
+        """
+
+        if self.level == 0 or file.suffix.lower() in COMPRESSED_EXTENSIONS:
+            return False
+
+        if size < self.sample_size:
+            return True
+
+        with open(file, "rb") as f:
+            sample = f.read(self.sample_size)
+
+        return CompressionPolicy.entropy(sample) <= self.max_entropy
+
+    @staticmethod
+    def entropy(data: bytes) -> float:
+        """
+        Returns the Shannon entropy of data in bits per byte.
+        """
+
+        if not data:
+            return 0.0
+
+        return -sum(
+            [(c / len(data)) * math.log2(c / len(data)) for c in Counter(data).values()]
+        )
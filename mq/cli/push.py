@@ -1,12 +1,20 @@
+import hashlib
+import json
 import time
 import zipfile
 from pathlib import Path
+from typing import Dict
+from typing import Iterator
+from typing import List
 from typing import Optional
+from typing import Tuple
 
 import requests
-from pathspec import PathSpec
 from requests import Response
 
+from mq.cli.compression import CompressionPolicy
+from mq.cli.walker import ProjectWalker
+from mq.cli.zipstream import ZipStream
 from mq.config import Config
 from mq.deployment.DeploymentInfo import DeploymentStatus
 
@@ -26,6 +34,31 @@ class Push:
         if working_directory is None:
             working_directory = Path(".").resolve()
 
+        if Config.CLI.Push.mode == "delta":
+            deployment_id = Push._push_delta(working_directory)
+        elif Config.CLI.Push.mode == "stream":
+            deployment_id = Push._push_stream(working_directory)
+        else:
+            deployment_id = Push._push_archive(working_directory)
+
+        # Print deployment logs
+        Push._log_and_wait(deployment_id)
+
+    @staticmethod
+    def _push_archive(working_directory: Path) -> str:
+        """
+        Uploads the whole project as a ZIP file.
+
+        Parameters
+        ----------
+        working_directory : Path
+            The project's root directory.
+
+        Returns
+        -------
+        The id of the created deployment.
+        """
+
         # Create ZIP file
         zip_file = working_directory / ".mq" / "upload" / "test.zip"
         Push._zip_directory(working_directory, zip_file)
@@ -36,50 +69,178 @@ class Push:
                 f"{Config.CLI.Target.endpoint}/api/push",
                 files={"files": f},
             )
-            deployment_id = result.json()["id"]
+            result.raise_for_status()
 
-        # Print deployment logs
-        Push._log_and_wait(deployment_id)
+            return str(result.json()["id"])
+
+    @staticmethod
+    def _push_stream(working_directory: Path) -> str:
+        """
+        Uploads the whole project as a ZIP file which is streamed into the request body while it is created.
+
+        Files are compressed by a pool of workers while the directory is still walked and already compressed entries
+        are sent. Nothing is staged on disk.
+
+        Parameters
+        ----------
+        working_directory : Path
+            The project's root directory.
+
+        Returns
+        -------
+        The id of the created deployment.
+        """
+
+        archive = ZipStream(
+            working_directory,
+            Push._walk(working_directory),
+            Config.CLI.Push.compression_workers,
+            Push._compression_policy(),
+        )
+
+        result = requests.post(
+            f"{Config.CLI.Target.endpoint}/api/push/stream",
+            data=iter(archive),
+            headers={"Content-Type": "application/zip"},
+        )
+        result.raise_for_status()
+
+        return str(result.json()["id"])
+
+    @staticmethod
+    def _push_delta(working_directory: Path) -> str:
+        """
+        Uploads only the files which are not yet known by the server.
+
+        The CLI sends a manifest of all file paths and their content hashes, the server answers with the hashes it
+        lacks. Only the content of these files is uploaded, the server assembles the project from its blob store.
+
+        Parameters
+        ----------
+        working_directory : Path
+            The project's root directory.
+
+        Returns
+        -------
+        The id of the created deployment.
+        """
+
+        files = Push._hash_files(working_directory, Push._list_files(working_directory))
+        manifest = {"files": files}
+
+        result = requests.post(
+            f"{Config.CLI.Target.endpoint}/api/push/missing", json=manifest
+        )
+        result.raise_for_status()
+        missing = set(result.json()["missing"])
+
+        # Package missing blobs, named by their hash
+        zip_file = working_directory / ".mq" / "upload" / "blobs.zip"
+
+        if not zip_file.parent.exists():
+            zip_file.parent.mkdir(parents=True)
+
+        policy = Push._compression_policy()
+
+        with zipfile.ZipFile(zip_file, "w") as zipf:
+            for name, digest in files.items():
+                if digest in missing:
+                    Push._write_entry(zipf, policy, working_directory / name, digest)
+                    missing.remove(digest)
+
+        # Upload to backend
+        with open(zip_file, "rb") as f:
+            result = requests.post(
+                f"{Config.CLI.Target.endpoint}/api/push/delta",
+                data={"manifest": json.dumps(manifest)},
+                files={"blobs": f},
+            )
+            result.raise_for_status()
+
+            return str(result.json()["id"])
 
     @staticmethod
     def _log_and_wait(deployment_id: str) -> None:
         """
-        Fetches logging information from the backend and wait until deployment succeeded or failed.
+        Streams logging information from the backend and waits until deployment succeeded or failed.
+
+        Log lines and status changes are received as Server-Sent Events. If the connection is interrupted, the stream
+        is resumed at the last received log offset.
 
         Parameters
         ----------
         deployment_id : str
-            The deployment id to fetch the log from the baxckend.
+            The deployment id to fetch the log from the backend.
         """
 
         running = True
         logs_offset = 0
 
         while running:
-            time.sleep(3)
+            try:
+                with requests.get(
+                    f"{Config.CLI.Target.endpoint}/api/push/{deployment_id}/stream",
+                    params={"offset": logs_offset},
+                    stream=True,
+                    timeout=(10, None),
+                ) as response:
+                    response.raise_for_status()
 
-            logs_response: Response = requests.get(
-                f"{Config.CLI.Target.endpoint}/api/push/{deployment_id}"
-            )
-            logs = logs_response.text
+                    for event, event_id, data in Push._read_events(response):
+                        if event == "log":
+                            print(data)
+                            logs_offset = int(event_id)
+                        elif event == "status" and data in [
+                            DeploymentStatus.succeeded.value,
+                            DeploymentStatus.failed.value,
+                        ]:
+                            running = False
+            except (
+                requests.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+            ):
+                # The stream broke before or while the response was read, e.g. because the server restarted.
+                time.sleep(1)
+
+    @staticmethod
+    def _read_events(response: Response) -> Iterator[Tuple[str, str, str]]:
+        """
+        Parses a Server-Sent Events stream.
+
+        Returns
+        -------
+        Tuples of event type, event id and data.
+        """
+
+        event, event_id = "message", ""
+        data: List[str] = []
+
+        for raw in response.iter_lines():
+            line = raw.decode("utf-8")
+
+            if not line:
+                if data:
+                    yield event, event_id, "\n".join(data)
 
-            if len(logs) > logs_offset:
-                print(logs[logs_offset:], end="")
-                logs_offset = len(logs)
+                event, data = "message", []
+                continue
 
-            if logs_response.headers["MQ-Deployment-Status"] in [
-                DeploymentStatus.succeeded.value,
-                DeploymentStatus.failed.value,
-            ]:
-                running = False
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+
+            if field == "event":
+                event = value
+            elif field == "id":
+                event_id = value
+            elif field == "data":
+                data.append(value)
 
     @staticmethod
     def _zip_directory(directory: Path, target: Path) -> None:
         """
-        Zips the directory respecting `.gitignore` file.
+        Zips the directory respecting `.gitignore` and `.mqignore` files.
 
-        Only the `.gitignore` file on the root directory gets respected, nested ignore files are not supported. The ZIP file will contain the directory contents
-        without the root directory.
+        The ZIP file will contain the directory contents without the root directory.
 
         Parameters
         ----------
@@ -89,27 +250,98 @@ class Push:
             The target (zip-)file which is created by this method.
         """
 
-        all_files = list(directory.glob("**/*"))
-        gitignore = directory / ".gitignore"
-
-        if gitignore.exists():
-            lines = gitignore.read_text().splitlines()
-            lines = lines + Config.CLI.Push.ignore_by_default
-
-            spec = PathSpec.from_lines("gitwildmatch", lines)
-
-            all_files = list(
-                [
-                    file
-                    for file in all_files
-                    if not spec.match_file(str(file.relative_to(directory)))
-                    and file.is_file()
-                ]
-            )
+        all_files = Push._list_files(directory)
 
         if not target.parent.exists():
             target.parent.mkdir(parents=True)
 
-        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zipf:
+        policy = Push._compression_policy()
+
+        with zipfile.ZipFile(target, "w") as zipf:
             for file in all_files:
-                zipf.write(file, file.relative_to(directory))
+                Push._write_entry(
+                    zipf, policy, file, file.relative_to(directory).as_posix()
+                )
+
+    @staticmethod
+    def _write_entry(
+        zipf: zipfile.ZipFile, policy: CompressionPolicy, file: Path, name: str
+    ) -> None:
+        """
+        Adds a file to a ZIP archive, deflated or stored as decided by the compression policy.
+        """
+
+        if policy.compress(file, file.stat().st_size):
+            zipf.write(file, name, zipfile.ZIP_DEFLATED, policy.level)
+        else:
+            zipf.write(file, name, zipfile.ZIP_STORED)
+
+    @staticmethod
+    def _compression_policy() -> CompressionPolicy:
+        return CompressionPolicy(Config.CLI.Push.compression_level)
+
+    @staticmethod
+    def _list_files(directory: Path) -> List[Path]:
+        """
+        Lists the files of a directory respecting `.gitignore` and `.mqignore` files.
+
+        Parameters
+        ----------
+        directory : Path
+            The directory to list.
+        """
+
+        return list(Push._iter_files(directory))
+
+    @staticmethod
+    def _iter_files(directory: Path) -> Iterator[Path]:
+        """
+        Walks the files of a directory respecting `.gitignore` and `.mqignore` files. Files are returned while the
+        directory is walked.
+
+        Parameters
+        ----------
+        directory : Path
+            The directory to walk.
+        """
+
+        for file, _ in Push._walk(directory):
+            yield file
+
+    @staticmethod
+    def _walk(directory: Path) -> ProjectWalker:
+        """
+        Returns a walker over the files of a directory and their stat results, see `ProjectWalker`.
+        """
+
+        return ProjectWalker(
+            directory,
+            Config.CLI.Push.ignore_by_default,
+            Config.CLI.Push.compression_workers,
+        )
+
+    @staticmethod
+    def _hash_files(directory: Path, files: List[Path]) -> Dict[str, str]:
+        """
+        Calculates the SHA-256 content hash of each file.
+
+        Parameters
+        ----------
+        directory : Path
+            The project's root directory, file names are returned relative to this directory.
+        files : List[Path]
+            The files to hash.
+        """
+
+        result: Dict[str, str] = {}
+
+        for file in files:
+            sha = hashlib.sha256()
+
+            with open(file, "rb") as f:
+                while chunk := f.read(1024 * 1024):
+                    sha.update(chunk)
+
+            result[file.relative_to(directory).as_posix()] = sha.hexdigest()
+
+        return result
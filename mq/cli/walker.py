@@ -0,0 +1,133 @@
+import os
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Deque
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from pathspec import PathSpec
+
+IGNORE_FILES = [".gitignore", ".mqignore"]
+
+# An ignore file's patterns and the directory (relative POSIX path, "" for the root) they are relative to.
+_Rules = List[Tuple[str, PathSpec]]
+
+
+class ProjectWalker:
+    """
+    Walks the files of a project directory, skipping ignored files and directories.
+
+    Ignore files (`.gitignore`, `.mqignore`) are read in every directory; their patterns are relative to the directory
+    which contains them and take precedence over the patterns of parent directories, like Git does. Ignored directories
+    are pruned, thus the walker never descends into e.g. `node_modules` or `.git` if they are ignored.
+
+    Directories are listed by a pool of worker threads, which also stat the files. The walker yields the files of a
+    directory while the workers already list the next directories.
+
+    Parameters
+    ----------
+    directory : Path
+        The project's root directory.
+    ignore : List[str]
+        Additional patterns which are applied to the whole project, e.g. `Config.CLI.Push.ignore_by_default`.
+    workers : int
+        The number of threads which list directories concurrently.
+    """
+
+    def __init__(self, directory: Path, ignore: List[str], workers: int = 8) -> None:
+        self.directory = directory
+        self.ignore = ignore
+        self.workers = max(workers, 1)
+
+    def __iter__(self) -> Iterator[Tuple[Path, os.stat_result]]:
+        """
+        Yields all files which are not ignored with their stat results. Files are sorted within each directory,
+        directories are visited in breadth-first order.
+        """
+
+        rules: _Rules = [("", PathSpec.from_lines("gitwildmatch", self.ignore))]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending: Deque[Future] = deque([executor.submit(self._scan, "", rules)])
+
+            while pending:
+                files, directories = pending.popleft().result()
+
+                for relative, directory_rules in directories:
+                    pending.append(
+                        executor.submit(self._scan, relative, directory_rules)
+                    )
+
+                yield from files
+
+    def _scan(
+        self, relative: str, rules: _Rules
+    ) -> Tuple[List[Tuple[Path, os.stat_result]], List[Tuple[str, _Rules]]]:
+        """
+        Lists a single directory.
+
+        Returns
+        -------
+        The files of the directory which are not ignored and the sub-directories to descend into, with the ignore rules
+        which apply within them.
+        """
+
+        path = self.directory / relative if relative else self.directory
+
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+
+        names = set([e.name for e in entries])
+        rules = rules + [
+            (relative, spec)
+            for spec in [
+                PathSpec.from_lines(
+                    "gitwildmatch", (path / name).read_text().splitlines()
+                )
+                for name in IGNORE_FILES
+                if name in names
+            ]
+        ]
+
+        files: List[Tuple[Path, os.stat_result]] = []
+        directories: List[Tuple[str, _Rules]] = []
+
+        for entry in entries:
+            entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+
+            if entry.is_dir(follow_symlinks=False):
+                if not self._ignored(entry_relative + "/", rules):
+                    directories.append((entry_relative, rules))
+            elif entry.is_file():
+                if not self._ignored(entry_relative, rules):
+                    files.append((Path(entry.path), entry.stat()))
+
+        return files, directories
+
+    @staticmethod
+    def _ignored(relative: str, rules: _Rules) -> bool:
+        """
+        Checks a path against all ignore rules. The last matching pattern decides, patterns of nested ignore files are
+        checked last. Directories are passed with a trailing slash, thus patterns like `build/` only match directories.
+        """
+
+        ignored: Optional[bool] = None
+
+        for base, spec in rules:
+            if base:
+                if not relative.startswith(base + "/"):
+                    continue
+
+                candidate = relative[len(base) + 1 :]
+            else:
+                candidate = relative
+
+            for pattern in spec.patterns:
+                if pattern.include is not None and pattern.regex.match(candidate):
+                    ignored = pattern.include
+
+        return bool(ignored)
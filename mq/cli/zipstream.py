@@ -0,0 +1,240 @@
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Deque
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from mq.cli.compression import CompressionPolicy
+
+_LOCAL_FILE_HEADER = struct.Struct("<4s5H3L2H")
+_DATA_DESCRIPTOR = struct.Struct("<4s3L")
+_CENTRAL_DIRECTORY_HEADER = struct.Struct("<4s6H3L5H2L")
+_END_OF_CENTRAL_DIRECTORY = struct.Struct("<4s4H2LH")
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_STORED = 0
+_DEFLATED = 8
+_MADE_BY_UNIX = (3 << 8) | 20
+_MAX_SIZE = 0xFFFFFFFF
+
+
+class _Entry:
+    def __init__(self, name: bytes, dos_time: int, dos_date: int, method: int) -> None:
+        self.name = name
+        self.method = method
+        self.dos_time = dos_time
+        self.dos_date = dos_date
+        self.offset = 0
+        self.crc = 0
+        self.compressed_size = 0
+        self.size = 0
+
+
+class ZipStream:
+    """
+    Produces a ZIP archive as a stream of chunks, without staging the archive on disk.
+
+    Files are split into segments which are compressed independently by a pool of worker threads. The compressed
+    segments are concatenated into a single deflate stream per entry. Files which are not worth compressing according
+    to the compression policy are stored. While the consumer of the stream (e.g. an HTTP
+    request) sends data, the workers already compress the next segments.
+
+    Parameters
+    ----------
+    directory : Path
+        The root directory, entry names are relative to this directory.
+    files : Iterable[Tuple[Path, os.stat_result]]
+        The files to add with their stat results, e.g. from a `ProjectWalker`. Files are read lazily while the stream is
+        consumed.
+    workers : int
+        The number of compression worker threads.
+    policy : CompressionPolicy
+        Decides which files are deflated and the deflate level.
+    segment_size : int
+        The size of the segments which are compressed in parallel.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        files: Iterable[Tuple[Path, os.stat_result]],
+        workers: int,
+        policy: CompressionPolicy = CompressionPolicy(),
+        segment_size: int = 1024 * 1024,
+    ) -> None:
+        self.directory = directory
+        self.files = files
+        self.workers = max(workers, 1)
+        self.policy = policy
+        self.segment_size = segment_size
+
+    def __iter__(self) -> Iterator[bytes]:
+        entries: List[_Entry] = []
+        offset = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Entries and their segments in archive order. Futures are resolved in order, while the workers already
+            # compress the following segments.
+            pending: Deque[Tuple[_Entry, Optional[Future], bool]] = deque()
+
+            def emit(entry: _Entry, future: Optional[Future], last: bool) -> bytes:
+                if future is None:
+                    entry.offset = offset
+                    return self._local_file_header(entry)
+
+                raw, compressed = future.result()
+                entry.crc = zlib.crc32(raw, entry.crc)
+                entry.size += len(raw)
+                entry.compressed_size += len(compressed)
+
+                if not last:
+                    return compressed
+
+                if entry.size > _MAX_SIZE or entry.compressed_size > _MAX_SIZE:
+                    raise ValueError(
+                        f"`{entry.name.decode()}` exceeds the ZIP size limit."
+                    )
+
+                return compressed + _DATA_DESCRIPTOR.pack(
+                    b"PK\x07\x08", entry.crc, entry.compressed_size, entry.size
+                )
+
+            for file, stat in self.files:
+                dos_time, dos_date = self._dos_timestamp(stat.st_mtime)
+                name = file.relative_to(self.directory).as_posix().encode("utf-8")
+
+                method = (
+                    _DEFLATED if self.policy.compress(file, stat.st_size) else _STORED
+                )
+
+                entry = _Entry(name, dos_time, dos_date, method)
+                entries.append(entry)
+                pending.append((entry, None, False))
+
+                segments = max(-(-stat.st_size // self.segment_size), 1)
+
+                for index in range(segments):
+                    last = index == segments - 1
+                    future = executor.submit(
+                        self._compress_segment,
+                        file,
+                        index * self.segment_size,
+                        last,
+                        method,
+                    )
+                    pending.append((entry, future, last))
+
+                    while len(pending) > self.workers * 4:
+                        chunk = emit(*pending.popleft())
+                        offset += len(chunk)
+                        yield chunk
+
+            while pending:
+                chunk = emit(*pending.popleft())
+                offset += len(chunk)
+                yield chunk
+
+        if offset > _MAX_SIZE or len(entries) > 0xFFFF:
+            raise ValueError("Archive exceeds the ZIP size limit.")
+
+        central_directory = b"".join(
+            [self._central_directory_header(e) for e in entries]
+        )
+        yield central_directory
+        yield _END_OF_CENTRAL_DIRECTORY.pack(
+            b"PK\x05\x06",
+            0,
+            0,
+            len(entries),
+            len(entries),
+            len(central_directory),
+            offset,
+            0,
+        )
+
+    def _compress_segment(
+        self, file: Path, position: int, last: bool, method: int
+    ) -> Tuple[bytes, bytes]:
+        """
+        Compresses a segment of a file as raw deflate data.
+
+        Segments which are not the last segment of a file are terminated with a full flush. Thus, they are
+        byte-aligned and do not reference data of other segments, which allows to concatenate them.
+        """
+
+        with open(file, "rb") as f:
+            f.seek(position)
+            raw = f.read(self.segment_size)
+
+        if method == _STORED:
+            return raw, raw
+
+        compressor = zlib.compressobj(self.policy.level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(raw)
+        compressed += compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+
+        return raw, compressed
+
+    @staticmethod
+    def _local_file_header(entry: _Entry) -> bytes:
+        return (
+            _LOCAL_FILE_HEADER.pack(
+                b"PK\x03\x04",
+                20,
+                _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8,
+                entry.method,
+                entry.dos_time,
+                entry.dos_date,
+                0,
+                0,
+                0,
+                len(entry.name),
+                0,
+            )
+            + entry.name
+        )
+
+    @staticmethod
+    def _central_directory_header(entry: _Entry) -> bytes:
+        return (
+            _CENTRAL_DIRECTORY_HEADER.pack(
+                b"PK\x01\x02",
+                _MADE_BY_UNIX,
+                20,
+                _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8,
+                entry.method,
+                entry.dos_time,
+                entry.dos_date,
+                entry.crc,
+                entry.compressed_size,
+                entry.size,
+                len(entry.name),
+                0,
+                0,
+                0,
+                0,
+                0o100644 << 16,
+                entry.offset,
+            )
+            + entry.name
+        )
+
+    @staticmethod
+    def _dos_timestamp(timestamp: float) -> Tuple[int, int]:
+        t = time.localtime(timestamp)
+        year = min(max(t.tm_year, 1980), 2107)
+
+        dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+        return dos_time, dos_date
@@ -1,63 +1,254 @@
+import functools
+import os
 from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Generic
 from typing import List
-
-from click import ClickException
-from dynaconf import Dynaconf
-
-settings = Dynaconf(
-    envvar_prefix="MQ",
-    settings_files=[
-        "settings.toml",
-        ".secrets.toml",
-        "/Users/michael.wellner/.mq/config.toml",  # TODO mw: use user home ...
-    ],
-)
-
-# Initialize Target values
-current_target = settings.get("cli.target", "default")
-target = settings.get(f"cli.targets.{current_target}")
-
-if target is None:
-    raise ClickException(
-        f"Currently selected target `{current_target}` is not configured."
+from typing import Optional
+from typing import Type
+from typing import TypeVar
+from typing import cast
+
+T = TypeVar("T")
+
+
+@functools.lru_cache(maxsize=None)
+def settings() -> Any:
+    """
+    Loads the settings on first use. Dynaconf is imported lazily as well, thus commands which do not read any
+    configuration (e.g. `mq --help`) do not pay for it.
+    """
+
+    from dynaconf import Dynaconf
+
+    return Dynaconf(
+        envvar_prefix="MQ",
+        settings_files=[
+            "settings.toml",
+            ".secrets.toml",
+            "/Users/michael.wellner/.mq/config.toml",  # TODO mw: use user home ...
+        ],
     )
 
 
+@functools.lru_cache(maxsize=None)
+def target() -> dict:
+    """
+    Returns the settings of the currently selected target.
+    """
+
+    from click import ClickException
+
+    current_target = settings().get("cli.target", "default")
+    selected = settings().get(f"cli.targets.{current_target}")
+
+    if selected is None:
+        raise ClickException(
+            f"Currently selected target `{current_target}` is not configured."
+        )
+
+    return dict(selected)
+
+
+class _Setting(Generic[T]):
+    """
+    A configuration value which is read from the settings on first access and cached afterwards.
+    """
+
+    def __init__(self, read: Callable[[], T]) -> None:
+        self.read = read
+        self.value: Optional[T] = None
+        self.loaded = False
+
+    def __get__(self, instance: Any, owner: Type) -> T:
+        if not self.loaded:
+            self.value = self.read()
+            self.loaded = True
+
+        return cast(T, self.value)
+
+
+def setting(key: str, default: Any, convert: Callable[[Any], T]) -> T:
+    """
+    Declares a configuration value, e.g. `setting("server.domain", "localhost", str)`.
+
+    Parameters
+    ----------
+    key : str
+        The dotted key within the settings.
+    default : Any
+        The value used if the key is not set.
+    convert : Callable[[Any], T]
+        Converts the raw value into the type of the configuration value.
+    """
+
+    return cast(T, _Setting(lambda: convert(settings().get(key, default))))
+
+
+def target_setting(key: str, default: str) -> str:
+    return cast(str, _Setting(lambda: str(target().get(key, default))))
+
+
 class Config:
     class CLI:
         class Target:
-            endpoint: str = target.get("endpoint", "http://localhost:8000")
-            org: str = target.get("org", "wellnr")
-            space: str = target.get("space", "hippo")
+            endpoint: str = target_setting("endpoint", "http://localhost:8000")
+            org: str = target_setting("org", "wellnr")
+            space: str = target_setting("space", "hippo")
 
         class Push:
 
-            ignore_by_default: List[str] = settings.get(
-                "cli.push.ignore_by_default", []
+            ignore_by_default: List[str] = setting(
+                "cli.push.ignore_by_default", [], list
             )
 
+            mode: str = setting("cli.push.mode", "delta", str)
+
+            compression_workers: int = setting(
+                "cli.push.compression_workers", os.cpu_count() or 1, int
+            )
+
+            compression_level: int = setting("cli.push.compression_level", 6, int)
+
     class Server:
 
-        domain: str = str(settings.get("server.domain", "home.wellnr.de"))
+        domain: str = setting("server.domain", "home.wellnr.de", str)
+
+        working_directory: Path = setting("server.working_directory", ".", Path)
+
+        network_name: str = setting("server.network_name", "mq-apps", str)
+
+        monitor_socket: Path = setting(
+            "server.monitor_socket",
+            None,
+            lambda value: Path(value)
+            if value
+            else Config.Server.working_directory / "monitor.sock",
+        )
+
+        deployment_timeout_in_seconds: int = setting(
+            "server.deployment_timeout_in_seconds", 120, int
+        )
+
+        deployment_workers: int = setting("server.deployment_workers", 4, int)
+
+        build_workers: int = setting("server.build_workers", 4, int)
 
-        working_directory: Path = Path(settings.get("server.working_directory", "."))
+        build_cache: bool = setting("server.build_cache", True, bool)
 
-        network_name: str = str(settings.get("server.network_name", "mq-apps"))
+        drain_period_in_seconds: float = setting(
+            "server.drain_period_in_seconds", 10, float
+        )
 
-        deployment_timeout_in_seconds: int = settings.get(
-            "server.deployment_timeout_in_seconds", 120
+        stop_timeout_in_seconds: int = setting(
+            "server.stop_timeout_in_seconds", 10, int
         )
 
+        class API:
+
+            port: int = setting("server.api.port", 8000, int)
+
+            workers: int = setting("server.api.workers", 1, int)
+
+            election_interval_in_seconds: float = setting(
+                "server.api.election_interval_in_seconds", 1, float
+            )
+
+        class Push:
+
+            chunk_size_in_bytes: int = setting(
+                "server.push.chunk_size_in_bytes", 1024 * 1024, int
+            )
+
+            max_upload_size_in_bytes: int = setting(
+                "server.push.max_upload_size_in_bytes", 1024**3, int
+            )
+
+            max_field_size_in_bytes: int = setting(
+                "server.push.max_field_size_in_bytes", 16 * 1024**2, int
+            )
+
+            max_extracted_size_in_bytes: int = setting(
+                "server.push.max_extracted_size_in_bytes", 4 * 1024**3, int
+            )
+
+            max_files: int = setting("server.push.max_files", 100000, int)
+
+            max_compression_ratio: int = setting(
+                "server.push.max_compression_ratio", 200, int
+            )
+
+        class Logs:
+
+            poll_interval_in_seconds: float = setting(
+                "server.logs.poll_interval_in_seconds", 0.25, float
+            )
+
+            compress: bool = setting("server.logs.compress", True, bool)
+
+        class Metrics:
+
+            write_interval_in_seconds: float = setting(
+                "server.metrics.write_interval_in_seconds", 1, float
+            )
+
+        class GC:
+
+            enabled: bool = setting("server.gc.enabled", True, bool)
+
+            interval_in_seconds: float = setting(
+                "server.gc.interval_in_seconds", 3600, float
+            )
+
+            keep_deployments: int = setting("server.gc.keep_deployments", 5, int)
+
+            max_age_in_days: float = setting("server.gc.max_age_in_days", 30, float)
+
+            blob_max_age_in_days: float = setting(
+                "server.gc.blob_max_age_in_days", 7, float
+            )
+
+            deletions_per_second: int = setting(
+                "server.gc.deletions_per_second", 1000, int
+            )
+
+        class Docker:
+
+            timeout_in_seconds: int = setting(
+                "server.docker.timeout_in_seconds", 60, int
+            )
+
+            pool_size: int = setting("server.docker.pool_size", 16, int)
+
+            retries: int = setting("server.docker.retries", 3, int)
+
+            backoff_in_seconds: float = setting(
+                "server.docker.backoff_in_seconds", 0.5, float
+            )
+
+            batch_window_in_seconds: float = setting(
+                "server.docker.batch_window_in_seconds", 0.005, float
+            )
+
         class NGINX:
 
-            pid_file: str = str(
-                settings.get(
-                    "server.nginx.pid_file", "/usr/local/etc/nginx/logs/nginx.pid"
-                )
+            pid_file: str = setting(
+                "server.nginx.pid_file", "/usr/local/etc/nginx/logs/nginx.pid", str
+            )
+
+            config_file: str = setting(
+                "server.nginx.config_file", "/usr/local/etc/nginx/nginx.conf", str
+            )
+
+            binary: str = setting("server.nginx.binary", "nginx", str)
+
+            validate: bool = setting("server.nginx.validate", True, bool)
+
+            reload_window_in_seconds: float = setting(
+                "server.nginx.reload_window_in_seconds", 0.5, float
             )
 
-            config_file: str = str(
-                settings.get(
-                    "server.nginx.config_file", "/usr/local/etc/nginx/nginx.conf"
-                )
+            upstream_keepalive: int = setting(
+                "server.nginx.upstream_keepalive", 32, int
             )
@@ -0,0 +1,48 @@
+from mq.deployment.Manifest import Application
+
+
+class ApplicationInstance:
+    def __init__(
+        self,
+        application: Application,
+        deployment_id: str,
+        container_id: str,
+        container_name: str,
+        webapp_port: int,
+        status: str,
+        created: float = 0,
+    ) -> None:
+
+        self.application = application
+        self.deployment_id = deployment_id
+        self.container_id = container_id
+        self.container_name = container_name
+        self.webapp_port = webapp_port
+        self.status = status
+
+        # Creation time of the container (Unix timestamp). Deployment ids of older versions do not sort by time, thus
+        # the latest deployment of an application is determined by the creation time of its containers.
+        self.created = created
+
+    @staticmethod
+    def from_dict(data: dict) -> "ApplicationInstance":
+        return ApplicationInstance(
+            application=Application.from_dict(data["application"]),
+            deployment_id=data["deployment_id"],
+            container_id=data["container_id"],
+            container_name=data["container_name"],
+            webapp_port=data["webapp_port"],
+            status=data["status"],
+            created=data.get("created", 0),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "application": self.application.to_dict(),
+            "deployment_id": self.deployment_id,
+            "container_id": self.container_id,
+            "container_name": self.container_name,
+            "webapp_port": self.webapp_port,
+            "status": self.status,
+            "created": self.created,
+        }
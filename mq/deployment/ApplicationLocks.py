@@ -0,0 +1,111 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Set
+from typing import Tuple
+
+
+class ApplicationLocks:
+    """
+    Serializes deployments of the same application, while deployments of different applications may run in parallel.
+
+    Deployments get their applications in the order in which they asked for them (FIFO). A deployment which waits does
+    not need to block a thread, see `try_acquire`.
+    """
+
+    _guard = threading.Lock()
+    _held: Set[str] = set()
+    _waiting: List[Tuple[Set[str], Callable[[], None]]] = []
+
+    @staticmethod
+    def try_acquire(names: Iterable[str], resume: Callable[[], None]) -> bool:
+        """
+        Acquires all given applications at once, if none of them is held or waited for by another deployment.
+        Otherwise the request is queued. When the applications have been acquired for the queued request, `resume` is
+        called by the thread which released them.
+
+        Applications are acquired all at once, thus deployments of overlapping sets of applications do not dead-lock
+        each other.
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            The names of the applications.
+        resume : Callable[[], None]
+            Continues the deployment after the applications have been acquired, e.g. by submitting it to a worker pool.
+            Must not block.
+
+        Returns
+        -------
+        True if the applications have been acquired right away, `resume` is not called then.
+        """
+
+        requested = set(names)
+
+        with ApplicationLocks._guard:
+            blocked = set(ApplicationLocks._held)
+
+            for waiting, _ in ApplicationLocks._waiting:
+                blocked |= waiting
+
+            if requested.isdisjoint(blocked):
+                ApplicationLocks._held |= requested
+                return True
+
+            ApplicationLocks._waiting.append((requested, resume))
+            return False
+
+    @staticmethod
+    def release(names: Iterable[str]) -> None:
+        """
+        Releases applications and resumes the queued deployments which can run now.
+        """
+
+        with ApplicationLocks._guard:
+            ApplicationLocks._held -= set(names)
+
+            granted: List[Callable[[], None]] = []
+            waiting: List[Tuple[Set[str], Callable[[], None]]] = []
+
+            # A request must not overtake an earlier request for one of its applications.
+            blocked = set(ApplicationLocks._held)
+
+            for requested, resume in ApplicationLocks._waiting:
+                if requested.isdisjoint(blocked):
+                    ApplicationLocks._held |= requested
+                    granted.append(resume)
+                else:
+                    waiting.append((requested, resume))
+
+                blocked |= requested
+
+            ApplicationLocks._waiting = waiting
+
+        for resume in granted:
+            resume()
+
+    @staticmethod
+    @contextmanager
+    def acquire(names: Iterable[str]) -> Iterator[None]:
+        """
+        Acquires the given applications, waits until they are available.
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            The names of the applications.
+        """
+
+        names = list(names)
+        acquired = threading.Event()
+
+        if not ApplicationLocks.try_acquire(names, acquired.set):
+            acquired.wait()
+
+        try:
+            yield
+        finally:
+            ApplicationLocks.release(names)
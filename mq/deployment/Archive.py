@@ -0,0 +1,344 @@
+import hashlib
+import stat
+import zipfile
+from pathlib import Path
+from pathlib import PurePosixPath
+from typing import IO
+from typing import AsyncIterator
+from typing import Collection
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import cast
+
+from fastapi.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser
+from multipart.multipart import parse_options_header
+
+from mq.config import Config
+
+
+class UploadTooLargeError(ValueError):
+    """
+    Raised if an upload exceeds `Config.Server.Push.max_upload_size_in_bytes`.
+    """
+
+
+class Archive:
+    """
+    Helpers to receive and unpack pushed ZIP archives without loading them into memory.
+    """
+
+    @staticmethod
+    async def save_form(
+        source: AsyncIterator[bytes],
+        content_type: str,
+        files: Dict[str, Path],
+        fields: Collection[str] = (),
+    ) -> Dict[str, str]:
+        """
+        Parses a streamed `multipart/form-data` request body. File fields are written to disk while the body is
+        received, thus, unlike with FastAPI's `UploadFile`, the body is not spooled to a temporary file first and an
+        upload which exceeds `Config.Server.Push.max_upload_size_in_bytes` is rejected right away.
+
+        Other fields are kept in memory, thus they are limited to `Config.Server.Push.max_field_size_in_bytes`. Parts
+        which are neither expected as file nor as field are rejected.
+
+        Parameters
+        ----------
+        source : AsyncIterator[bytes]
+            The chunks of the request body.
+        content_type : str
+            The `Content-Type` header of the request, including the boundary.
+        files : Dict[str, Path]
+            The file to write for each expected file field.
+        fields : Collection[str]
+            The names of the expected (text) fields.
+
+        Returns
+        -------
+        The values of the received fields.
+        """
+
+        _, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+
+        if not boundary:
+            raise ValueError("Request is not a multipart form.")
+
+        # The parser reports parts by callbacks, they are collected per chunk and handled afterwards, thus files are
+        # written by the thread pool.
+        events: List[Tuple[str, bytes]] = []
+        header_field = bytearray()
+        header_value = bytearray()
+
+        def on_header_end() -> None:
+            if bytes(header_field).lower() == b"content-disposition":
+                events.append(("disposition", bytes(header_value)))
+
+            header_field.clear()
+            header_value.clear()
+
+        parser = MultipartParser(
+            boundary,
+            {
+                "on_header_field": lambda d, s, e: header_field.extend(d[s:e]),
+                "on_header_value": lambda d, s, e: header_value.extend(d[s:e]),
+                "on_header_end": on_header_end,
+                "on_part_data": lambda d, s, e: events.append(("data", d[s:e])),
+                "on_part_end": lambda: events.append(("end", b"")),
+            },
+        )
+
+        written = 0
+        values: Dict[str, str] = {}
+        received: List[str] = []
+        name = ""
+        value = bytearray()
+        destination: Optional[IO[bytes]] = None
+
+        try:
+            async for chunk in source:
+                written = Archive._check_upload_size(written + len(chunk))
+                parser.write(chunk)
+
+                for event, data in events:
+                    if event == "disposition":
+                        name = parse_options_header(data)[1].get(b"name", b"").decode()
+                        value.clear()
+
+                        if name in files:
+                            destination = await run_in_threadpool(
+                                open, files[name], "wb"
+                            )
+                        elif name not in fields:
+                            expected = "`, `".join(sorted([*files, *fields]))
+                            raise ValueError(
+                                f"Unexpected form field `{name}`, expected `{expected}`."
+                            )
+                    elif event == "data":
+                        value += data
+
+                        if (
+                            destination is None
+                            and len(value) > Config.Server.Push.max_field_size_in_bytes
+                        ):
+                            raise ValueError(
+                                f"Form field `{name}` exceeds maximum size of "
+                                f"{Config.Server.Push.max_field_size_in_bytes} bytes."
+                            )
+                    elif destination is not None:
+                        await run_in_threadpool(destination.write, bytes(value))
+                        await run_in_threadpool(destination.close)
+                        destination = None
+                        received.append(name)
+                    else:
+                        try:
+                            values[name] = value.decode("utf-8")
+                        except UnicodeDecodeError:
+                            raise ValueError(f"Form field `{name}` is not UTF-8 text.")
+
+                    # Chunks of file fields are buffered, see `save_stream`.
+                    if (
+                        destination is not None
+                        and len(value) >= Config.Server.Push.chunk_size_in_bytes
+                    ):
+                        await run_in_threadpool(destination.write, bytes(value))
+                        value.clear()
+
+                events.clear()
+        finally:
+            if destination is not None:
+                await run_in_threadpool(destination.close)
+
+        missing = set(files) - set(received)
+
+        if missing:
+            raise ValueError(f"Missing form field(s) {', '.join(sorted(missing))}.")
+
+        return values
+
+    @staticmethod
+    async def save_stream(source: AsyncIterator[bytes], target: Path) -> int:
+        """
+        Writes a streamed request body to disk, e.g. a chunked upload of the CLI's streaming push mode.
+
+        Parameters
+        ----------
+        source : AsyncIterator[bytes]
+            The chunks of the request body.
+        target : Path
+            The file to write.
+
+        Returns
+        -------
+        The number of bytes written.
+        """
+
+        written = 0
+        buffer = bytearray()
+        destination = await run_in_threadpool(open, target, "wb")
+
+        try:
+            # Chunks of the request body are small. They are buffered and written by the thread pool, thus the event
+            # loop does not block on the disk and does not switch to the thread pool for each chunk.
+            async for chunk in source:
+                written = Archive._check_upload_size(written + len(chunk))
+                buffer += chunk
+
+                if len(buffer) >= Config.Server.Push.chunk_size_in_bytes:
+                    await run_in_threadpool(destination.write, bytes(buffer))
+                    buffer.clear()
+
+            await run_in_threadpool(destination.write, bytes(buffer))
+        finally:
+            await run_in_threadpool(destination.close)
+
+        return written
+
+    @staticmethod
+    def entries(zip_file: Path) -> Iterator[Tuple[str, IO[bytes]]]:
+        """
+        Validates an archive and yields its file entries as streams.
+
+        Entry names must be relative paths which stay within the archive root, links are rejected. The number of
+        entries, the total uncompressed size and the compression ratio are limited by `Config.Server.Push`. The limits
+        are checked against the archive's directory first and again while the content is streamed, as the directory
+        might not tell the truth.
+
+        Parameters
+        ----------
+        zip_file : Path
+            The archive to read.
+        """
+
+        with zipfile.ZipFile(zip_file, "r") as zip_ref:
+            infos = Archive._validate(zip_ref)
+            budget = [Config.Server.Push.max_extracted_size_in_bytes]
+
+            for info in infos:
+                with zip_ref.open(info) as source:
+                    reader = _LimitedReader(source, info.file_size, budget)
+                    yield info.filename, cast(IO[bytes], reader)
+
+    @staticmethod
+    def extract(zip_file: Path, target: Path) -> Dict[str, str]:
+        """
+        Extracts a validated archive. The content of the files is hashed while it is written.
+
+        Parameters
+        ----------
+        zip_file : Path
+            The archive to extract.
+        target : Path
+            The directory to extract the archive to.
+
+        Returns
+        -------
+        Dict[str, str]
+            The names of the extracted files mapped to the SHA-256 digests of their content.
+        """
+
+        target.mkdir(parents=True, exist_ok=True)
+        digests: Dict[str, str] = {}
+
+        for name, source in Archive.entries(zip_file):
+            file = target / name
+            file.parent.mkdir(parents=True, exist_ok=True)
+            sha = hashlib.sha256()
+
+            with open(file, "wb") as destination:
+                while chunk := source.read(Config.Server.Push.chunk_size_in_bytes):
+                    sha.update(chunk)
+                    destination.write(chunk)
+
+            digests[name] = sha.hexdigest()
+
+        return digests
+
+    @staticmethod
+    def _check_upload_size(size: int) -> int:
+        if size > Config.Server.Push.max_upload_size_in_bytes:
+            raise UploadTooLargeError(
+                f"Upload exceeds maximum size of {Config.Server.Push.max_upload_size_in_bytes} bytes."
+            )
+
+        return size
+
+    @staticmethod
+    def _validate(zip_ref: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+        """
+        Checks the archive's directory and returns the file entries.
+        """
+
+        infos = zip_ref.infolist()
+
+        if len(infos) > Config.Server.Push.max_files:
+            raise ValueError(
+                f"Archive contains more than {Config.Server.Push.max_files} entries."
+            )
+
+        total_size = 0
+        files: List[zipfile.ZipInfo] = []
+
+        for info in infos:
+            path = PurePosixPath(info.filename)
+
+            if (
+                path.is_absolute()
+                or ".." in path.parts
+                or "\\" in info.filename
+                or ":" in info.filename
+            ):
+                raise ValueError(f"Invalid entry `{info.filename}` in archive.")
+
+            if stat.S_ISLNK(info.external_attr >> 16):
+                raise ValueError(f"Links are not supported, found `{info.filename}`.")
+
+            if info.is_dir():
+                continue
+
+            # Small files may be compressed extremely well, the ratio matters only if the content is large.
+            ratio = info.file_size / max(info.compress_size, 1)
+
+            if (
+                info.file_size > Config.Server.Push.chunk_size_in_bytes
+                and ratio > Config.Server.Push.max_compression_ratio
+            ):
+                raise ValueError(
+                    f"Entry `{info.filename}` exceeds maximum compression ratio."
+                )
+
+            total_size += info.file_size
+            files.append(info)
+
+        if total_size > Config.Server.Push.max_extracted_size_in_bytes:
+            raise ValueError(
+                f"Archive exceeds maximum extracted size of {Config.Server.Push.max_extracted_size_in_bytes} bytes."
+            )
+
+        return files
+
+
+class _LimitedReader:
+    """
+    Wraps an archive entry and fails as soon as more bytes are read than declared or permitted in total.
+    """
+
+    def __init__(self, source: IO[bytes], declared_size: int, budget: List[int]):
+        self.source = source
+        self.remaining = declared_size
+        self.budget = budget
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.source.read(size)
+
+        self.remaining -= len(chunk)
+        self.budget[0] -= len(chunk)
+
+        if self.remaining < 0 or self.budget[0] < 0:
+            raise ValueError("Archive content exceeds its declared size.")
+
+        return chunk
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import IO
+from typing import Dict
+from typing import Iterable
+from typing import List
+
+from mq.config import Config
+
+
+class BlobStore:
+    """
+    Content-addressed storage for project files pushed to the server.
+
+    Each blob is stored under its SHA-256 digest. Deployments are assembled from blobs, thus unchanged files of a
+    project need to be uploaded only once.
+    """
+
+    @staticmethod
+    def directory() -> Path:
+        return Config.Server.working_directory / "blobs"
+
+    @staticmethod
+    def path(digest: str) -> Path:
+        """
+        Returns the location of a blob within the store. Blobs are sharded by the first two characters of their digest.
+
+        Parameters
+        ----------
+        digest : str
+            The SHA-256 hex digest of the blob.
+        """
+
+        if not BlobStore.is_digest(digest):
+            raise ValueError(f"`{digest}` is not a valid SHA-256 digest.")
+
+        return BlobStore.directory() / digest[:2] / digest
+
+    @staticmethod
+    def is_digest(value: str) -> bool:
+        return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+    @staticmethod
+    def missing(digests: Iterable[str]) -> List[str]:
+        """
+        Returns the digests which are not yet contained in the store. The modification time of contained blobs is
+        updated, thus the garbage collector keeps blobs which are used by pushes (see `GarbageCollector`).
+        """
+
+        missing: List[str] = []
+
+        for digest in set(digests):
+            try:
+                os.utime(BlobStore.path(digest))
+            except FileNotFoundError:
+                missing.append(digest)
+
+        return sorted(missing)
+
+    @staticmethod
+    def add(digest: str, source: IO[bytes], chunk_size: int = 1024 * 1024) -> None:
+        """
+        Stores a blob. The content is verified against the digest before it is moved into the store.
+
+        Parameters
+        ----------
+        digest : str
+            The expected SHA-256 hex digest of the content.
+        source : IO[bytes]
+            A readable stream providing the blob's content.
+        """
+
+        target = BlobStore.path(digest)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp = target.parent / f".{digest}.{uuid.uuid4()}.tmp"
+        sha = hashlib.sha256()
+
+        try:
+            with open(temp, "wb") as destination:
+                while chunk := source.read(chunk_size):
+                    sha.update(chunk)
+                    destination.write(chunk)
+
+            if sha.hexdigest() != digest:
+                raise ValueError(
+                    f"Content of blob `{digest}` does not match its digest."
+                )
+
+            os.replace(temp, target)
+        finally:
+            temp.unlink(missing_ok=True)
+
+    @staticmethod
+    def materialize(files: Dict[str, str], target: Path) -> None:
+        """
+        Creates a project directory from blobs.
+
+        Blobs are copied, not linked, as buildpacks may modify files within the project directory.
+
+        Parameters
+        ----------
+        files : Dict[str, str]
+            Relative file paths mapped to the digests of their content.
+        target : Path
+            The directory to create the files in.
+        """
+
+        missing = BlobStore.missing(files.values())
+
+        if missing:
+            raise ValueError(f"Blobs {', '.join(missing)} are not available.")
+
+        root = target.resolve()
+
+        for name, digest in files.items():
+            file = (root / name).resolve()
+
+            if not file.is_relative_to(root) or file == root:
+                raise ValueError(f"Invalid file path `{name}`.")
+
+            file.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(BlobStore.path(digest), file)
@@ -1,17 +1,38 @@
+import contextvars
+import gzip
+import os
+import shutil
 import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import TypeVar
 
-import docker
+import loguru
 import yaml
-from docker.models.containers import Container
 from loguru import logger
 
+from mq.buildpacks.BuildCache import BuildCache
 from mq.buildpacks.Buildpacks import Buildpacks
+from mq.buildpacks.BuildReport import BuildReport
 from mq.config import Config
-from mq.deployment.DeploymentInfo import DeploymentInfo
+from mq.deployment.ApplicationLocks import ApplicationLocks
 from mq.deployment.DeploymentInfo import DeploymentStatus
+from mq.deployment.DeploymentStore import DeploymentStore
+from mq.deployment.DockerGateway import DockerGateway
 from mq.deployment.Infrastructure import Infrastructure
+from mq.deployment.InstanceRegistry import InstanceRegistry
 from mq.deployment.Manifest import Application
 from mq.deployment.Manifest import Manifest
+from mq.deployment.Metrics import Metrics
+from mq.deployment.ProjectIndex import ProjectIndex
+
+T = TypeVar("T")
+
+PHASE = "mq_deployment_phase_seconds"
 
 
 class Deployment:
@@ -19,73 +40,257 @@ class Deployment:
         self.id = id
         self.working_dir = Config.Server.working_directory / "deployments" / id
 
-        logger.add(
+        # Records are written by a background thread, thus slow disks do not block the deployment. The sink is removed
+        # when the deployment finished, thus the monitor does not check records against sinks of old deployments.
+        self.sink = logger.add(
             self.working_dir / "deployment.log",
             filter=lambda record: record["extra"].get("name") == id,
-            format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <level>{message}</level>",
+            format=Deployment._log_format,
+            enqueue=True,
         )
 
         self.log = logger.bind(name=id)
+        self.index: Optional[ProjectIndex] = None
+        self.manifest: Optional[Manifest] = None
+        self.build_reports: Dict[str, BuildReport] = {}
 
     def run(self) -> None:
-        self._update_status(DeploymentStatus.running)
+        """
+        Runs the deployment. The deployment must have been claimed before (status `running`). Waits until running
+        deployments of the same applications finished.
+        """
+
+        names = self.prepare()
+
+        if names is None:
+            return
+
+        with ApplicationLocks.acquire(names):
+            self.execute()
+
+    def prepare(self) -> Optional[List[str]]:
+        """
+        Reads the project index and the manifest of the deployment.
+
+        Returns
+        -------
+        The names of the deployed applications, `None` if the deployment failed.
+        """
+
         self.log.info("Started deployment {}", self.id)
 
         try:
-            #
-            # Deploy specified applications.
-            #
-            manifest = self._read_manifest()
-            for app in manifest.applications:
-                self.deploy_application(app)
-
-            #
-            # Update NGINX.
-            #
-            Infrastructure.discard_old_instances()
-            Infrastructure.update_load_balancer()
-
-            self._update_status(DeploymentStatus.succeeded)
+            with Metrics.timer(PHASE, phase="manifest"):
+                self.index = self._read_index()
+                self.manifest = self._read_manifest(self.index)
+            DeploymentStore.set_applications(
+                self.id,
+                {app.name: self._image_tag(app) for app in self.manifest.applications},
+            )
         except Exception as err:
             traceback.print_exception(err)
             self.log.error(str(err))
-            self._update_status(DeploymentStatus.failed)
+            self._finish(DeploymentStatus.failed, {})
+            return None
 
-    def deploy_application(self, application: Application) -> None:
-        """ """
+        return list([app.name for app in self.manifest.applications])
 
-        #
-        # Build image with buildpack.
-        #
+    def execute(self) -> None:
+        """
+        Builds and starts the applications of a prepared deployment, switches the load balancer to them and discards
+        old instances. The caller must hold the deployment's applications, see `ApplicationLocks`.
+        """
+
+        assert self.manifest is not None, "Deployment must be prepared before."
+        manifest = self.manifest
+        names = list([app.name for app in manifest.applications])
+        status = DeploymentStatus.failed
+
+        # The active deployments of the applications before the switch, restored if the deployment fails.
+        previous = DeploymentStore.active_deployments()
+
+        with DockerGateway.track() as docker_calls:
+            try:
+                Deployment._run_parallel(
+                    self.build_application,
+                    manifest.applications,
+                    Config.Server.build_workers,
+                )
+                self._write_build_reports()
+
+                for applications in manifest.start_order():
+                    Deployment._run_parallel(
+                        self.deploy_application,
+                        applications,
+                        len(applications),
+                    )
+
+                #
+                # Switch NGINX to the new instances, afterwards drain and stop old instances.
+                #
+                self.log.info("Switching load balancer to deployment {}.", self.id)
+
+                # All instances are ready now. Until here, the load balancer routes to the previous deployment, also if
+                # a concurrent deployment of another application updates it.
+                DeploymentStore.set_active_deployments(
+                    {name: self.id for name in names}
+                )
+
+                with Metrics.timer(PHASE, phase="nginx_reload"):
+                    Infrastructure.update_load_balancer()
+
+                self.log.info("Load balancer switched to deployment {}.", self.id)
+
+                with Metrics.timer(PHASE, phase="discard"):
+                    Infrastructure.discard_old_instances(names, self.log)
+
+                status = DeploymentStatus.succeeded
+            except Exception as err:
+                traceback.print_exception(err)
+                self.log.error(str(err))
+                self._roll_back({name: previous.get(name) for name in names})
+            finally:
+                self._finish(status, docker_calls)
+
+    def _roll_back(self, previous: Dict[str, Optional[str]]) -> None:
+        """
+        Removes the instances of a failed deployment and switches the load balancer back to the previous deployments of
+        its applications. Instances of a failed deployment must not receive traffic, neither now nor after later updates
+        of the load balancer.
+        """
+
+        self.log.info("Removing instances of deployment {}.", self.id)
+
+        try:
+            DeploymentStore.set_active_deployments(previous)
+            Infrastructure.remove_deployment_instances(self.id, self.log)
+            Infrastructure.update_load_balancer()
+        except Exception as err:
+            traceback.print_exception(err)
+            self.log.error("Unable to remove instances of deployment: {}", err)
+
+    def _finish(self, status: DeploymentStatus, docker_calls: Dict[str, int]) -> None:
         self.log.info(
-            "Building `{}` with `{}`.", application.name, application.buildback
+            "Docker API calls: {}.",
+            ", ".join([f"{k}={v}" for k, v in sorted(docker_calls.items())]),
         )
+        DeploymentStore.set_docker_calls(self.id, docker_calls)
+
+        # The log is complete before the final status is visible, clients stop reading the log afterwards.
+        self.close_log()
+        self._update_status(status)
+
+    def close_log(self) -> None:
+        """
+        Removes the deployment's log sink, after all queued records have been written. The log is compressed afterwards
+        if `Config.Server.Logs.compress` is set.
+        """
+
+        logger.remove(self.sink)
 
+        log_file = self.working_dir / "deployment.log"
+
+        if not Config.Server.Logs.compress or not log_file.exists():
+            return
+
+        # Readers fall back to the compressed log if the log does not exist. Thus it is created before the log is
+        # removed.
+        temp = self.working_dir / f".deployment.log.{uuid.uuid4()}.gz"
+
+        with open(log_file, "rb") as source, gzip.open(temp, "wb") as target:
+            shutil.copyfileobj(source, target)
+
+        os.replace(temp, self.working_dir / "deployment.log.gz")
+        log_file.unlink()
+
+    def build_application(self, application: Application) -> None:
+        """
+        Builds the image of an application with its buildpack. If an image was already built from the same project
+        files with the same buildpack, this image is tagged for the deployment instead.
+        """
+
+        log = self._app_log(application)
+        buildpack = Buildpacks.get(application.buildback)
+        image_tag = self._image_tag(application)
+        labels: Dict[str, str] = {}
+
+        if Config.Server.build_cache:
+            assert self.index is not None, "Project index must be read before build."
+            key = BuildCache.key(buildpack, self.index.hash())
+            labels = BuildCache.labels(key)
+            image = BuildCache.lookup(key)
+
+            if image is not None:
+                log.info(
+                    "Using cached image `{}` for `{}`.",
+                    image.short_id,
+                    application.name,
+                )
+                DockerGateway.tag(image, application.name, self.id)
+                self.build_reports[application.name] = BuildReport(
+                    image_tag, 0, image_id=image.id, cached=True
+                )
+                return
+
+        log.info("Building `{}` with `{}`.", application.name, application.buildback)
+
+        with Metrics.timer(PHASE, phase="build"):
+            report = buildpack.build(self.working_dir / "files", image_tag, log, labels)
+        self.build_reports[application.name] = report
+
+        log.info(
+            "Built image `{}` in {:.1f} seconds ({} steps).",
+            image_tag,
+            report.duration_in_seconds,
+            len(report.steps),
+        )
+
+    def deploy_application(self, application: Application) -> None:
+        """
+        Starts the configured number of instances of an application and waits until all of them are ready.
+        """
+
+        Deployment._run_parallel(
+            lambda index: self._start_instance(application, index),
+            list(range(application.instances)),
+            application.instances,
+        )
+
+    def _start_instance(self, application: Application, index: int) -> None:
+        """
+        Starts a container from the application's image and waits until it is ready.
+        """
+
+        log = self._app_log(application)
         buildpack = Buildpacks.get(application.buildback)
-        image_tag = f"{application.name}:{self.id}"
-        buildpack.build(self.working_dir / "files", image_tag, self.log)
+        image_tag = self._image_tag(application)
 
         #
         # Deploy image.
         #
-        self.log.info("Starting `{}`", application.name, application.buildback)
-        docker_client = docker.from_env()
-
-        container: Container = docker_client.containers.run(
-            image_tag,
-            name=f"mq--{application.name}--{self.id}",
-            detach=True,
-            environment={"PORT": 3000},
-            network=Config.Server.network_name,
-            labels={
-                "MQ__APPLICATION": yaml.safe_dump(application.to_dict()),
-                "MQ__DEPLOYMENT_ID": self.id,
-                "MQ__PORT": str(buildpack.webapp_port()),
-            },
-            publish_all_ports=True,
+        log.info(
+            "Starting instance {}/{} of `{}`",
+            index + 1,
+            application.instances,
+            application.name,
         )
+        with Metrics.timer(PHASE, phase="start"):
+            container = DockerGateway.run(
+                image_tag,
+                name=f"mq--{application.name}--{self.id}--{index}",
+                detach=True,
+                environment={"PORT": 3000},
+                network=Config.Server.network_name,
+                labels={
+                    "MQ__APPLICATION": yaml.safe_dump(application.to_dict()),
+                    "MQ__DEPLOYMENT_ID": self.id,
+                    "MQ__INSTANCE": str(index),
+                    "MQ__PORT": str(buildpack.webapp_port()),
+                },
+                publish_all_ports=True,
+            )
 
-        self.log.info(
+        log.info(
             "Initialized `{}/{}` with status `{}`",
             container.id,
             container.name,
@@ -95,24 +300,47 @@ class Deployment:
         #
         # Wait until started.
         #
-        Infrastructure.wait_until_started(container.id, self.log)
-        container.reload()
+        with Metrics.timer(PHASE, phase="readiness"):
+            ready = Infrastructure.wait_until_started(container.id, log)
+
+        InstanceRegistry.update(container.id)
 
         #
         # Check status.
         #
-        if container.status == "running":
-            self.log.info("Succesffully started app `{}`.", application.name)
+        if ready:
+            log.info("Succesffully started app `{}`.", application.name)
         else:
-            self.log.error(
-                "Application `{}` did not start within specified timeout of {} seconds. Killing application.",
+            log.error(
+                "Application `{}` did not become ready within specified timeout of {} seconds. Killing application.",
                 application.name,
-                Config.Server.deployment_timeout_in_seconds,
+                application.readiness.timeout_in_seconds
+                or Config.Server.deployment_timeout_in_seconds,
             )
-            container.stop()
             raise Exception("An error occurred while starting app.")
 
-    def _read_manifest(self) -> Manifest:
+    def _read_index(self) -> ProjectIndex:
+        """
+        Reads the project index which was created during extraction. Deployments pushed before the index existed are
+        indexed now.
+        """
+
+        index = ProjectIndex.load(self.working_dir)
+
+        if index is None:
+            index = ProjectIndex.build(self.working_dir / "files")
+            index.save(self.working_dir)
+
+        self.log.info(
+            "Project contains {} files ({:.1f} MiB){}.",
+            len(index.files),
+            index.size() / 1024**2,
+            f", found {', '.join(index.markers)}" if index.markers else "",
+        )
+
+        return index
+
+    def _read_manifest(self, index: ProjectIndex) -> Manifest:
         """
         Check whether manifest exists. If it exists, validate the manifets.
 
@@ -126,7 +354,7 @@ class Deployment:
             manifest = Manifest.from_dict(yaml.safe_load(manifest_file.read_text()))
         else:
             self.log.info("No Manifest found. Try to detect Manifest settings.")
-            bp_matches = [bp for bp in Buildpacks.all if bp.autodect(self.working_dir)]
+            bp_matches = [bp for bp in Buildpacks.all if bp.autodect(index)]
 
             if not bp_matches:
                 self.log.error(
@@ -146,10 +374,55 @@ class Deployment:
         )
         return manifest
 
+    def _write_build_reports(self) -> None:
+        """
+        Stores the build reports of all applications, including the step timings, next to the deployment info.
+        """
+
+        path = self.working_dir / "deployment.builds.yml"
+        reports = {
+            name: report.to_dict() for name, report in self.build_reports.items()
+        }
+
+        path.write_text(yaml.safe_dump(reports, sort_keys=False))
+
     def _update_status(self, status: DeploymentStatus) -> None:
-        path = self.working_dir / "deployment.info.yml"
-        info = DeploymentInfo.from_dict(yaml.safe_load(path.read_text()))
+        DeploymentStore.transition(self.id, status, [DeploymentStatus.running])
+
+    def _app_log(self, application: Application) -> "loguru.Logger":
+        """
+        Returns a logger whose lines are prefixed with the application's name.
+        """
+
+        return self.log.bind(app=application.name)
+
+    def _image_tag(self, application: Application) -> str:
+        return f"{application.name}:{self.id}"
 
-        info.status = status
+    @staticmethod
+    def _log_format(record: "loguru.Record") -> str:
+        prefix = "[{extra[app]}] " if "app" in record["extra"] else ""
+        return (
+            "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+            + prefix
+            + "<level>{message}</level>\n"
+        )
+
+    @staticmethod
+    def _run_parallel(fn: Callable[[T], None], items: List[T], workers: int) -> None:
+        """
+        Runs a step for multiple items (e.g. applications) in parallel and waits for all of them. If one of the steps
+        fails, the first error is raised after all steps finished.
+        """
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            # Each step runs in a copy of the current context, thus its Docker API calls are counted for the deployment.
+            futures = list(
+                [
+                    executor.submit(contextvars.copy_context().run, fn, item)
+                    for item in items
+                ]
+            )
 
-        path.write_text(yaml.safe_dump(info.dict()))
+        for future in futures:
+            future.result()
@@ -1,20 +1,80 @@
 from enum import Enum
+from typing import Dict
+from typing import Optional
 
 
 class DeploymentStatus(Enum):
+    extracting = "extracting"
     scheduled = "scheduled"
     running = "running"
     succeeded = "succeeded"
     failed = "failed"
 
 
+# Lock file in the working directory of a deployment. It is held by the process which extracts the deployment's upload
+# as long as the deployment is `extracting`.
+EXTRACTION_LOCK = "extraction.lock"
+
+
 class DeploymentInfo:
-    def __init__(self, status: DeploymentStatus) -> None:
+    """
+    State of a deployment as recorded by the `DeploymentStore`.
+
+    Parameters
+    ----------
+    status : DeploymentStatus
+        The current status.
+    id : str
+        The id of the deployment.
+    created_at, scheduled_at, started_at, finished_at : Optional[str]
+        ISO 8601 timestamps of the deployment's phases, `None` if the phase has not been reached.
+    applications : Dict[str, str]
+        The deployed applications mapped to their image tags.
+    docker_calls : Dict[str, int]
+        The number of Docker API calls of the deployment by call name, recorded when the deployment finished.
+    """
+
+    def __init__(
+        self,
+        status: DeploymentStatus,
+        id: str = "",
+        created_at: Optional[str] = None,
+        scheduled_at: Optional[str] = None,
+        started_at: Optional[str] = None,
+        finished_at: Optional[str] = None,
+        applications: Dict[str, str] = {},
+        docker_calls: Dict[str, int] = {},
+    ) -> None:
         self.status = status
+        self.id = id
+        self.created_at = created_at
+        self.scheduled_at = scheduled_at
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.applications = applications
+        self.docker_calls = docker_calls
 
     @staticmethod
     def from_dict(data: dict) -> "DeploymentInfo":
-        return DeploymentInfo(status=DeploymentStatus[data["status"]])
+        return DeploymentInfo(
+            status=DeploymentStatus[data["status"]],
+            id=data.get("id", ""),
+            created_at=data.get("created_at"),
+            scheduled_at=data.get("scheduled_at"),
+            started_at=data.get("started_at"),
+            finished_at=data.get("finished_at"),
+            applications=dict(data.get("applications", {})),
+            docker_calls=dict(data.get("docker_calls", {})),
+        )
 
     def dict(self) -> dict:
-        return {"status": str(self.status.value)}
+        return {
+            "id": self.id,
+            "status": str(self.status.value),
+            "created_at": self.created_at,
+            "scheduled_at": self.scheduled_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "applications": self.applications,
+            "docker_calls": self.docker_calls,
+        }
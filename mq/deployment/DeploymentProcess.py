@@ -1,53 +1,250 @@
 import os
+import signal
 import sys
+import threading
 import time
-from multiprocessing import Process
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.context import SpawnProcess
+from pathlib import Path
 from typing import List
+from typing import Optional
 
-import yaml
 from loguru import logger
 
 from mq.config import Config
+from mq.deployment.ApplicationLocks import ApplicationLocks
 from mq.deployment.Deployment import Deployment
-from mq.deployment.DeploymentInfo import DeploymentInfo
+from mq.deployment.DeploymentInfo import EXTRACTION_LOCK
 from mq.deployment.DeploymentInfo import DeploymentStatus
+from mq.deployment.DeploymentQueue import DeploymentQueue
+from mq.deployment.DeploymentStore import DeploymentStore
+from mq.deployment.GarbageCollector import GarbageCollector
+from mq.deployment.LeaderLock import LeaderLock
+from mq.deployment.Metrics import Metrics
 
+# Interval of the check for interrupted extractions, see `DeploymentMonitor.recover_extractions`.
+_EXTRACTION_CHECK_INTERVAL_IN_SECONDS = 60
 
-class DeploymentMonitor(Process):
+
+class DeploymentMonitor(SpawnProcess):
     def __init__(self) -> None:
         super().__init__()
         self.daemon = True
 
         self.deployments_dir = Config.Server.working_directory / "deployments"
 
+    @staticmethod
+    def supervise() -> None:
+        """
+        Runs the deployment monitor in exactly one process of the server, also if the server runs several API workers.
+
+        Each API worker calls this method. A background thread checks whether the monitor's leader lock is free and
+        starts a monitor if so. The monitor holds the lock as long as it runs, a monitor which does not get the lock
+        exits right away. Thus, workers which start later, or while the monitor of a crashed worker still runs, do not
+        start another monitor. If the monitor exits, a worker starts a new one.
+
+        The monitor is spawned, not forked: A fork of the threaded worker would inherit locks held by other threads and
+        the signal handlers of uvicorn.
+        """
+
+        threading.Thread(target=DeploymentMonitor._supervise, daemon=True).start()
+
+    @staticmethod
+    def lock_file() -> Path:
+        return Config.Server.working_directory / "monitor.lock"
+
+    @staticmethod
+    def _supervise() -> None:
+        monitor: Optional[DeploymentMonitor] = None
+
+        while True:
+            if monitor is None or not monitor.is_alive():
+                if monitor is not None and monitor.exitcode != 0:
+                    logger.warning(
+                        "Deployment monitor exited with code {}.", monitor.exitcode
+                    )
+
+                probe = LeaderLock(DeploymentMonitor.lock_file())
+
+                if probe.acquire():
+                    probe.release()
+                    monitor = DeploymentMonitor()
+                    monitor.start()
+
+            time.sleep(Config.Server.API.election_interval_in_seconds)
+
     def run(self) -> None:
         # We can do an endless loop here because we flagged the process as
         # being a "daemon". This ensures it will exit when the parent exists.
 
+        # Restore the default handlers, thus SIGTERM (e.g. by the exiting parent) and SIGINT (Ctrl+C) stop the monitor.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
         logger.remove()
         logger.add(sys.stdout, level="INFO")
 
-        while True:
-            logger.debug("Checking for new deployments.")
+        # Another worker might have started a monitor since the lock was checked. The lock is held until the process
+        # exits.
+        lock = LeaderLock(DeploymentMonitor.lock_file())
+
+        if not lock.acquire():
+            logger.info("Another deployment monitor is running.")
+            return
+
+        logger.info("Deployment monitor started (pid {}).", os.getpid())
+
+        # Listen for new deployments before scanning, thus no deployment gets lost in between.
+        queue = DeploymentQueue()
+
+        DeploymentMonitor.recover_deployments()
+
+        for deployment in DeploymentStore.ids(DeploymentStatus.scheduled):
+            logger.info("Recovering scheduled deployment `{}`.", deployment)
+            queue.add(deployment)
+
+        threading.Thread(
+            target=DeploymentMonitor._recover_extractions, daemon=True
+        ).start()
+
+        if Config.Server.GC.enabled:
+            GarbageCollector.start()
+
+        with ThreadPoolExecutor(
+            max_workers=Config.Server.deployment_workers
+        ) as executor:
+            while True:
+                deployment = queue.get()
+                Metrics.inc("mq_deployment_queue_depth")
+
+                try:
+                    DeploymentMonitor._dispatch(executor, deployment)
+                except Exception as err:
+                    logger.warning(
+                        "Unable to dispatch deployment `{}`: {}", deployment, err
+                    )
+
+    @staticmethod
+    def recover_deployments() -> List[str]:
+        """
+        Fails deployments which are `running`. Deployments are only run by the monitor, thus this must only be called
+        while holding the monitor's lock (see `lock_file`): Deployments which are still running were interrupted.
+
+        Returns
+        -------
+        The ids of the failed deployments.
+        """
+
+        failed: List[str] = []
+
+        for deployment in DeploymentStore.ids(DeploymentStatus.running):
+            if DeploymentStore.transition(
+                deployment, DeploymentStatus.failed, [DeploymentStatus.running]
+            ):
+                logger.warning("Deployment `{}` was interrupted.", deployment)
+                failed.append(deployment)
+
+        return failed
 
-            deployments: List[str] = []
-            if self.deployments_dir.is_dir() and self.deployments_dir.exists():
-                deployments = os.listdir(self.deployments_dir)
+    @staticmethod
+    def recover_extractions() -> List[str]:
+        """
+        Fails deployments which are `extracting`, but whose extraction lock is not held: The API worker which extracted
+        the upload died.
 
-            for deployment in deployments:
-                deployment_info_file = (
-                    self.deployments_dir / deployment / "deployment.info.yml"
-                )
+        Returns
+        -------
+        The ids of the failed deployments.
+        """
 
-                if deployment_info_file.exists():
-                    deployment_info = DeploymentInfo.from_dict(
-                        yaml.safe_load(deployment_info_file.read_text())
+        failed: List[str] = []
+
+        for deployment in DeploymentStore.ids(DeploymentStatus.extracting):
+            working_dir = Config.Server.working_directory / "deployments" / deployment
+            lock = LeaderLock(working_dir / EXTRACTION_LOCK)
+
+            # The working directory is created before the deployment, without it no upload can be extracted.
+            if not working_dir.is_dir():
+                if DeploymentStore.transition(
+                    deployment, DeploymentStatus.failed, [DeploymentStatus.extracting]
+                ):
+                    logger.warning("Deployment `{}` has no files.", deployment)
+                    failed.append(deployment)
+
+                continue
+
+            if not lock.acquire():
+                continue
+
+            try:
+                if DeploymentStore.transition(
+                    deployment, DeploymentStatus.failed, [DeploymentStatus.extracting]
+                ):
+                    logger.warning(
+                        "Extraction of deployment `{}` was interrupted.", deployment
                     )
-                else:
-                    continue
 
-                if deployment_info.status == DeploymentStatus.scheduled:
-                    Deployment(deployment).run()
+                    with open(working_dir / "deployment.log", "a") as log:
+                        log.write("Extraction of uploaded files was interrupted.\n")
+
+                    failed.append(deployment)
+            finally:
+                lock.release()
+
+        return failed
+
+    @staticmethod
+    def _recover_extractions() -> None:
+        while True:
+            try:
+                DeploymentMonitor.recover_extractions()
+            except Exception as err:
+                logger.warning("Unable to recover extractions: {}", err)
+
+            time.sleep(_EXTRACTION_CHECK_INTERVAL_IN_SECONDS)
+
+    @staticmethod
+    def _dispatch(executor: ThreadPoolExecutor, deployment_id: str) -> None:
+        """
+        Claims a deployment and reads its manifest. The deployment is submitted to the workers as soon as its
+        applications are free. Until then it waits in `ApplicationLocks` without occupying a worker, thus deployments of
+        other applications are not blocked.
+
+        Deployments are dispatched one after another, thus deployments of the same application run in the order in
+        which they were queued.
+        """
+
+        # Claiming the deployment is atomic, thus deployments which are announced twice are run only once.
+        if not DeploymentStore.transition(
+            deployment_id, DeploymentStatus.running, [DeploymentStatus.scheduled]
+        ):
+            Metrics.inc("mq_deployment_queue_depth", -1)
+            return
+
+        deployment = Deployment(deployment_id)
+        names = deployment.prepare()
+
+        if names is None:
+            Metrics.inc("mq_deployment_queue_depth", -1)
+            return
+
+        def submit() -> None:
+            executor.submit(DeploymentMonitor._execute, deployment, names)
+
+        if ApplicationLocks.try_acquire(names, submit):
+            submit()
+        else:
+            deployment.log.info(
+                "Waiting for running deployment of `{}`.", "`, `".join(names)
+            )
+
+    @staticmethod
+    def _execute(deployment: Deployment, names: List[str]) -> None:
+        Metrics.inc("mq_deployment_queue_depth", -1)
+        Metrics.inc("mq_deployment_workers_active")
 
-            # Wait at least 5 seconds for the next execution
-            time.sleep(5)
+        try:
+            deployment.execute()
+        finally:
+            ApplicationLocks.release(names)
+            Metrics.inc("mq_deployment_workers_active", -1)
@@ -0,0 +1,80 @@
+import queue
+import socket
+import threading
+from pathlib import Path
+
+from loguru import logger
+
+from mq.config import Config
+
+
+class DeploymentQueue:
+    """
+    Work queue of scheduled deployments, shared between the API server and the deployment monitor.
+
+    The monitor owns the queue and listens on a local (Unix domain) socket. The API server announces scheduled
+    deployments with `DeploymentQueue.put`. Deployments which are announced while the monitor is not running are
+    recovered by the monitor's startup scan.
+    """
+
+    def __init__(self) -> None:
+        self.deployments: "queue.Queue[str]" = queue.Queue()
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        address = DeploymentQueue.address()
+        address.parent.mkdir(parents=True, exist_ok=True)
+        address.unlink(missing_ok=True)
+
+        self.socket.bind(str(address))
+        self.socket.listen()
+
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @staticmethod
+    def address() -> Path:
+        return Config.Server.monitor_socket
+
+    @staticmethod
+    def put(deployment_id: str) -> None:
+        """
+        Announces a scheduled deployment to the deployment monitor.
+
+        Parameters
+        ----------
+        deployment_id : str
+            The id of the scheduled deployment.
+        """
+
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(str(DeploymentQueue.address()))
+                client.sendall(f"{deployment_id}\n".encode("utf-8"))
+        except OSError as err:
+            logger.warning(
+                "Unable to notify deployment monitor about deployment `{}`, it will be deployed after next start: {}",
+                deployment_id,
+                err,
+            )
+
+    def add(self, deployment_id: str) -> None:
+        """
+        Adds a deployment to the queue from within the monitor's process.
+        """
+
+        self.deployments.put(deployment_id)
+
+    def get(self) -> str:
+        """
+        Blocks until a deployment is available and returns its id.
+        """
+
+        return self.deployments.get()
+
+    def _accept(self) -> None:
+        while True:
+            connection, _ = self.socket.accept()
+
+            with connection, connection.makefile("r", encoding="utf-8") as lines:
+                for line in lines:
+                    if line.strip():
+                        self.deployments.put(line.strip())
@@ -0,0 +1,412 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import yaml
+from loguru import logger
+
+from mq.config import Config
+from mq.deployment.DeploymentInfo import DeploymentInfo
+from mq.deployment.DeploymentInfo import DeploymentStatus
+
+# The column which records when a deployment entered a status.
+_PHASE_COLUMNS = {
+    DeploymentStatus.extracting: "created_at",
+    DeploymentStatus.scheduled: "scheduled_at",
+    DeploymentStatus.running: "started_at",
+    DeploymentStatus.succeeded: "finished_at",
+    DeploymentStatus.failed: "finished_at",
+}
+
+# Separates the creation time and the id of the deployment in a cursor, see `DeploymentStore.cursor`.
+_CURSOR_SEPARATOR = ","
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deployments (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at TEXT,
+    scheduled_at TEXT,
+    started_at TEXT,
+    finished_at TEXT
+);
+
+CREATE INDEX IF NOT EXISTS deployments_created ON deployments (created_at, id);
+
+CREATE INDEX IF NOT EXISTS deployments_status_created ON deployments (status, created_at, id);
+
+CREATE TABLE IF NOT EXISTS deployment_applications (
+    deployment_id TEXT NOT NULL REFERENCES deployments (id) ON DELETE CASCADE,
+    application TEXT NOT NULL,
+    image_tag TEXT NOT NULL,
+    PRIMARY KEY (deployment_id, application)
+);
+
+CREATE INDEX IF NOT EXISTS deployment_applications_application
+    ON deployment_applications (application, deployment_id);
+
+CREATE TABLE IF NOT EXISTS active_deployments (
+    application TEXT PRIMARY KEY,
+    deployment_id TEXT NOT NULL
+);
+"""
+
+
+class DeploymentStore:
+    """
+    Stores the state of all deployments in an embedded SQLite database, shared by the API server and the deployment
+    monitor.
+
+    The database runs in WAL mode, thus readers (e.g. log streams polling the status) do not block writers. Status
+    changes are single conditional updates, thus a transition is applied at most once, even if several processes try
+    to apply it concurrently.
+    """
+
+    _local = threading.local()
+
+    @staticmethod
+    def location() -> Path:
+        return Config.Server.working_directory / "deployments.db"
+
+    @staticmethod
+    def create(deployment_id: str) -> None:
+        """
+        Registers a new deployment with status `extracting`.
+        """
+
+        DeploymentStore._connection().execute(
+            "INSERT INTO deployments (id, status, created_at) VALUES (?, ?, ?)",
+            (deployment_id, DeploymentStatus.extracting.value, _now()),
+        )
+
+    @staticmethod
+    def get(deployment_id: str) -> Optional[DeploymentInfo]:
+        """
+        Returns the state of a deployment, `None` if the deployment does not exist.
+        """
+
+        infos = DeploymentStore._query("WHERE id = ?", (deployment_id,))
+        return infos[0] if infos else None
+
+    @staticmethod
+    def status(deployment_id: str) -> Optional[DeploymentStatus]:
+        row = (
+            DeploymentStore._connection()
+            .execute("SELECT status FROM deployments WHERE id = ?", (deployment_id,))
+            .fetchone()
+        )
+
+        return DeploymentStatus[row[0]] if row else None
+
+    @staticmethod
+    def ids(status: DeploymentStatus) -> List[str]:
+        """
+        Returns the ids of all deployments with a status, oldest first.
+        """
+
+        rows = DeploymentStore._connection().execute(
+            "SELECT id FROM deployments WHERE status = ? ORDER BY created_at, id",
+            (status.value,),
+        )
+
+        return list([row[0] for row in rows])
+
+    @staticmethod
+    def transition(
+        deployment_id: str,
+        status: DeploymentStatus,
+        expected: Optional[List[DeploymentStatus]] = None,
+    ) -> bool:
+        """
+        Changes the status of a deployment and records the time of the change.
+
+        Parameters
+        ----------
+        deployment_id : str
+            The id of the deployment.
+        status : DeploymentStatus
+            The new status.
+        expected : Optional[List[DeploymentStatus]]
+            If set, the status is only changed if the deployment currently has one of these states.
+
+        Returns
+        -------
+        bool
+            Whether the status has been changed.
+        """
+
+        query = f"UPDATE deployments SET status = ?, {_PHASE_COLUMNS[status]} = ? WHERE id = ?"
+        parameters: List[str] = [status.value, _now(), deployment_id]
+
+        if expected is not None:
+            query += f" AND status IN ({', '.join(['?'] * len(expected))})"
+            parameters += [s.value for s in expected]
+
+        cursor = DeploymentStore._connection().execute(query, parameters)
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def set_applications(deployment_id: str, applications: Dict[str, str]) -> None:
+        """
+        Records the applications of a deployment and their image tags.
+        """
+
+        connection = DeploymentStore._connection()
+
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO deployment_applications (deployment_id, application, image_tag) "
+                "VALUES (?, ?, ?)",
+                [(deployment_id, name, tag) for name, tag in applications.items()],
+            )
+
+    @staticmethod
+    def active_deployments() -> Dict[str, str]:
+        """
+        Returns the deployment which receives the traffic of each application, by application. An application's active
+        deployment is set when the load balancer is switched to it, not when its instances are started.
+        """
+
+        rows = DeploymentStore._connection().execute(
+            "SELECT application, deployment_id FROM active_deployments"
+        )
+
+        return {application: deployment_id for application, deployment_id in rows}
+
+    @staticmethod
+    def set_active_deployments(deployments: Dict[str, Optional[str]]) -> None:
+        """
+        Sets the active deployment of applications. Applications whose deployment is `None` have no active deployment
+        afterwards.
+        """
+
+        connection = DeploymentStore._connection()
+
+        with connection:
+            for application, deployment_id in deployments.items():
+                if deployment_id is None:
+                    connection.execute(
+                        "DELETE FROM active_deployments WHERE application = ?",
+                        (application,),
+                    )
+                else:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO active_deployments (application, deployment_id) VALUES (?, ?)",
+                        (application, deployment_id),
+                    )
+
+    @staticmethod
+    def delete(deployment_id: str) -> None:
+        """
+        Removes a deployment and its applications from the store.
+        """
+
+        DeploymentStore._connection().execute(
+            "DELETE FROM deployments WHERE id = ?", (deployment_id,)
+        )
+
+    @staticmethod
+    def set_docker_calls(deployment_id: str, calls: Dict[str, int]) -> None:
+        """
+        Records the number of Docker API calls of a deployment, by call name.
+        """
+
+        DeploymentStore._connection().execute(
+            "UPDATE deployments SET docker_calls = ? WHERE id = ?",
+            (json.dumps(calls, sort_keys=True), deployment_id),
+        )
+
+    @staticmethod
+    def list(
+        limit: int = 50,
+        before: Optional[str] = None,
+        application: Optional[str] = None,
+        status: Optional[DeploymentStatus] = None,
+    ) -> List[DeploymentInfo]:
+        """
+        Returns deployments, newest first. Deployments are ordered by their creation time, as ids of older versions
+        (`%Y%d%m...`) do not sort by time.
+
+        Pages are selected by the last deployment of the previous page (`before`, see `cursor`), not by an offset.
+        Thus, each page is read from the index, independent of the length of the history.
+
+        Parameters
+        ----------
+        limit : int
+            The maximum number of deployments to return.
+        before : Optional[str]
+            Only return deployments which are older than the deployment of this cursor.
+        application : Optional[str]
+            Only return deployments of this application.
+        status : Optional[DeploymentStatus]
+            Only return deployments with this status.
+        """
+
+        conditions: List[str] = []
+        parameters: List[object] = []
+
+        if before is not None:
+            created_at, separator, deployment_id = before.partition(_CURSOR_SEPARATOR)
+
+            if not separator:
+                raise ValueError(f"Invalid cursor `{before}`.")
+
+            conditions.append("(created_at, id) < (?, ?)")
+            parameters.extend([created_at, deployment_id])
+
+        if application is not None:
+            conditions.append(
+                "id IN (SELECT deployment_id FROM deployment_applications WHERE application = ?)"
+            )
+            parameters.append(application)
+
+        if status is not None:
+            conditions.append("status = ?")
+            parameters.append(status.value)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        return DeploymentStore._query(
+            f"{where} ORDER BY created_at DESC, id DESC LIMIT ?", (*parameters, limit)
+        )
+
+    @staticmethod
+    def cursor(deployment: DeploymentInfo) -> str:
+        """
+        Returns the cursor of a deployment, to read the page of deployments which are older (see `list`).
+        """
+
+        return f"{deployment.created_at or ''}{_CURSOR_SEPARATOR}{deployment.id}"
+
+    @staticmethod
+    def _query(clause: str, parameters: tuple) -> List[DeploymentInfo]:
+        connection = DeploymentStore._connection()
+        rows = connection.execute(
+            "SELECT id, status, created_at, scheduled_at, started_at, finished_at, docker_calls FROM deployments "
+            + clause,
+            parameters,
+        ).fetchall()
+
+        if not rows:
+            return []
+
+        applications: Dict[str, Dict[str, str]] = {row[0]: {} for row in rows}
+
+        for deployment_id, name, tag in connection.execute(
+            "SELECT deployment_id, application, image_tag FROM deployment_applications "
+            f"WHERE deployment_id IN ({', '.join(['?'] * len(rows))})",
+            [row[0] for row in rows],
+        ):
+            applications[deployment_id][name] = tag
+
+        return list(
+            [
+                DeploymentInfo(
+                    status=DeploymentStatus[row[1]],
+                    id=row[0],
+                    created_at=row[2],
+                    scheduled_at=row[3],
+                    started_at=row[4],
+                    finished_at=row[5],
+                    applications=applications[row[0]],
+                    docker_calls=json.loads(row[6]) if row[6] else {},
+                )
+                for row in rows
+            ]
+        )
+
+    @staticmethod
+    def _connection() -> sqlite3.Connection:
+        """
+        Returns the connection of the current thread. Connections are not shared between threads or processes.
+        """
+
+        local = DeploymentStore._local
+
+        if getattr(local, "pid", None) != os.getpid():
+            location = DeploymentStore.location()
+            location.parent.mkdir(parents=True, exist_ok=True)
+
+            connection = sqlite3.connect(
+                location, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.execute("PRAGMA foreign_keys = ON")
+
+            with connection:
+                connection.executescript(_SCHEMA)
+
+            # Migrate once. The write lock is taken first, thus only one process migrates.
+            connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                version = connection.execute("PRAGMA user_version").fetchone()[0]
+
+                if version < 1:
+                    DeploymentStore._import_info_files(connection)
+
+                if version < 2:
+                    connection.execute(
+                        "ALTER TABLE deployments ADD COLUMN docker_calls TEXT"
+                    )
+
+                if version < 3:
+                    # Deployments are ordered by their creation time, see `list`.
+                    connection.execute("DROP INDEX IF EXISTS deployments_status")
+                    connection.execute(
+                        "UPDATE deployments SET created_at = '' WHERE created_at IS NULL"
+                    )
+
+                connection.execute("PRAGMA user_version = 3")
+            finally:
+                connection.execute("COMMIT")
+
+            local.connection = connection
+            local.pid = os.getpid()
+
+        return local.connection
+
+    @staticmethod
+    def _import_info_files(connection: sqlite3.Connection) -> None:
+        """
+        Imports deployments which were created before the store existed (`deployment.info.yml` files).
+        """
+
+        deployments_dir = Config.Server.working_directory / "deployments"
+
+        if not deployments_dir.is_dir():
+            return
+
+        for info_file in deployments_dir.glob("*/deployment.info.yml"):
+            deployment_id = info_file.parent.name
+
+            try:
+                status = yaml.safe_load(info_file.read_text())["status"]
+
+                # Ids of older versions do not sort by time, the info file was last written when the deployment
+                # finished.
+                created_at = datetime.fromtimestamp(
+                    info_file.stat().st_mtime, timezone.utc
+                ).isoformat(timespec="milliseconds")
+
+                connection.execute(
+                    "INSERT OR IGNORE INTO deployments (id, status, created_at) VALUES (?, ?, ?)",
+                    (deployment_id, DeploymentStatus[status].value, created_at),
+                )
+                info_file.unlink()
+            except Exception as err:
+                logger.warning(
+                    "Unable to import state of deployment `{}`: {}", deployment_id, err
+                )
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
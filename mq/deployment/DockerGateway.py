@@ -0,0 +1,287 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import TypeVar
+
+import docker
+import requests
+from docker.models.containers import Container
+from docker.models.images import Image
+from docker.types.daemon import CancellableStream
+from loguru import logger
+
+from mq.config import Config
+from mq.deployment.Metrics import Metrics
+
+T = TypeVar("T")
+
+# The call counters of the deployment which runs in the current context, see `DockerGateway.track`.
+_calls: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar(
+    "docker_calls", default=None
+)
+
+
+class DockerGateway:
+    """
+    Process-wide gateway to the Docker engine, all Docker API calls of Maquette Apps go through it.
+
+    The gateway shares one client, thus one pool of connections to the daemon, between all threads of a process. Calls
+    time out after `Config.Server.Docker.timeout_in_seconds`. Idempotent calls are retried with exponential backoff if
+    the daemon is unreachable or answers with a server error. Concurrent inspections of single containers are batched
+    into one list request. Calls are counted per deployment, see `track`.
+    """
+
+    _lock = threading.Lock()
+    _pid: Optional[int] = None
+    _client: Optional[docker.DockerClient] = None
+
+    # Container ids waiting for the next batched inspection and the futures of their callers.
+    _pending: Dict[str, List["Future[Optional[dict]]"]] = {}
+
+    @staticmethod
+    def client() -> docker.DockerClient:
+        """
+        Returns the client of this process. Clients are not shared with forked processes.
+        """
+
+        if DockerGateway._pid != os.getpid():
+            with DockerGateway._lock:
+                if DockerGateway._pid != os.getpid():
+                    DockerGateway._client = docker.from_env(
+                        timeout=Config.Server.Docker.timeout_in_seconds,
+                        max_pool_size=Config.Server.Docker.pool_size,
+                    )
+                    DockerGateway._pending = {}
+                    DockerGateway._pid = os.getpid()
+
+        assert DockerGateway._client is not None
+        return DockerGateway._client
+
+    @staticmethod
+    def call(
+        name: str, fn: Callable[[docker.DockerClient], T], retry: bool = True
+    ) -> T:
+        """
+        Runs a Docker API call, records its duration and counts it for the current deployment.
+
+        Parameters
+        ----------
+        name : str
+            The name of the call, used as metric label.
+        fn : Callable[[docker.DockerClient], T]
+            Runs the call with the shared client.
+        retry : bool
+            Whether the call is retried after transient errors. Must be `False` for calls which are not idempotent,
+            e.g. creating a container.
+        """
+
+        attempts = Config.Server.Docker.retries + 1 if retry else 1
+        backoff = Config.Server.Docker.backoff_in_seconds
+
+        for attempt in range(1, attempts + 1):
+            DockerGateway._count(name)
+
+            try:
+                with Metrics.timer("mq_docker_call_seconds", call=name):
+                    return fn(DockerGateway.client())
+            except Exception as err:
+                if attempt == attempts or not DockerGateway._transient(err):
+                    raise
+
+                delay = backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.warning(
+                    "Docker call `{}` failed ({}), retrying in {:.2f} seconds.",
+                    name,
+                    err,
+                    delay,
+                )
+                Metrics.inc("mq_docker_retries_total", call=name)
+                time.sleep(delay)
+
+        raise AssertionError("Unreachable.")
+
+    @staticmethod
+    @contextmanager
+    def track() -> Iterator[Dict[str, int]]:
+        """
+        Counts the Docker API calls made within the block, by call name.
+
+        Threads started within the block must run in a copy of the current context (`contextvars.copy_context`) to be
+        counted as well.
+        """
+
+        calls: Dict[str, int] = {}
+        token = _calls.set(calls)
+
+        try:
+            yield calls
+        finally:
+            _calls.reset(token)
+
+    @staticmethod
+    def containers(filters: Dict[str, Any]) -> List[dict]:
+        """
+        Lists all containers, including stopped ones, matching the filters.
+        """
+
+        return DockerGateway.call(
+            "containers", lambda c: c.api.containers(all=True, filters=filters)
+        )
+
+    @staticmethod
+    def inspect(container_id: str) -> Optional[dict]:
+        """
+        Returns the summary of a container as returned by `containers`, `None` if it does not exist.
+
+        Inspections which are requested within `Config.Server.Docker.batch_window_in_seconds` are answered by a single
+        request to the daemon.
+        """
+
+        future: "Future[Optional[dict]]" = Future()
+        DockerGateway.client()
+
+        with DockerGateway._lock:
+            leader = not DockerGateway._pending
+            DockerGateway._pending.setdefault(container_id, []).append(future)
+
+        if leader:
+            time.sleep(Config.Server.Docker.batch_window_in_seconds)
+
+            with DockerGateway._lock:
+                pending = DockerGateway._pending
+                DockerGateway._pending = {}
+
+            try:
+                containers = DockerGateway.containers({"id": list(pending)})
+
+                for requested, futures in pending.items():
+                    found = next(
+                        (c for c in containers if c["Id"].startswith(requested)), None
+                    )
+
+                    for f in futures:
+                        f.set_result(found)
+            except Exception as err:
+                for futures in pending.values():
+                    for f in futures:
+                        f.set_exception(err)
+
+        return future.result()
+
+    @staticmethod
+    def run(image: str, **kwargs: Any) -> Container:
+        """
+        Creates and starts a container. The call is not retried, a retry would create a second container.
+        """
+
+        return DockerGateway.call(
+            "run", lambda c: c.containers.run(image, **kwargs), retry=False
+        )
+
+    @staticmethod
+    def start(container_id: str) -> None:
+        DockerGateway.call("start", lambda c: c.api.start(container_id))
+
+    @staticmethod
+    def stop(container_id: str, timeout: int) -> None:
+        DockerGateway.call("stop", lambda c: c.api.stop(container_id, timeout=timeout))
+
+    @staticmethod
+    def remove(container_id: str) -> None:
+        """
+        Removes a container and its anonymous volumes.
+        """
+
+        DockerGateway.call(
+            "remove_container", lambda c: c.api.remove_container(container_id, v=True)
+        )
+
+    @staticmethod
+    def images(label: str) -> List[Image]:
+        """
+        Lists images with a label (`key=value`).
+        """
+
+        return DockerGateway.call(
+            "images", lambda c: c.images.list(filters={"label": label})
+        )
+
+    @staticmethod
+    def remove_image(name: str) -> bool:
+        """
+        Removes an image tag, the image itself is deleted with its last tag. Images used by containers are not removed.
+
+        Returns
+        -------
+        False if the image does not exist or is used by a container.
+        """
+
+        try:
+            DockerGateway.call("remove_image", lambda c: c.api.remove_image(name))
+        except docker.errors.ImageNotFound:
+            return False
+        except docker.errors.APIError as err:
+            if err.status_code == 409:
+                return False
+
+            raise
+
+        return True
+
+    @staticmethod
+    def tag(image: Image, repository: str, tag: str) -> None:
+        DockerGateway.call("tag", lambda c: image.tag(repository, tag))
+
+    @staticmethod
+    def build(**kwargs: Any) -> Iterator[dict]:
+        """
+        Builds an image and yields the decoded output of the builder. The duration of the whole build is recorded.
+        """
+
+        DockerGateway._count("build")
+
+        with Metrics.timer("mq_docker_call_seconds", call="build"):
+            yield from DockerGateway.client().api.build(decode=True, **kwargs)
+
+    @staticmethod
+    def events(**kwargs: Any) -> CancellableStream:
+        """
+        Opens a stream of decoded Docker events. The stream is not subject to the call timeout.
+        """
+
+        def subscribe(c: docker.DockerClient) -> CancellableStream:
+            return c.events(decode=True, **kwargs)
+
+        return DockerGateway.call("events", subscribe)
+
+    @staticmethod
+    def _count(name: str) -> None:
+        calls = _calls.get()
+
+        if calls is not None:
+            with DockerGateway._lock:
+                calls[name] = calls.get(name, 0) + 1
+
+    @staticmethod
+    def _transient(err: Exception) -> bool:
+        """
+        Whether an error might disappear if the call is repeated: The daemon was not reachable, did not answer in time
+        or failed with a server error.
+        """
+
+        if isinstance(err, docker.errors.APIError):
+            return err.is_server_error()
+
+        return isinstance(
+            err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+        )
@@ -0,0 +1,332 @@
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+
+from loguru import logger
+
+from mq.config import Config
+from mq.deployment.BlobStore import BlobStore
+from mq.deployment.DeploymentInfo import DeploymentInfo
+from mq.deployment.DeploymentInfo import DeploymentStatus
+from mq.deployment.DeploymentStore import DeploymentStore
+from mq.deployment.DockerGateway import DockerGateway
+from mq.deployment.Metrics import Metrics
+
+# Working directories without a deployment in the store are only removed after this time, as the directory of an upload
+# is created before the deployment is registered.
+_ORPHAN_GRACE_IN_SECONDS = 24 * 3600
+
+# Deletions between two checks of the deletion rate.
+_DELETION_BATCH = 100
+
+
+class GarbageCollector:
+    """
+    Removes the working directories and images of old deployments.
+
+    A finished deployment is removed if it is not one of the newest `Config.Server.GC.keep_deployments` deployments of
+    any of its applications, or if it is older than `Config.Server.GC.max_age_in_days`. Deployments which have
+    containers (running or not) and deployments which have not finished are never removed. Images are removed by their
+    deployment's tag only, thus an image which is still tagged for another deployment (see `BuildCache`) is kept.
+
+    Blobs of the `BlobStore` are removed if no push used them for `Config.Server.GC.blob_max_age_in_days`.
+
+    Files are deleted at a limited rate (`Config.Server.GC.deletions_per_second`) and the collector waits while
+    deployments are extracted or run, thus it does not compete with active deployments for I/O.
+    """
+
+    @staticmethod
+    def start() -> None:
+        """
+        Runs the collector periodically in a background thread.
+        """
+
+        threading.Thread(target=GarbageCollector._run, daemon=True).start()
+
+    @staticmethod
+    def collect() -> List[str]:
+        """
+        Removes all deployments which are not retained.
+
+        Returns
+        -------
+        The ids of the removed deployments.
+        """
+
+        removed: List[str] = []
+
+        for deployment in GarbageCollector.candidates():
+            GarbageCollector._wait_for_idle()
+
+            try:
+                GarbageCollector._remove_deployment(deployment)
+                removed.append(deployment.id)
+            except Exception as err:
+                logger.warning(
+                    "Unable to remove deployment `{}`: {}", deployment.id, err
+                )
+
+        for directory in GarbageCollector._orphans():
+            GarbageCollector._wait_for_idle()
+            logger.info("Removing orphaned deployment directory `{}`.", directory.name)
+            GarbageCollector._remove_tree(directory)
+
+        GarbageCollector._wait_for_idle()
+        blobs = GarbageCollector._remove_blobs()
+
+        if blobs:
+            logger.info("Removed {} unused blob(s).", blobs)
+
+        return removed
+
+    @staticmethod
+    def candidates() -> List[DeploymentInfo]:
+        """
+        Returns the deployments which are not retained by the retention policy, oldest first.
+        """
+
+        protected: Set[str] = set(
+            [
+                c["Labels"]["MQ__DEPLOYMENT_ID"]
+                for c in DockerGateway.containers({"label": "MQ__DEPLOYMENT_ID"})
+            ]
+        )
+        max_age = Config.Server.GC.max_age_in_days * 24 * 3600
+        now = time.time()
+
+        deployments: List[DeploymentInfo] = []
+        before: Optional[str] = None
+
+        while True:
+            page = DeploymentStore.list(limit=500, before=before)
+
+            if not page:
+                break
+
+            deployments.extend(page)
+            before = DeploymentStore.cursor(page[-1])
+
+        # Ids of older versions do not sort by time, thus deployments are ranked by their creation time.
+        created = {d.id: _created_at(d) for d in deployments}
+        deployments.sort(key=lambda d: (created[d.id], d.id), reverse=True)
+
+        # Number of newer deployments seen per application, deployments without applications are counted together.
+        seen: Dict[str, int] = {}
+        candidates: List[DeploymentInfo] = []
+
+        for deployment in deployments:
+            applications = list(deployment.applications) or [""]
+            recent = any(
+                [
+                    seen.get(a, 0) < Config.Server.GC.keep_deployments
+                    for a in applications
+                ]
+            )
+
+            for application in applications:
+                seen[application] = seen.get(application, 0) + 1
+
+            expired = max_age > 0 and now - created[deployment.id] > max_age
+
+            if (
+                (not recent or expired)
+                and deployment.status
+                in [DeploymentStatus.succeeded, DeploymentStatus.failed]
+                and deployment.id not in protected
+            ):
+                candidates.append(deployment)
+
+        return list(reversed(candidates))
+
+    @staticmethod
+    def _run() -> None:
+        while True:
+            time.sleep(Config.Server.GC.interval_in_seconds)
+
+            try:
+                removed = GarbageCollector.collect()
+
+                if removed:
+                    logger.info(
+                        "Garbage collector removed {} deployment(s).", len(removed)
+                    )
+            except Exception as err:
+                logger.warning("Garbage collection failed: {}", err)
+
+    @staticmethod
+    def _remove_deployment(deployment: DeploymentInfo) -> None:
+        logger.info("Removing deployment `{}`.", deployment.id)
+
+        for tag in deployment.applications.values():
+            if DockerGateway.remove_image(tag):
+                Metrics.inc("mq_gc_removed_total", kind="image")
+
+        directory = Config.Server.working_directory / "deployments" / deployment.id
+
+        if directory.exists():
+            GarbageCollector._remove_tree(directory)
+
+        DeploymentStore.delete(deployment.id)
+        Metrics.inc("mq_gc_removed_total", kind="deployment")
+
+    @staticmethod
+    def _orphans() -> List[Path]:
+        """
+        Returns the working directories of deployments which are not known by the store.
+        """
+
+        directory = Config.Server.working_directory / "deployments"
+
+        if not directory.is_dir():
+            return []
+
+        now = time.time()
+
+        with os.scandir(directory) as entries:
+            return list(
+                [
+                    Path(entry.path)
+                    for entry in entries
+                    if entry.is_dir(follow_symlinks=False)
+                    and now - entry.stat(follow_symlinks=False).st_mtime
+                    > _ORPHAN_GRACE_IN_SECONDS
+                    and DeploymentStore.status(entry.name) is None
+                ]
+            )
+
+    @staticmethod
+    def _remove_blobs() -> int:
+        """
+        Removes blobs (and temporary files of interrupted uploads) which were not modified for
+        `Config.Server.GC.blob_max_age_in_days`. `BlobStore.missing` updates the modification time of the blobs which
+        a push asks for, thus a blob is not removed between checking and using it.
+
+        Returns
+        -------
+        The number of removed blobs.
+        """
+
+        directory = BlobStore.directory()
+
+        if not directory.is_dir():
+            return 0
+
+        cutoff = time.time() - Config.Server.GC.blob_max_age_in_days * 24 * 3600
+        throttle = _Throttle()
+        removed = 0
+
+        with os.scandir(directory) as shards:
+            for shard in list(shards):
+                if not shard.is_dir(follow_symlinks=False):
+                    continue
+
+                with os.scandir(shard.path) as blobs:
+                    for blob in list(blobs):
+                        # Another collector (e.g. `mq server gc` next to the monitor) might have removed the blob.
+                        try:
+                            if blob.stat(follow_symlinks=False).st_mtime > cutoff:
+                                continue
+
+                            os.unlink(blob.path)
+                        except FileNotFoundError:
+                            continue
+
+                        throttle.tick()
+                        removed += 1
+
+        Metrics.inc("mq_gc_removed_total", removed, kind="blob")
+        return removed
+
+    @staticmethod
+    def _remove_tree(directory: Path) -> None:
+        """
+        Removes a directory tree bottom-up, deleting at most `Config.Server.GC.deletions_per_second` entries per second.
+        """
+
+        throttle = _Throttle()
+
+        # Entries which are already gone were removed by another collector (e.g. `mq server gc` next to the monitor).
+        for root, directories, files in os.walk(directory, topdown=False):
+            for name in files:
+                Path(root, name).unlink(missing_ok=True)
+                throttle.tick()
+
+            for name in directories:
+                path = Path(root, name)
+
+                if path.is_symlink():
+                    path.unlink(missing_ok=True)
+                else:
+                    _remove_directory(path)
+
+                throttle.tick()
+
+        _remove_directory(directory)
+
+    @staticmethod
+    def _wait_for_idle() -> None:
+        """
+        Waits until no deployment is extracted or run. The state is taken from the store, thus this works also if the
+        collector runs in another process than the deployments (`mq server gc`).
+        """
+
+        while any(
+            [
+                DeploymentStore.ids(status)
+                for status in [DeploymentStatus.extracting, DeploymentStatus.running]
+            ]
+        ):
+            time.sleep(1)
+
+
+class _Throttle:
+    """
+    Limits deletions to `Config.Server.GC.deletions_per_second`.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.deleted = 0
+
+    def tick(self) -> None:
+        self.deleted += 1
+
+        if self.deleted % _DELETION_BATCH == 0:
+            ahead = self.deleted / Config.Server.GC.deletions_per_second - (
+                time.monotonic() - self.started
+            )
+
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def _remove_directory(directory: Path) -> None:
+    try:
+        directory.rmdir()
+    except FileNotFoundError:
+        pass
+
+
+def _created_at(deployment: DeploymentInfo) -> float:
+    """
+    Returns the creation time of a deployment as timestamp. For deployments without creation time, the modification time
+    of their working directory is used.
+    """
+
+    if deployment.created_at is not None:
+        try:
+            return datetime.fromisoformat(deployment.created_at).timestamp()
+        except ValueError:
+            pass
+
+    try:
+        directory = Config.Server.working_directory / "deployments" / deployment.id
+        return directory.stat().st_mtime
+    except OSError:
+        return 0
@@ -1,15 +1,21 @@
+import contextvars
+import http.client
 import os
-import signal
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from time import sleep
+from typing import Callable
 from typing import Dict
 from typing import List
-from typing import Set
+from typing import Optional
+from typing import Tuple
 
-import docker
 import loguru
 import yaml
-from docker.models.containers import Container
 from loguru import logger
 from nginx.config.api import Comment
 from nginx.config.api import Config as NGINXConfig
@@ -19,47 +25,21 @@ from nginx.config.api.blocks import EmptyBlock
 from nginx.config.helpers import duplicate_options
 
 from mq.config import Config
+from mq.deployment.ApplicationInstance import ApplicationInstance
+from mq.deployment.DeploymentInfo import DeploymentStatus
+from mq.deployment.DeploymentStore import DeploymentStore
+from mq.deployment.DockerGateway import DockerGateway
+from mq.deployment.InstanceRegistry import InstanceRegistry
 from mq.deployment.Manifest import Application
+from mq.deployment.Manifest import ReadinessProbe
+from mq.deployment.Metrics import Metrics
+from mq.deployment.NGINXReloader import NGINXReloader
 
+# Interval in which the state of a container is checked while its readiness probe fails, see `wait_until_started`.
+_STATE_CHECK_INTERVAL_IN_SECONDS = 1.0
 
-class ApplicationInstance:
-    def __init__(
-        self,
-        application: Application,
-        deployment_id: str,
-        container_id: str,
-        container_name: str,
-        webapp_port: int,
-        status: str,
-    ) -> None:
-
-        self.application = application
-        self.deployment_id = deployment_id
-        self.container_id = container_id
-        self.container_name = container_name
-        self.webapp_port = webapp_port
-        self.status = status
-
-    @staticmethod
-    def from_dict(data: dict) -> "ApplicationInstance":
-        return ApplicationInstance(
-            application=Application.from_dict(data["application"]),
-            deployment_id=data["deployment_id"],
-            container_id=data["container_id"],
-            container_name=data["container_name"],
-            webapp_port=data["webapp_port"],
-            status=data["status"],
-        )
-
-    def to_dict(self) -> dict:
-        return {
-            "application": self.application.to_dict(),
-            "deployment_id": self.deployment_id,
-            "container_id": self.container_id,
-            "container_name": self.container_name,
-            "webapp_port": self.webapp_port,
-            "status": self.status,
-        }
+_load_balancer_lock = threading.Lock()
+_last_routes: Optional[List[Tuple[str, str, str, int, str]]] = None
 
 
 class Infrastructure:
@@ -69,116 +49,276 @@ class Infrastructure:
         Restarts stopped containers.
         """
 
-        containers: List[Container] = list(
-            [c for c in Infrastructure._containers() if c.status in ["exited"]]
-        )
+        for instance in InstanceRegistry.instances(status=["exited"]):
+            logger.info("Starting stopped container `{}`.", instance.container_name)
+            DockerGateway.start(instance.container_id)
 
-        for container in containers:
-            logger.info("Starting stopped container `{}`.", container.name)
-            container.start()
-            Infrastructure.wait_until_started(container.id, logger)
+            if not Infrastructure.wait_until_started(instance.container_id, logger):
+                logger.warning(
+                    "Container `{}` did not become ready.", instance.container_name
+                )
 
     @staticmethod
-    def discard_old_instances() -> None:
+    def discard_old_instances(
+        application_names: Optional[List[str]] = None,
+        log: "loguru.Logger" = logger,
+        drain: bool = True,
+    ) -> None:
         """
         Check for old instances of apps and remove them.
+
+        Old instances are drained for `Config.Server.drain_period_in_seconds` first, thus requests which were routed
+        to them before the load balancer switched to the new instances can complete. Afterwards the instances are
+        stopped with SIGTERM (and killed after `Config.Server.stop_timeout_in_seconds`) and removed.
+
+        Parameters
+        ----------
+        application_names : Optional[List[str]]
+            If set, only old instances of these apps are removed. Deployments of other apps might run concurrently.
+        log : loguru.Logger
+            The logger to report the steps to, e.g. the deployment's log.
+        drain : bool
+            Whether to wait for the drain period before instances are stopped.
         """
 
-        docker_client = docker.from_env()
+        if application_names is None:
+            application_names = InstanceRegistry.applications()
 
-        all_instances = Infrastructure.list_instances()
-        all_instances.sort(key=lambda app: app.deployment_id, reverse=True)
-        apps: Dict[str, ApplicationInstance] = {}
+        active = DeploymentStore.active_deployments()
+        old_instances: List[ApplicationInstance] = []
 
-        for app in all_instances:
-            print(app.application.name, app.deployment_id, app.status)
+        for name in application_names:
+            instances = InstanceRegistry.instances_of(name, status=["running"])
+            deployment_id = Infrastructure._active_deployment(
+                instances, active.get(name)
+            )
 
-        for instance in all_instances:
-            if instance.application.name in apps:
-                container = docker_client.containers.get(instance.container_id)
+            if deployment_id is None:
+                continue
 
-                logger.info(
-                    "Removing old container instance `{}` for app `{}`.",
-                    container.id,
-                    instance.application.name,
+            old_instances.extend(
+                [i for i in instances if i.deployment_id != deployment_id]
+            )
+
+        if not old_instances:
+            return
+
+        if drain and Config.Server.drain_period_in_seconds > 0:
+            log.info(
+                "Draining {} old instance(s) for {} seconds.",
+                len(old_instances),
+                Config.Server.drain_period_in_seconds,
+            )
+            time.sleep(Config.Server.drain_period_in_seconds)
+
+        # More workers than pooled connections would only wait for a connection.
+        workers = min(len(old_instances), Config.Server.Docker.pool_size)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for instance in old_instances:
+                executor.submit(
+                    contextvars.copy_context().run,
+                    Infrastructure._stop_instance,
+                    instance,
+                    log,
+                )
+
+    @staticmethod
+    def remove_deployment_instances(deployment_id: str, log: "loguru.Logger") -> None:
+        """
+        Stops and removes all containers of a deployment, e.g. after one of its instances failed to start. The
+        containers are looked up in Docker, not in the registry, thus also containers which were created but never
+        registered are removed.
+        """
+
+        containers = DockerGateway.containers(
+            {"label": f"MQ__DEPLOYMENT_ID={deployment_id}"}
+        )
+
+        for container in containers:
+            log.info("Removing container `{}`.", container["Names"][0].lstrip("/"))
+
+            try:
+                DockerGateway.stop(
+                    container["Id"], Config.Server.stop_timeout_in_seconds
                 )
+                DockerGateway.remove(container["Id"])
+            except Exception as err:
+                log.warning("Unable to remove container `{}`: {}", container["Id"], err)
 
-                if isinstance(container, Container):
-                    container.remove(force=True, v=True)
-            else:
-                apps[instance.application.name] = instance
+            InstanceRegistry.update(container["Id"])
+
+    @staticmethod
+    def _stop_instance(instance: ApplicationInstance, log: "loguru.Logger") -> None:
+        log.info(
+            "Stopping old container instance `{}` for app `{}`.",
+            instance.container_name,
+            instance.application.name,
+        )
+
+        try:
+            DockerGateway.stop(
+                instance.container_id, Config.Server.stop_timeout_in_seconds
+            )
+            DockerGateway.remove(instance.container_id)
+        except Exception as err:
+            log.warning(
+                "Unable to stop old container instance `{}`: {}",
+                instance.container_name,
+                err,
+            )
+            return
+
+        InstanceRegistry.remove(instance.container_id)
 
     @staticmethod
     def list_apps() -> List[ApplicationInstance]:
         """
-        List all apps.
+        List all apps, i.e. the running instances of the active deployment of each app (see
+        `DeploymentStore.active_deployments`). Instances of deployments which are still starting are not listed, thus the
+        load balancer does not route to them before they are ready. Apps with multiple replicas return one instance per
+        replica.
         """
 
-        all_instances = Infrastructure.list_instances()
-        all_instances.sort(key=lambda app: app.deployment_id, reverse=True)
-        apps: Set[ApplicationInstance] = set([])
+        active = DeploymentStore.active_deployments()
+        apps: List[ApplicationInstance] = []
 
-        for app in all_instances:
-            if app not in apps:
-                apps.add(app)
+        for name in InstanceRegistry.applications():
+            instances = InstanceRegistry.instances_of(name, status=["running"])
+            deployment_id = Infrastructure._active_deployment(
+                instances, active.get(name)
+            )
 
-        apps_distinct = list(apps)
-        apps_distinct.sort(key=lambda app: app.application.name)
+            apps.extend(
+                sorted(
+                    [i for i in instances if i.deployment_id == deployment_id],
+                    key=lambda i: i.container_name,
+                )
+            )
 
-        return apps_distinct
+        return apps
 
     @staticmethod
-    def list_instances() -> List[ApplicationInstance]:
+    def _active_deployment(
+        instances: List[ApplicationInstance], active: Optional[str]
+    ) -> Optional[str]:
         """
-        List all applications running on local Docker engine.
+        Returns the id of an application's active deployment. Applications which were deployed before active deployments
+        were recorded have none, then the latest succeeded deployment of the instances is used.
         """
 
-        containers: List[Container] = [
-            container
-            for container in Infrastructure._containers()
-            if container.status in ["running"]
-        ]
-        instances: List[ApplicationInstance] = []
+        if active is not None:
+            return active
 
-        for container in containers:
-            try:
-                application_yml = container.labels["MQ__APPLICATION"].strip()
-                deployment_id = container.labels["MQ__DEPLOYMENT_ID"].strip()
-                webapp_port = container.labels["MQ__PORT"].strip()
-
-                assert len(application_yml) > 0, "`MQ__APPLICATION` must be set."
-                assert len(deployment_id) > 0, "`MQ__DEPLOYMENT_ID` must be set."
-                assert len(webapp_port) > 0, "`MQ__PORT` must be set."
-
-                instances.append(
-                    ApplicationInstance(
-                        application=Application.from_dict(
-                            yaml.safe_load(application_yml)
-                        ),
-                        deployment_id=deployment_id,
-                        container_id=container.id,
-                        container_name=container.name,
-                        webapp_port=int(webapp_port),
-                        status=container.status,
-                    )
-                )
-            except Exception as e:
-                logger.warning(
-                    "Unable to fetch environment information from container `{}`: {}.",
-                    container.name,
-                    e,
-                )
+        succeeded = set(
+            [
+                deployment_id
+                for deployment_id in set([i.deployment_id for i in instances])
+                if DeploymentStore.status(deployment_id) == DeploymentStatus.succeeded
+            ]
+        )
+
+        return Infrastructure._latest_deployment(
+            [i for i in instances if i.deployment_id in succeeded]
+        )
+
+    @staticmethod
+    def _latest_deployment(instances: List[ApplicationInstance]) -> Optional[str]:
+        """
+        Returns the id of the deployment whose containers were created last. Ids are not compared, as ids of older
+        versions (`%Y%d%m...`) do not sort by time.
+        """
+
+        latest = max(
+            instances, key=lambda i: (i.created, i.deployment_id), default=None
+        )
 
-        return instances
+        return latest.deployment_id if latest is not None else None
+
+    @staticmethod
+    def list_instances() -> List[ApplicationInstance]:
+        """
+        List all applications running on local Docker engine.
+        """
+
+        return InstanceRegistry.instances(status=["running"])
 
     @staticmethod
     def update_load_balancer(reload_nginx: bool = True) -> None:
         """
         Update NGINX load balancer with currently configured apps.
+
+        Concurrent deployments update the load balancer one after another, thus the config always reflects the
+        instances which were running at the time it was written. The config is only written and NGINX is only reloaded
+        if the routing table changed. Reloads of concurrent updates are coalesced (see `NGINXReloader`), this method
+        returns after NGINX has been signaled.
+        """
+
+        with _load_balancer_lock:
+            changed = Infrastructure._update_load_balancer()
+
+        Metrics.inc("mq_nginx_config_updates_total", changed=str(changed).lower())
+
+        if changed and reload_nginx:
+            NGINXReloader.request().wait()
+        elif reload_nginx:
+            # The config might have been written by a concurrent update whose reload is still pending.
+            NGINXReloader.wait_pending()
+
+    @staticmethod
+    def _update_load_balancer() -> bool:
+        """
+        Writes the NGINX configuration if the routing table changed.
+
+        Returns
+        -------
+        True if a new configuration has been written.
         """
 
+        global _last_routes
+
         apps = Infrastructure.list_apps()
+        routes = list(
+            [
+                (
+                    app.application.name,
+                    app.deployment_id,
+                    app.container_name,
+                    app.webapp_port,
+                    app.application.load_balancing,
+                )
+                for app in apps
+            ]
+        )
+
+        if routes == _last_routes:
+            logger.debug("Routing table unchanged, skipping NGINX update.")
+            return False
+
+        config = str(Infrastructure._render_load_balancer_config(apps))
+        config_file = Path(Config.Server.NGINX.config_file)
+
+        if config_file.exists() and config_file.read_text() == config:
+            _last_routes = routes
+            return False
+
+        logger.info("Updating NGINX configuration:\n{}", config)
+
+        # Validate the new configuration before it replaces the current one.
+        temp = config_file.parent / f".{config_file.name}.{uuid.uuid4()}"
+        temp.write_text(config)
 
+        try:
+            Infrastructure._validate_load_balancer_config(temp)
+            os.replace(temp, config_file)
+        finally:
+            temp.unlink(missing_ok=True)
+
+        _last_routes = routes
+        return True
+
+    @staticmethod
+    def _render_load_balancer_config(apps: List[ApplicationInstance]) -> EmptyBlock:
         events = Section("events", worker_connections=1024)
 
         http = Section(
@@ -189,18 +329,43 @@ class Infrastructure:
             keepalive_timeout=65,
         )
 
-        servers: List[EmptyBlock] = []
+        replicas: Dict[str, List[ApplicationInstance]] = {}
         for app in apps:
+            replicas.setdefault(app.application.name, []).append(app)
+
+        servers: List[EmptyBlock] = []
+        for name, instances in replicas.items():
+            application = instances[0].application
+            upstream = f"mq--{name}"
+
+            # Load balancing methods must be activated before `keepalive`.
+            balancing: Dict[str, Optional[str]] = {}
+            if application.load_balancing == "least_conn":
+                balancing["least_conn"] = None
+            elif application.load_balancing == "hash":
+                balancing["hash"] = "$remote_addr consistent"
+
             servers.append(
                 EmptyBlock(
-                    Comment(comment=f"{app.application.name} ({app.deployment_id})"),
+                    Comment(comment=f"{name} ({instances[0].deployment_id})"),
+                    Section(
+                        f"upstream {upstream}",
+                        duplicate_options(
+                            "server",
+                            [f"{i.container_name}:{i.webapp_port}" for i in instances],
+                        ),
+                        **balancing,
+                        keepalive=Config.Server.NGINX.upstream_keepalive,
+                    ),
                     Section(
                         "server",
                         Location(
                             "/",
-                            proxy_pass=f"http://{app.container_name}:{app.webapp_port}",
+                            proxy_pass=f"http://{upstream}",
+                            proxy_http_version="1.1",
+                            proxy_set_header='Connection ""',
                         ),
-                        server_name=f"{app.application.name}.{Config.Server.domain}",
+                        server_name=f"{name}.{Config.Server.domain}",
                     ),
                 )
             )
@@ -213,70 +378,168 @@ class Infrastructure:
                     duplicate_options(
                         "listen", ["80 default_server", "[::]:80 default_server"]
                     ),
-                    Location("/", proxy_pass="http://localhost:8000"),
+                    Location(
+                        "/", proxy_pass=f"http://localhost:{Config.Server.API.port}"
+                    ),
                 ),
             )
         )
 
         http.sections.add(duplicate_options("server", servers))
 
-        config = NGINXConfig(
+        return NGINXConfig(
             events, http, worker_processes=1, pid=Config.Server.NGINX.pid_file
         )
 
-        logger.info("Updating NGINX configuration:\n{}", config)
-        Path(Config.Server.NGINX.config_file).write_text(str(config))
+    @staticmethod
+    def _validate_load_balancer_config(config_file: Path) -> None:
+        """
+        Tests a configuration with `nginx -t`. Validation is skipped if the NGINX binary is not available.
+        """
+
+        if not Config.Server.NGINX.validate:
+            return
 
         try:
-            if reload_nginx:
-                pid = int(Path(Config.Server.NGINX.pid_file).read_text())
-                os.kill(pid, signal.SIGHUP)
-        except Exception:
-            logger.warning("Error occurred updating NGINX configuration.")
+            result = subprocess.run(
+                [Config.Server.NGINX.binary, "-t", "-q", "-c", str(config_file)],
+                capture_output=True,
+                text=True,
+            )
+        except FileNotFoundError:
+            logger.warning(
+                "NGINX binary `{}` not found, skipping validation of configuration.",
+                Config.Server.NGINX.binary,
+            )
+            return
+
+        if result.returncode != 0:
+            raise Exception(f"Invalid NGINX configuration: {result.stderr.strip()}")
 
     @staticmethod
-    def wait_until_started(id: str, log: "loguru.Logger") -> None:
+    def wait_until_started(id: str, log: "loguru.Logger") -> bool:
         """
-        Wait until a container is started.
+        Wait until a container is started and the app is ready to serve requests.
+
+        The container's start is observed with the Docker events stream. Afterwards, the app is checked with the
+        readiness probe of its application (see `ReadinessProbe`) on its `MQ__PORT`. While the probe fails, the
+        container's state is checked about every `_STATE_CHECK_INTERVAL_IN_SECONDS`, thus an app which crashes during
+        its boot fails right away instead of after the timeout.
 
         Parameters
         ----------
         id : str
             The Docker container id to watch.
+
+        Returns
+        -------
+        True if the app became ready within the timeout.
         """
 
-        docker_client = docker.from_env()
-        waited_seconds = 0
-        container = docker_client.containers.get(id)
+        container = DockerGateway.inspect(id)
+
+        if container is None:
+            log.error("Container `{}` does not exist.", id)
+            return False
 
-        assert isinstance(container, Container)
+        name = str(container["Names"][0]).lstrip("/")
+        labels = container.get("Labels") or {}
+        application = Application.from_dict(yaml.safe_load(labels["MQ__APPLICATION"]))
+        probe = application.readiness
+        timeout = (
+            probe.timeout_in_seconds or Config.Server.deployment_timeout_in_seconds
+        )
+        deadline = time.time() + timeout
+
+        # Events are only replayed for about one second, a container which died before would not be noticed.
+        if container["State"] in ["exited", "dead"]:
+            log.error("Container `{}` exited.", name)
+            return False
 
-        while (
-            container.status != "running"
-            and waited_seconds < Config.Server.deployment_timeout_in_seconds
-        ):
+        if container["State"] != "running":
             log.info(
                 "Waiting for container `{}`, current status is `{}` ...",
-                container.name,
-                container.status,
+                name,
+                container["State"],
+            )
+
+            # Replay events since shortly before the status was read, thus a start in between is not missed.
+            events = DockerGateway.events(
+                since=int(time.time()) - 1,
+                until=int(deadline) + 1,
+                filters={"container": id, "event": ["start", "die"]},
             )
-            sleep(5)
-            waited_seconds += 5
-            container.reload()
+
+            try:
+                for event in events:
+                    if event.get("Action") == "start":
+                        break
+
+                    if event.get("Action") == "die":
+                        log.error("Container `{}` exited.", name)
+                        return False
+                else:
+                    return False
+            finally:
+                events.close()
+
+        def alive() -> bool:
+            container = DockerGateway.inspect(id)
+
+            if container is not None and container["State"] not in ["exited", "dead"]:
+                return True
+
+            log.error("Container `{}` exited.", name)
+            return False
+
+        return Infrastructure._probe(
+            name, int(labels["MQ__PORT"]), probe, deadline, alive
+        )
 
     @staticmethod
-    def _containers() -> List[Container]:
+    def _probe(
+        host: str,
+        port: int,
+        probe: ReadinessProbe,
+        deadline: float,
+        alive: Callable[[], bool],
+    ) -> bool:
         """
-        Returns a list of application containers.
+        Runs a readiness probe until it succeeds, the deadline is reached or the app is not alive anymore. Attempts are
+        retried with an exponential backoff, starting at a few milliseconds.
         """
 
-        docker_client = docker.from_env()
+        backoff = 0.01
+        checked = time.time()
 
-        return list(
-            [
-                container
-                for container in docker_client.containers.list(all=True)
-                if isinstance(container, Container)
-                and str(container.name).startswith("mq--")
-            ]
-        )
+        while True:
+            try:
+                if probe.type == "http":
+                    connection = http.client.HTTPConnection(host, port, timeout=1)
+
+                    try:
+                        connection.request("GET", probe.path)
+
+                        if connection.getresponse().status < 400:
+                            return True
+                    finally:
+                        connection.close()
+                elif probe.type == "tcp":
+                    with socket.create_connection((host, port), timeout=1):
+                        return True
+                else:
+                    return True
+            except OSError:
+                pass
+
+            if time.time() + backoff > deadline:
+                return False
+
+            if time.time() - checked >= _STATE_CHECK_INTERVAL_IN_SECONDS:
+                if not alive():
+                    return False
+
+                checked = time.time()
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 0.5)
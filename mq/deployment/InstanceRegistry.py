@@ -0,0 +1,256 @@
+import os
+import threading
+import time
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+
+import yaml
+from loguru import logger
+
+from mq.deployment.ApplicationInstance import ApplicationInstance
+from mq.deployment.DockerGateway import DockerGateway
+from mq.deployment.Manifest import Application
+
+# Maps Docker container events to the resulting container status.
+_EVENT_STATUS = {
+    "create": "created",
+    "start": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+}
+
+
+class InstanceRegistry:
+    """
+    Process-wide cache of all application instances (containers labeled with `MQ__DEPLOYMENT_ID`).
+
+    The registry is loaded with a single label-filtered query on first use. Afterwards it is kept current by a
+    background thread which follows the Docker events stream. Instances are indexed by application name and deployment
+    id, thus queries do not call the Docker API.
+    """
+
+    _lock = threading.RLock()
+    _pid: Optional[int] = None
+
+    _instances: Dict[str, ApplicationInstance] = {}
+    _by_application: Dict[str, Dict[str, Set[str]]] = {}
+
+    @staticmethod
+    def instances(status: Optional[List[str]] = None) -> List[ApplicationInstance]:
+        """
+        Returns all instances, optionally filtered by container status.
+        """
+
+        InstanceRegistry._ensure_loaded()
+
+        with InstanceRegistry._lock:
+            return list(
+                [
+                    instance
+                    for instance in InstanceRegistry._instances.values()
+                    if status is None or instance.status in status
+                ]
+            )
+
+    @staticmethod
+    def applications() -> List[str]:
+        """
+        Returns the names of all applications with at least one instance.
+        """
+
+        InstanceRegistry._ensure_loaded()
+
+        with InstanceRegistry._lock:
+            return sorted(InstanceRegistry._by_application.keys())
+
+    @staticmethod
+    def instances_of(
+        application: str,
+        deployment_id: Optional[str] = None,
+        status: Optional[List[str]] = None,
+    ) -> List[ApplicationInstance]:
+        """
+        Returns the instances of an application, optionally of a single deployment and filtered by container status.
+        """
+
+        InstanceRegistry._ensure_loaded()
+
+        with InstanceRegistry._lock:
+            deployments = InstanceRegistry._by_application.get(application, {})
+            ids: Set[str] = set([])
+
+            for deployment, container_ids in deployments.items():
+                if deployment_id is None or deployment == deployment_id:
+                    ids.update(container_ids)
+
+            return list(
+                [
+                    InstanceRegistry._instances[id]
+                    for id in ids
+                    if status is None
+                    or InstanceRegistry._instances[id].status in status
+                ]
+            )
+
+    @staticmethod
+    def update(container_id: str) -> None:
+        """
+        Refreshes a single instance from the Docker API, e.g. right after a container was started by this process.
+        """
+
+        InstanceRegistry._ensure_loaded()
+
+        container = DockerGateway.inspect(container_id)
+
+        if container is None:
+            InstanceRegistry.remove(container_id)
+            return
+
+        InstanceRegistry._put(
+            container["Id"],
+            str(container["Names"][0]).lstrip("/"),
+            container.get("Labels") or {},
+            container["State"],
+            container.get("Created", 0),
+        )
+
+    @staticmethod
+    def remove(container_id: str) -> None:
+        with InstanceRegistry._lock:
+            instance = InstanceRegistry._instances.pop(container_id, None)
+
+            if instance is None:
+                return
+
+            deployments = InstanceRegistry._by_application[instance.application.name]
+            deployments[instance.deployment_id].discard(container_id)
+
+            if not deployments[instance.deployment_id]:
+                del deployments[instance.deployment_id]
+
+            if not deployments:
+                del InstanceRegistry._by_application[instance.application.name]
+
+    @staticmethod
+    def _ensure_loaded() -> None:
+        """
+        Loads the registry and starts following events. As threads are not inherited by forked processes, the registry
+        is loaded again within each process.
+        """
+
+        with InstanceRegistry._lock:
+            if InstanceRegistry._pid == os.getpid():
+                return
+
+            InstanceRegistry._pid = os.getpid()
+            InstanceRegistry._load()
+
+            threading.Thread(
+                target=InstanceRegistry._follow_events, daemon=True
+            ).start()
+
+    @staticmethod
+    def _load() -> None:
+        containers = DockerGateway.containers({"label": "MQ__DEPLOYMENT_ID"})
+
+        with InstanceRegistry._lock:
+            InstanceRegistry._instances = {}
+            InstanceRegistry._by_application = {}
+
+            for container in containers:
+                InstanceRegistry._put(
+                    container["Id"],
+                    str(container["Names"][0]).lstrip("/"),
+                    container.get("Labels") or {},
+                    container["State"],
+                    container.get("Created", 0),
+                )
+
+    @staticmethod
+    def _follow_events() -> None:
+        """
+        Applies container events to the registry. If the stream breaks, the registry is reloaded to not miss changes.
+        """
+
+        while True:
+            try:
+                events = DockerGateway.events(
+                    filters={"type": "container", "label": "MQ__DEPLOYMENT_ID"}
+                )
+
+                # Reload after subscribing, thus no change gets lost in between.
+                InstanceRegistry._load()
+
+                for event in events:
+                    InstanceRegistry._apply(event)
+            except Exception as err:
+                logger.warning("Docker event stream interrupted: {}", err)
+                time.sleep(1)
+
+    @staticmethod
+    def _apply(event: dict) -> None:
+        action = event.get("Action", "")
+        actor = event.get("Actor", {})
+        container_id = actor.get("ID", event.get("id", ""))
+        attributes = actor.get("Attributes", {})
+
+        if action == "destroy":
+            InstanceRegistry.remove(container_id)
+        elif action in _EVENT_STATUS or action == "rename":
+            with InstanceRegistry._lock:
+                known = InstanceRegistry._instances.get(container_id)
+                status = _EVENT_STATUS.get(action, known.status if known else "")
+
+                InstanceRegistry._put(
+                    container_id,
+                    attributes.get("name", ""),
+                    attributes,
+                    status,
+                    event.get("time", 0),
+                )
+
+    @staticmethod
+    def _put(
+        container_id: str, name: str, labels: dict, status: str, created: float
+    ) -> None:
+        with InstanceRegistry._lock:
+            known = InstanceRegistry._instances.get(container_id)
+
+            if known is not None:
+                known.container_name = name or known.container_name
+                known.status = status
+                return
+
+            try:
+                application_yml = labels["MQ__APPLICATION"].strip()
+                deployment_id = labels["MQ__DEPLOYMENT_ID"].strip()
+                webapp_port = labels["MQ__PORT"].strip()
+
+                assert len(application_yml) > 0, "`MQ__APPLICATION` must be set."
+                assert len(deployment_id) > 0, "`MQ__DEPLOYMENT_ID` must be set."
+                assert len(webapp_port) > 0, "`MQ__PORT` must be set."
+
+                instance = ApplicationInstance(
+                    application=Application.from_dict(yaml.safe_load(application_yml)),
+                    deployment_id=deployment_id,
+                    container_id=container_id,
+                    container_name=name,
+                    webapp_port=int(webapp_port),
+                    status=status,
+                    created=created,
+                )
+            except Exception as e:
+                logger.warning(
+                    "Unable to fetch environment information from container `{}`: {}.",
+                    name,
+                    e,
+                )
+                return
+
+            InstanceRegistry._instances[container_id] = instance
+            InstanceRegistry._by_application.setdefault(
+                instance.application.name, {}
+            ).setdefault(deployment_id, set([])).add(container_id)
@@ -0,0 +1,64 @@
+import fcntl
+import os
+from pathlib import Path
+from typing import IO
+from typing import Optional
+
+
+class LeaderLock:
+    """
+    Elects a single leader among the local processes which use the same lock file.
+
+    The lock is an exclusive `flock` on the file. The operating system releases it when the leader exits, also if it
+    crashes, thus another process can take over.
+
+    Parameters
+    ----------
+    path : Path
+        The lock file. It is created if it does not exist.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.file: Optional[IO[str]] = None
+
+    @property
+    def acquired(self) -> bool:
+        return self.file is not None
+
+    def acquire(self) -> bool:
+        """
+        Tries to become the leader without waiting.
+
+        Returns
+        -------
+        True if this process holds the lock.
+        """
+
+        if self.file is not None:
+            return True
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        file = open(self.path, "a+")
+
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return False
+
+        # The pid of the leader is informational only, e.g. for operators.
+        file.truncate(0)
+        file.write(f"{os.getpid()}\n")
+        file.flush()
+
+        self.file = file
+        return True
+
+    def release(self) -> None:
+        if self.file is None:
+            return
+
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
@@ -1,9 +1,65 @@
 from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Set
+
+
+class ReadinessProbe:
+    """
+    Describes how to check whether an application is ready to serve requests.
+
+    Parameters
+    ----------
+    type : str
+        `http` sends a GET request to `path`, any status below 400 is considered ready. `tcp` checks whether the app
+        port accepts connections. `none` considers the app ready as soon as its container is running.
+    path : str
+        The path requested by `http` probes.
+    timeout_in_seconds : Optional[int]
+        The maximum time to wait for the app to become ready. Defaults to `Config.Server.deployment_timeout_in_seconds`.
+    """
+
+    types = ["http", "tcp", "none"]
+
+    def __init__(
+        self,
+        type: str = "tcp",
+        path: str = "/",
+        timeout_in_seconds: Optional[int] = None,
+    ) -> None:
+        if type not in ReadinessProbe.types:
+            raise Exception(
+                f"Unknown readiness probe `{type}`, expected one of {', '.join(ReadinessProbe.types)}."
+            )
+
+        self.type = type
+        self.path = path
+        self.timeout_in_seconds = timeout_in_seconds
+
+    @staticmethod
+    def from_dict(data: dict) -> "ReadinessProbe":
+        return ReadinessProbe(
+            type=data.get("type", "tcp"),
+            path=data.get("path", "/"),
+            timeout_in_seconds=data.get("timeout_in_seconds", None),
+        )
+
+    def to_dict(self) -> dict:
+        result: dict = {"type": self.type}
+
+        if self.type == "http":
+            result["path"] = self.path
+
+        if self.timeout_in_seconds is not None:
+            result["timeout_in_seconds"] = self.timeout_in_seconds
+
+        return result
 
 
 class Application:
+
+    load_balancing_strategies = ["round-robin", "least_conn", "hash"]
+
     def __init__(
         self,
         name: str,
@@ -11,12 +67,27 @@ class Application:
         env: Dict[str, str] = {},
         command: Optional[str] = None,
         services: List[str] = [],
+        readiness: Optional[ReadinessProbe] = None,
+        instances: int = 1,
+        load_balancing: str = "round-robin",
     ) -> None:
+        if instances < 1:
+            raise Exception(f"Application `{name}` requires at least one instance.")
+
+        if load_balancing not in Application.load_balancing_strategies:
+            raise Exception(
+                f"Unknown load balancing strategy `{load_balancing}`, expected one of "
+                f"{', '.join(Application.load_balancing_strategies)}."
+            )
+
         self.name = name
         self.buildback = buildback
         self.env = env
         self.command = command
         self.services = services
+        self.readiness = readiness or ReadinessProbe()
+        self.instances = instances
+        self.load_balancing = load_balancing
 
     @staticmethod
     def from_dict(data: dict) -> "Application":
@@ -26,6 +97,9 @@ class Application:
             env=data.get("env", {}),
             command=data.get("command", None),
             services=data.get("services", []),
+            readiness=ReadinessProbe.from_dict(data.get("readiness", {})),
+            instances=data.get("instances", 1),
+            load_balancing=data.get("load_balancing", "round-robin"),
         )
 
     def to_dict(self) -> dict:
@@ -40,6 +114,15 @@ class Application:
         if self.services:
             result["services"] = self.services
 
+        if self.readiness.to_dict() != ReadinessProbe().to_dict():
+            result["readiness"] = self.readiness.to_dict()
+
+        if self.instances != 1:
+            result["instances"] = self.instances
+
+        if self.load_balancing != "round-robin":
+            result["load_balancing"] = self.load_balancing
+
         return result
 
 
@@ -64,9 +147,55 @@ class Manifest:
 
         return result
 
+    def start_order(self) -> List[List[Application]]:
+        """
+        Groups the applications by the order in which they need to be started.
+
+        An application depends on another application of the manifest if it lists the application's name in its
+        `services`. The applications of a group only depend on applications of previous groups, thus they can be
+        started at the same time.
+        """
+
+        names = set([app.name for app in self.applications])
+        dependencies = {
+            app.name: set([s for s in app.services if s in names and s != app.name])
+            for app in self.applications
+        }
+
+        started: Set[str] = set([])
+        groups: List[List[Application]] = []
+
+        while len(started) < len(self.applications):
+            group = list(
+                [
+                    app
+                    for app in self.applications
+                    if app.name not in started and dependencies[app.name] <= started
+                ]
+            )
+
+            if not group:
+                cyclic = sorted(names - started)
+                raise Exception(
+                    f"Applications {', '.join(cyclic)} have cyclic dependencies."
+                )
+
+            started.update([app.name for app in group])
+            groups.append(group)
+
+        return groups
+
     def validate(self) -> None:
         """
         Validates the Manifest instance.
         """
 
-        # TODO implement.
+        names = list([app.name for app in self.applications])
+        duplicates = sorted(set([name for name in names if names.count(name) > 1]))
+
+        if duplicates:
+            raise Exception(
+                f"Applications {', '.join(duplicates)} are defined more than once."
+            )
+
+        self.start_order()
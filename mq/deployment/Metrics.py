@@ -0,0 +1,359 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from loguru import logger
+
+from mq.config import Config
+
+# Name -> (type, help) of all metrics.
+METRICS: Dict[str, Tuple[str, str]] = {
+    "mq_deployment_phase_seconds": (
+        "histogram",
+        "Duration of deployment phases (upload, extract, manifest, build, start, readiness, nginx_reload, discard).",
+    ),
+    "mq_docker_call_seconds": ("histogram", "Duration of Docker API calls."),
+    "mq_docker_retries_total": (
+        "counter",
+        "Docker API calls which were retried after a transient error.",
+    ),
+    "mq_deployment_queue_depth": (
+        "gauge",
+        "Deployments waiting for a deployment worker.",
+    ),
+    "mq_deployment_workers_active": (
+        "gauge",
+        "Deployment workers running a deployment.",
+    ),
+    "mq_nginx_reloads_total": ("counter", "Reloads of NGINX."),
+    "mq_gc_removed_total": (
+        "counter",
+        "Deployment directories and image tags removed by the garbage collector.",
+    ),
+    "mq_nginx_config_updates_total": (
+        "counter",
+        "Load balancer updates, by whether the NGINX config changed.",
+    ),
+}
+
+# Snapshot of the counters and histograms of all processes which exited.
+_AGGREGATE = "aggregate.json"
+
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+# Metric name and sorted label pairs.
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Metrics:
+    """
+    In-process metrics in the Prometheus data model, shared between the API server and the deployment monitor.
+
+    Each process updates its own counters in memory. A background thread writes a snapshot of them to
+    `<working_directory>/metrics/<pid>.json` whenever they changed. `Metrics.render` merges the snapshots of all living
+    processes, thus the API server exposes the metrics of the monitor as well.
+
+    Counters and histograms of processes which exited are added to `aggregate.json`, thus merged counters do not go
+    backwards if a process is restarted. Gauges of processes which exited are dropped.
+    """
+
+    _lock = threading.Lock()
+    _pid: Optional[int] = None
+    _changed = threading.Event()
+
+    _values: Dict[_Key, float] = {}
+    _histograms: Dict[_Key, List[float]] = {}
+
+    @staticmethod
+    def inc(name: str, value: float = 1, **labels: str) -> None:
+        """
+        Increases a counter or gauge. Gauges may be decreased with a negative value.
+        """
+
+        key = Metrics._key(name, labels)
+
+        with Metrics._lock:
+            Metrics._values[key] = Metrics._values.get(key, 0) + value
+
+        Metrics._changed.set()
+
+    @staticmethod
+    def set(name: str, value: float, **labels: str) -> None:
+        """
+        Sets a gauge.
+        """
+
+        key = Metrics._key(name, labels)
+
+        with Metrics._lock:
+            Metrics._values[key] = value
+
+        Metrics._changed.set()
+
+    @staticmethod
+    def observe(name: str, value: float, **labels: str) -> None:
+        """
+        Records an observation of a histogram.
+        """
+
+        key = Metrics._key(name, labels)
+
+        with Metrics._lock:
+            # Counts per bucket (not cumulative) including the `+Inf` bucket, followed by the sum and the count of all
+            # observations.
+            histogram = Metrics._histograms.setdefault(key, [0.0] * (len(BUCKETS) + 3))
+            index = next(
+                (i for i, bound in enumerate(BUCKETS) if value <= bound), len(BUCKETS)
+            )
+
+            histogram[index] += 1
+
+            histogram[-2] += value
+            histogram[-1] += 1
+
+        Metrics._changed.set()
+
+    @staticmethod
+    @contextmanager
+    def timer(name: str, **labels: str) -> Iterator[None]:
+        """
+        Observes the duration of a block, also if it raises.
+        """
+
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            Metrics.observe(name, time.perf_counter() - started, **labels)
+
+    @staticmethod
+    def render() -> str:
+        """
+        Returns the metrics of all processes in the Prometheus text format.
+        """
+
+        values, histograms = _merge(Metrics._snapshots())
+        lines: List[str] = []
+
+        for name, (kind, description) in METRICS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            for key in sorted([k for k in values if k[0] == name]):
+                lines.append(f"{name}{Metrics._labels(key[1])} {values[key]:g}")
+
+            for key in sorted([k for k in histograms if k[0] == name]):
+                histogram = histograms[key]
+                cumulative = 0.0
+
+                for bound, count in zip(
+                    [str(b) for b in BUCKETS] + ["+Inf"], histogram
+                ):
+                    cumulative += count
+                    bucket = key[1] + (("le", bound),)
+                    lines.append(
+                        f"{name}_bucket{Metrics._labels(bucket)} {cumulative:g}"
+                    )
+
+                lines.append(f"{name}_sum{Metrics._labels(key[1])} {histogram[-2]:g}")
+                lines.append(f"{name}_count{Metrics._labels(key[1])} {histogram[-1]:g}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def directory() -> Path:
+        return Config.Server.working_directory / "metrics"
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> _Key:
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric `{name}`.")
+
+        Metrics._ensure_started()
+        return (name, tuple(sorted([(str(k), str(v)) for k, v in labels.items()])))
+
+    @staticmethod
+    def _labels(pairs: Tuple[Tuple[str, str], ...]) -> str:
+        if not pairs:
+            return ""
+
+        return "{" + ",".join([f'{k}="{v}"' for k, v in pairs]) + "}"
+
+    @staticmethod
+    def _snapshot() -> dict:
+        with Metrics._lock:
+            return _serialize(Metrics._values, Metrics._histograms)
+
+    @staticmethod
+    def _snapshots() -> Iterator[dict]:
+        """
+        Yields the snapshot of this process, the snapshots written by other living processes and the aggregate of
+        processes which exited. Snapshots of processes which exited are folded into the aggregate.
+        """
+
+        yield Metrics._snapshot()
+
+        if not Metrics.directory().is_dir():
+            return
+
+        for file in Metrics.directory().glob("*.json"):
+            pid = int(file.stem) if file.stem.isdigit() else None
+
+            if pid is None or pid == os.getpid():
+                continue
+
+            try:
+                if not _alive(pid):
+                    Metrics._fold(file)
+                    continue
+
+                yield json.loads(file.read_text())
+            except (OSError, ValueError) as err:
+                logger.warning("Unable to read metrics of process {}: {}", pid, err)
+
+        aggregate = Metrics.directory() / _AGGREGATE
+
+        try:
+            if aggregate.exists():
+                yield json.loads(aggregate.read_text())
+        except (OSError, ValueError) as err:
+            logger.warning("Unable to read metrics of exited processes: {}", err)
+
+    @staticmethod
+    def _fold(file: Path) -> None:
+        """
+        Adds the counters and histograms of the snapshot of a process which exited to the aggregate and removes the
+        snapshot. Processes which render the metrics concurrently fold each snapshot only once.
+        """
+
+        directory = Metrics.directory()
+        aggregate = directory / _AGGREGATE
+
+        with open(directory / "aggregate.lock", "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+
+            if not file.exists():
+                return
+
+            snapshot = json.loads(file.read_text())
+            snapshot["values"] = list(
+                [
+                    v
+                    for v in snapshot["values"]
+                    if METRICS.get(v[0], ("",))[0] == "counter"
+                ]
+            )
+
+            snapshots = [snapshot]
+
+            if aggregate.exists():
+                snapshots.append(json.loads(aggregate.read_text()))
+
+            temp = directory / f".aggregate.{uuid.uuid4()}.tmp"
+            temp.write_text(json.dumps(_serialize(*_merge(snapshots))))
+            os.replace(temp, aggregate)
+            file.unlink()
+
+    @staticmethod
+    def _ensure_started() -> None:
+        """
+        Starts the thread which writes the snapshots of this process. As threads are not inherited by forked processes,
+        a thread is started within each process and values of the parent process are reset.
+        """
+
+        if Metrics._pid == os.getpid():
+            return
+
+        with Metrics._lock:
+            if Metrics._pid == os.getpid():
+                return
+
+            Metrics._pid = os.getpid()
+            Metrics._values = {}
+            Metrics._histograms = {}
+
+            threading.Thread(target=Metrics._write_snapshots, daemon=True).start()
+
+    @staticmethod
+    def _write_snapshots() -> None:
+        directory = Metrics.directory()
+        target = directory / f"{os.getpid()}.json"
+
+        # A snapshot with the pid of this process was written by a process which exited, the pid has been reused.
+        try:
+            if target.exists():
+                Metrics._fold(target)
+        except (OSError, ValueError) as err:
+            logger.warning("Unable to fold metrics of process {}: {}", target.stem, err)
+
+        while True:
+            Metrics._changed.wait()
+            Metrics._changed.clear()
+
+            try:
+                directory.mkdir(parents=True, exist_ok=True)
+                temp = directory / f".{os.getpid()}.{uuid.uuid4()}.tmp"
+                temp.write_text(json.dumps(Metrics._snapshot()))
+                os.replace(temp, target)
+            except OSError as err:
+                logger.warning("Unable to write metrics: {}", err)
+
+            time.sleep(Config.Server.Metrics.write_interval_in_seconds)
+
+
+def _merge(
+    snapshots: Iterable[dict],
+) -> Tuple[Dict[_Key, float], Dict[_Key, List[float]]]:
+    """
+    Sums up the values and histograms of snapshots.
+    """
+
+    values: Dict[_Key, float] = {}
+    histograms: Dict[_Key, List[float]] = {}
+
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["values"]:
+            key = (name, tuple([(str(k), str(v)) for k, v in labels]))
+            values[key] = values.get(key, 0) + value
+
+        for name, labels, histogram in snapshot["histograms"]:
+            key = (name, tuple([(str(k), str(v)) for k, v in labels]))
+            merged = histograms.setdefault(key, [0.0] * len(histogram))
+            histograms[key] = [a + b for a, b in zip(merged, histogram)]
+
+    return values, histograms
+
+
+def _serialize(values: Dict[_Key, float], histograms: Dict[_Key, List[float]]) -> dict:
+    return {
+        "values": [
+            [name, list(labels), value] for (name, labels), value in values.items()
+        ],
+        "histograms": [
+            [name, list(labels), list(histogram)]
+            for (name, labels), histogram in histograms.items()
+        ],
+    }
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
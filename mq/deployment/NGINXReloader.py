@@ -0,0 +1,74 @@
+import os
+import signal
+import threading
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from mq.config import Config
+from mq.deployment.Metrics import Metrics
+
+
+class NGINXReloader:
+    """
+    Coalesces NGINX reloads.
+
+    The first reload request opens a window of `Config.Server.NGINX.reload_window_in_seconds`. All requests within this
+    window are served by a single SIGHUP which is sent when the window closes. As the configuration is written before
+    a reload is requested, the reload always picks up the latest configuration.
+    """
+
+    _lock = threading.Lock()
+    _pending: Optional[threading.Event] = None
+
+    @staticmethod
+    def request() -> threading.Event:
+        """
+        Requests a reload.
+
+        Returns
+        -------
+        An event which is set once NGINX has been signaled.
+        """
+
+        with NGINXReloader._lock:
+            if NGINXReloader._pending is None:
+                NGINXReloader._pending = threading.Event()
+
+                timer = threading.Timer(
+                    Config.Server.NGINX.reload_window_in_seconds, NGINXReloader._reload
+                )
+                timer.daemon = True
+                timer.start()
+
+            return NGINXReloader._pending
+
+    @staticmethod
+    def wait_pending() -> None:
+        """
+        Waits for a requested reload which has not been sent yet, if any.
+        """
+
+        with NGINXReloader._lock:
+            pending = NGINXReloader._pending
+
+        if pending is not None:
+            pending.wait()
+
+    @staticmethod
+    def _reload() -> None:
+        with NGINXReloader._lock:
+            done = NGINXReloader._pending
+            NGINXReloader._pending = None
+
+        try:
+            pid = int(Path(Config.Server.NGINX.pid_file).read_text())
+            os.kill(pid, signal.SIGHUP)
+            Metrics.inc("mq_nginx_reloads_total")
+            logger.info("Reloaded NGINX.")
+        except Exception:
+            logger.warning("Error occurred updating NGINX configuration.")
+        finally:
+            if done is not None:
+                done.set()
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict
+from typing import List
+from typing import Optional
+
+# Well-known files in the project root which indicate the kind of project, e.g. for buildpack detection.
+MARKER_FILES = [
+    "Dockerfile",
+    "Gemfile",
+    "Procfile",
+    "go.mod",
+    "index.html",
+    "package.json",
+    "pom.xml",
+    "pyproject.toml",
+    "requirements.txt",
+]
+
+
+class ProjectFile:
+    """
+    A file of a pushed project.
+
+    Parameters
+    ----------
+    path : str
+        The POSIX path of the file, relative to the project directory.
+    size : int
+        The size of the file in bytes.
+    digest : str
+        The SHA-256 hex digest of the file's content.
+    """
+
+    def __init__(self, path: str, size: int, digest: str) -> None:
+        self.path = path
+        self.size = size
+        self.digest = digest
+
+    @staticmethod
+    def from_dict(data: dict) -> "ProjectFile":
+        return ProjectFile(data["path"], int(data["size"]), data["digest"])
+
+    def to_dict(self) -> dict:
+        return {"path": self.path, "size": self.size, "digest": self.digest}
+
+
+class ProjectIndex:
+    """
+    Index of the files of a deployment, created once while the pushed files are extracted.
+
+    Buildpack detection, build cache keys and logging query the index instead of walking the project directory again.
+    """
+
+    def __init__(self, files: List[ProjectFile]) -> None:
+        self.files = sorted(files, key=lambda f: f.path)
+        self.paths = set([f.path for f in self.files])
+        self.markers = list([m for m in MARKER_FILES if m in self.paths])
+
+    @staticmethod
+    def location(working_dir: Path) -> Path:
+        return working_dir / "files.index.json"
+
+    @staticmethod
+    def from_dict(data: dict) -> "ProjectIndex":
+        return ProjectIndex(list([ProjectFile.from_dict(f) for f in data["files"]]))
+
+    def to_dict(self) -> dict:
+        return {
+            "markers": self.markers,
+            "files": list([f.to_dict() for f in self.files]),
+        }
+
+    @staticmethod
+    def from_digests(directory: Path, digests: Dict[str, str]) -> "ProjectIndex":
+        """
+        Creates the index for files whose digests are already known, e.g. from extraction or a push manifest.
+
+        Parameters
+        ----------
+        directory : Path
+            The project directory.
+        digests : Dict[str, str]
+            Relative file paths mapped to the SHA-256 digests of their content.
+        """
+
+        return ProjectIndex(
+            list(
+                [
+                    ProjectFile(path, os.stat(directory / path).st_size, digest)
+                    for path, digest in digests.items()
+                ]
+            )
+        )
+
+    @staticmethod
+    def build(directory: Path) -> "ProjectIndex":
+        """
+        Creates the index by walking and hashing a project directory. Only used if no index was created on extraction.
+        """
+
+        digests: Dict[str, str] = {}
+
+        for root, _, files in os.walk(directory):
+            for file in files:
+                absolute = Path(root) / file
+                sha = hashlib.sha256()
+
+                with open(absolute, "rb") as f:
+                    while chunk := f.read(1024 * 1024):
+                        sha.update(chunk)
+
+                digests[absolute.relative_to(directory).as_posix()] = sha.hexdigest()
+
+        return ProjectIndex.from_digests(directory, digests)
+
+    @staticmethod
+    def load(working_dir: Path) -> Optional["ProjectIndex"]:
+        """
+        Reads the index of a deployment, if it exists.
+        """
+
+        path = ProjectIndex.location(working_dir)
+
+        if not path.exists():
+            return None
+
+        return ProjectIndex.from_dict(json.loads(path.read_text()))
+
+    def save(self, working_dir: Path) -> None:
+        ProjectIndex.location(working_dir).write_text(json.dumps(self.to_dict()))
+
+    def contains(self, path: str) -> bool:
+        return path in self.paths
+
+    def size(self) -> int:
+        """
+        Returns the total size of all files in bytes.
+        """
+
+        return sum([f.size for f in self.files])
+
+    def hash(self) -> str:
+        """
+        Returns a hash over the paths and contents of all files.
+        """
+
+        sha = hashlib.sha256()
+
+        for f in self.files:
+            sha.update(f.path.encode("utf-8") + b"\0")
+            sha.update(bytes.fromhex(f.digest))
+
+        return sha.hexdigest()
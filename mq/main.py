@@ -1,10 +1,9 @@
+from typing import Optional
+
 import click
-import uvicorn
-from loguru import logger
 
-from mq.cli.push import Push
-from mq.deployment.DeploymentProcess import DeploymentMonitor
-from mq.deployment.Infrastructure import Infrastructure
+# Commands import their dependencies when they are invoked, thus the CLI starts without loading server modules (e.g.
+# uvicorn, docker) or the configuration. See `benchmarks/import_time.py`.
 
 
 @click.group()
@@ -25,27 +24,77 @@ def configure_nginx() -> None:
     Configure the local NGINX. Usually used for inital config.
     """
 
+    from mq.deployment.Infrastructure import Infrastructure
+
     Infrastructure.update_load_balancer(False)
 
 
 @server.command()
-def run() -> None:
+def gc() -> None:
+    """
+    Removes the working directories and images of old deployments once, see `server.gc` settings.
+    """
+
+    from mq.deployment.DeploymentProcess import DeploymentMonitor
+    from mq.deployment.GarbageCollector import GarbageCollector
+    from mq.deployment.LeaderLock import LeaderLock
+
+    # The collector waits while deployments are running or extracted. If no monitor runs (e.g. the server is stopped),
+    # these deployments were interrupted and would never finish. They are failed like the monitor does on its start.
+    lock = LeaderLock(DeploymentMonitor.lock_file())
+
+    if lock.acquire():
+        try:
+            DeploymentMonitor.recover_deployments()
+            DeploymentMonitor.recover_extractions()
+        finally:
+            lock.release()
+
+    removed = GarbageCollector.collect()
+    click.echo(f"Removed {len(removed)} deployment(s).")
+
+
+@server.command()
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of API worker processes, defaults to `server.api.workers`.",
+)
+def run(workers: Optional[int]) -> None:
     """
     Starts the Maquette Apps Server.
+
+    The API is served by one or more worker processes. The deployment monitor is started by one of them (see
+    `DeploymentMonitor.supervise`).
     """
 
+    import uvicorn
+    from loguru import logger
+
+    from mq.config import Config
+    from mq.deployment.Infrastructure import Infrastructure
+
     logger.info("Starting Maquette Apps.")
 
     Infrastructure.restore_instances()
-    DeploymentMonitor().start()
 
-    config = uvicorn.Config("mq.server:app", port=8000, log_level="info")
-    server = uvicorn.Server(config)
-    server.run()
+    uvicorn.run(
+        "mq.server:app",
+        port=Config.Server.API.port,
+        workers=workers or Config.Server.API.workers,
+        log_level="info",
+    )
 
 
 @mq.command()
 def push() -> None:
+    """
+    Pushes the current directory to the server and deploys it.
+    """
+
+    from mq.cli.push import Push
+
     Push.run()
 
 
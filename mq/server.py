@@ -1,73 +1,434 @@
+import asyncio
+import gzip
+import json
+import shutil
 import uuid
-import zipfile
 from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator
+from typing import Callable
+from typing import Collection
+from typing import Dict
+from typing import Optional
+from typing import Tuple
 
-import yaml
+from fastapi import BackgroundTasks
 from fastapi import FastAPI
-from fastapi import File
 from fastapi import HTTPException
+from fastapi import Query
+from fastapi import Request
 from fastapi import Response
-from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import PlainTextResponse
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from pydantic import BaseModel
+from pydantic import ValidationError
 
 from mq.config import Config
+from mq.deployment.Archive import Archive
+from mq.deployment.Archive import UploadTooLargeError
+from mq.deployment.BlobStore import BlobStore
+from mq.deployment.DeploymentInfo import EXTRACTION_LOCK
 from mq.deployment.DeploymentInfo import DeploymentInfo
 from mq.deployment.DeploymentInfo import DeploymentStatus
+from mq.deployment.DeploymentQueue import DeploymentQueue
+from mq.deployment.DeploymentStore import DeploymentStore
+from mq.deployment.LeaderLock import LeaderLock
+from mq.deployment.Metrics import Metrics
+from mq.deployment.ProjectIndex import ProjectIndex
 from mq.logger import Logger
 
 Logger.initialize()
 app = FastAPI()
 
+# Handlers of uploads and logs are coroutines, their blocking file and database I/O runs in the thread pool. Thus, a
+# worker keeps serving other requests (e.g. log streams) while a large upload is written to disk.
+
+
+class PushManifest(BaseModel):
+    files: Dict[str, str]
+
+
+@app.on_event("startup")
+def start_deployment_monitor() -> None:
+    """
+    Takes part in the election of the process which runs the deployment monitor, see `DeploymentMonitor.supervise`.
+    """
+
+    from mq.deployment.DeploymentProcess import DeploymentMonitor
+
+    DeploymentMonitor.supervise()
+
 
 @app.post("/api/push")
-def push(files: UploadFile = File()) -> dict:
-    # Initialize working directory
-    deployment_timestamp = datetime.now().strftime("%Y%d%m%H%M%S")
+async def push(request: Request, background_tasks: BackgroundTasks) -> dict:
+    """
+    Receives a ZIP archive of a project as form field `files`. The archive is extracted after the response has been
+    sent.
+    """
+
+    _check_content_length(request)
+    deployment_id, working_dir = await run_in_threadpool(_create_deployment)
+    await _receive_form(request, {"files": working_dir / "files.zip"}, working_dir)
+    await run_in_threadpool(
+        _schedule_extraction, background_tasks, working_dir, _extract_archive
+    )
+
+    return {"id": deployment_id}
+
+
+@app.post("/api/push/stream")
+async def push_stream(request: Request, background_tasks: BackgroundTasks) -> dict:
+    """
+    Receives a ZIP archive of a project as raw (chunked) request body. The archive is written to disk while it is
+    received and extracted after the response has been sent.
+    """
+
+    _check_content_length(request)
+    deployment_id, working_dir = await run_in_threadpool(_create_deployment)
+
+    try:
+        with Metrics.timer("mq_deployment_phase_seconds", phase="upload"):
+            await Archive.save_stream(request.stream(), working_dir / "files.zip")
+    except UploadTooLargeError as err:
+        await run_in_threadpool(shutil.rmtree, working_dir)
+        raise HTTPException(status_code=413, detail=str(err))
+
+    await run_in_threadpool(
+        _schedule_extraction, background_tasks, working_dir, _extract_archive
+    )
+
+    return {"id": deployment_id}
+
+
+@app.post("/api/push/missing")
+def push_missing(manifest: PushManifest) -> dict:
+    """
+    Returns the content hashes of a push manifest which are not yet known by the server.
+    """
+
+    try:
+        return {"missing": BlobStore.missing(manifest.files.values())}
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+
+
+@app.post("/api/push/delta")
+async def push_delta(request: Request, background_tasks: BackgroundTasks) -> dict:
+    """
+    Creates a deployment from a push manifest (form field `manifest`). The uploaded ZIP file (form field `blobs`) only
+    contains the blobs which were reported as missing, named by their content hash. All other files are taken from the
+    blob store.
+    """
+
+    _check_content_length(request)
+    deployment_id, working_dir = await run_in_threadpool(_create_deployment)
+    form = await _receive_form(
+        request, {"blobs": working_dir / "blobs.zip"}, working_dir, ["manifest"]
+    )
+
+    try:
+        files: Dict[str, str] = PushManifest.parse_raw(form.get("manifest", "")).files
+    except ValidationError as err:
+        await run_in_threadpool(shutil.rmtree, working_dir)
+        raise HTTPException(status_code=400, detail=str(err))
+
+    await run_in_threadpool(
+        (working_dir / "files.manifest.json").write_text, json.dumps({"files": files})
+    )
+    await run_in_threadpool(
+        _schedule_extraction, background_tasks, working_dir, _assemble_from_blobs
+    )
+
+    return {"id": deployment_id}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """
+    Exposes the metrics of the server and the deployment monitor in the Prometheus text format.
+    """
+
+    return PlainTextResponse(
+        Metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/api/deployments")
+def list_deployments(
+    limit: int = Query(default=50, ge=1, le=500),
+    before: Optional[str] = None,
+    application: Optional[str] = None,
+    status: Optional[DeploymentStatus] = None,
+) -> dict:
+    """
+    Lists deployments, newest first. To read the next page, pass the returned `next` value as `before`.
+    """
+
+    try:
+        deployments = DeploymentStore.list(limit, before, application, status)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+
+    return {
+        "deployments": list([d.dict() for d in deployments]),
+        "next": DeploymentStore.cursor(deployments[-1])
+        if len(deployments) == limit
+        else None,
+    }
+
+
+@app.get("/api/push/{deployment_id}", response_class=PlainTextResponse)
+async def read_push_logs(
+    response: Response, deployment_id: str, offset: int = 0
+) -> str:
+    """
+    Returns the deployment log starting at the byte `offset`. The offset to continue reading from is returned in the
+    `MQ-Log-Offset` header.
+    """
+
+    working_dir = await run_in_threadpool(_deployment_dir, deployment_id)
+    info, log, next_offset = await run_in_threadpool(
+        _poll_log, deployment_id, working_dir, offset
+    )
+
+    response.headers["MQ-Deployment-Status"] = info.status.value
+    response.headers["MQ-Log-Offset"] = str(next_offset)
+    return log.decode("utf-8", errors="replace")
+
+
+@app.get("/api/push/{deployment_id}/stream")
+async def stream_push_logs(deployment_id: str, offset: int = 0) -> StreamingResponse:
+    """
+    Streams new log lines and status changes of a deployment as Server-Sent Events.
+
+    Log lines are sent as `log` events, the event id is the byte offset after the event's lines. Thus, a client can
+    resume a stream with `offset`. Status changes are sent as `status` events. The stream ends after the deployment
+    finished and the complete log has been sent.
+    """
+
+    working_dir = await run_in_threadpool(_deployment_dir, deployment_id)
+
+    async def events() -> AsyncIterator[str]:
+        log_offset = offset
+        status: Optional[DeploymentStatus] = None
+
+        while True:
+            info, log, next_offset = await run_in_threadpool(
+                _poll_log, deployment_id, working_dir, log_offset, True
+            )
+            finished = info.status in [
+                DeploymentStatus.succeeded,
+                DeploymentStatus.failed,
+            ]
+
+            if log:
+                lines = log.decode("utf-8", errors="replace").splitlines()
+                data = "".join([f"data: {line}\n" for line in lines])
+                yield f"event: log\nid: {next_offset}\n{data}\n"
+                log_offset = next_offset
+
+            if info.status != status:
+                status = info.status
+                yield f"event: status\ndata: {status.value}\n\n"
+
+            if finished:
+                break
+
+            await asyncio.sleep(Config.Server.Logs.poll_interval_in_seconds)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _create_deployment() -> Tuple[str, Path]:
+    """
+    Initializes the working directory of a new deployment.
+    """
+
+    deployment_timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
     deployment_hash = str(uuid.uuid4())[:4]
     deployment_id = f"{deployment_timestamp}-{deployment_hash}"
     working_dir = Config.Server.working_directory / "deployments" / deployment_id
 
     working_dir.mkdir(parents=True)
 
-    # Save uploaded files and extract
-    with open(working_dir / "files.zip", "wb+") as destination:
-        destination.write(files.file.read())
+    return deployment_id, working_dir
 
-    with zipfile.ZipFile(working_dir / "files.zip", "r") as zip_ref:
-        zip_ref.extractall(working_dir / "files")
 
-    info = DeploymentInfo(status=DeploymentStatus.scheduled)
-    (working_dir / "deployment.info.yml").write_text(yaml.dump(info.dict()))
+def _check_content_length(request: Request) -> None:
+    """
+    Rejects an upload before its body is read if the announced size exceeds the limit. Chunked uploads have no length,
+    their size is checked while they are received.
+    """
 
-    return {"id": deployment_id}
+    length = request.headers.get("content-length", "")
 
+    if length.isdigit() and int(length) > Config.Server.Push.max_upload_size_in_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Upload exceeds maximum size of {Config.Server.Push.max_upload_size_in_bytes} bytes.",
+        )
 
-@app.get("/api/push/{deployment_id}", response_class=PlainTextResponse)
-def read_push_logs(response: Response, deployment_id: str) -> str:
-    deployment_info_file = (
-        Config.Server.working_directory
-        / "deployments"
-        / deployment_id
-        / "deployment.info.yml"
-    )
 
-    if deployment_info_file.exists():
-        info = DeploymentInfo.from_dict(
-            yaml.safe_load(deployment_info_file.read_text())
+async def _receive_form(
+    request: Request,
+    files: Dict[str, Path],
+    working_dir: Path,
+    fields: Collection[str] = (),
+) -> Dict[str, str]:
+    """
+    Streams the files of a multipart upload to disk and returns the other form fields. The deployment's working
+    directory is removed if the upload is rejected.
+    """
+
+    try:
+        with Metrics.timer("mq_deployment_phase_seconds", phase="upload"):
+            return await Archive.save_form(
+                request.stream(),
+                request.headers.get("content-type", ""),
+                files,
+                fields,
+            )
+    except UploadTooLargeError as err:
+        await run_in_threadpool(shutil.rmtree, working_dir)
+        raise HTTPException(status_code=413, detail=str(err))
+    except ValueError as err:
+        await run_in_threadpool(shutil.rmtree, working_dir)
+        raise HTTPException(status_code=400, detail=str(err))
+
+
+def _schedule_extraction(
+    background_tasks: BackgroundTasks,
+    working_dir: Path,
+    extract: Callable[[Path], None],
+) -> None:
+    """
+    Registers a deployment and extracts its upload after the response has been sent.
+
+    The extraction lock is held from now on until the extraction finished. If this process dies in between, the
+    deployment monitor finds the lock released and fails the deployment, see `DeploymentMonitor.recover_extractions`.
+    """
+
+    lock = LeaderLock(working_dir / EXTRACTION_LOCK)
+    lock.acquire()
+
+    DeploymentStore.create(working_dir.name)
+    background_tasks.add_task(_extract_deployment, working_dir, extract, lock)
+
+
+def _extract_deployment(
+    working_dir: Path, extract: Callable[[Path], None], lock: LeaderLock
+) -> None:
+    """
+    Runs the extraction step of a deployment and schedules the deployment afterwards.
+    """
+
+    try:
+        with Metrics.timer("mq_deployment_phase_seconds", phase="extract"):
+            extract(working_dir)
+    except Exception as err:
+        logger.warning("Unable to extract deployment `{}`: {}", working_dir.name, err)
+
+        with open(working_dir / "deployment.log", "a") as log:
+            log.write(f"Unable to extract uploaded files: {err}\n")
+
+        DeploymentStore.transition(
+            working_dir.name, DeploymentStatus.failed, [DeploymentStatus.extracting]
         )
-        deployment_log_file = (
-            Config.Server.working_directory
-            / "deployments"
-            / deployment_id
-            / "deployment.log"
+    else:
+        DeploymentStore.transition(
+            working_dir.name, DeploymentStatus.scheduled, [DeploymentStatus.extracting]
         )
+        DeploymentQueue.put(working_dir.name)
+    finally:
+        lock.release()
 
-        if deployment_log_file.exists():
-            log = deployment_log_file.read_text()
-        else:
-            log = ""
 
-        response.headers["MQ-Deployment-Status"] = info.status.value
-        return log
-    else:
+def _extract_archive(working_dir: Path) -> None:
+    digests = Archive.extract(working_dir / "files.zip", working_dir / "files")
+    ProjectIndex.from_digests(working_dir / "files", digests).save(working_dir)
+
+
+def _assemble_from_blobs(working_dir: Path) -> None:
+    for digest, blob in Archive.entries(working_dir / "blobs.zip"):
+        BlobStore.add(digest, blob)
+
+    files = json.loads((working_dir / "files.manifest.json").read_text())["files"]
+    BlobStore.materialize(files, working_dir / "files")
+    ProjectIndex.from_digests(working_dir / "files", files).save(working_dir)
+
+
+def _deployment_dir(deployment_id: str) -> Path:
+    _read_info(deployment_id)
+    return Config.Server.working_directory / "deployments" / deployment_id
+
+
+def _read_info(deployment_id: str) -> DeploymentInfo:
+    info = DeploymentStore.get(deployment_id)
+
+    if info is None:
         raise HTTPException(status_code=404, detail="Deployment does not exist.")
+
+    return info
+
+
+def _poll_log(
+    deployment_id: str, working_dir: Path, offset: int, stream: bool = False
+) -> Tuple[DeploymentInfo, bytes, int]:
+    """
+    Reads the status of a deployment and its log starting at a byte offset.
+
+    The status is read before the log, thus the log is complete once a final status is read. If `stream` is set, a
+    trailing incomplete line is only returned after the deployment finished.
+    """
+
+    info = _read_info(deployment_id)
+    finished = info.status in [DeploymentStatus.succeeded, DeploymentStatus.failed]
+    log, next_offset = _read_log(
+        working_dir, offset, complete_lines=stream and not finished
+    )
+
+    return info, log, next_offset
+
+
+def _read_log(
+    working_dir: Path, offset: int, complete_lines: bool = False
+) -> Tuple[bytes, int]:
+    """
+    Reads the deployment log starting at a byte offset. Offsets always refer to the uncompressed log.
+
+    Parameters
+    ----------
+    working_dir : Path
+        The deployment's working directory.
+    offset : int
+        The byte offset to start reading from.
+    complete_lines : bool
+        If set, a trailing incomplete line is not returned.
+
+    Returns
+    -------
+    The log content and the offset to continue reading from.
+    """
+
+    log_file = working_dir / "deployment.log"
+    compressed_log_file = working_dir / "deployment.log.gz"
+
+    try:
+        with open(log_file, "rb") as f:
+            f.seek(max(offset, 0))
+            content = f.read()
+    except FileNotFoundError:
+        # Logs of finished deployments are compressed. The compressed file is created before the log is removed.
+        if not compressed_log_file.exists():
+            return b"", offset
+
+        with gzip.open(compressed_log_file, "rb") as f:
+            f.seek(max(offset, 0))
+            content = f.read()
+
+    if complete_lines:
+        content = content[: content.rfind(b"\n") + 1]
+
+    return content, max(offset, 0) + len(content)
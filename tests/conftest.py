@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Settings are read on first use and cached afterwards, thus the working directory is set before any test imports the
+# server modules. All tests share it, they use unique deployment ids and paths.
+os.environ["MQ_SERVER__WORKING_DIRECTORY"] = tempfile.mkdtemp(prefix="mq-tests-")
+os.environ["MQ_SERVER__LOGS__COMPRESS"] = "false"
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import stat
+import uuid
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator
+from typing import Dict
+from typing import List
+
+import pytest
+from urllib3 import encode_multipart_formdata
+
+from mq.config import Config
+from mq.deployment.Archive import Archive
+
+
+def _archive(entries: Dict[str, bytes], links: Dict[str, str] = {}) -> Path:
+    path = Config.Server.working_directory / f"{uuid.uuid4()}.zip"
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, content in entries.items():
+            zip_ref.writestr(name, content)
+
+        for name, target in links.items():
+            info = zipfile.ZipInfo(name)
+            info.external_attr = (stat.S_IFLNK | 0o777) << 16
+            zip_ref.writestr(info, target)
+
+    return path
+
+
+def _target() -> Path:
+    return Config.Server.working_directory / str(uuid.uuid4())
+
+
+def test_extract_returns_digests() -> None:
+    target = _target()
+    digests = Archive.extract(
+        _archive({"index.html": b"<html/>", "src/app.py": b"print()"}), target
+    )
+
+    assert (target / "src" / "app.py").read_bytes() == b"print()"
+    assert digests == {
+        "index.html": hashlib.sha256(b"<html/>").hexdigest(),
+        "src/app.py": hashlib.sha256(b"print()").hexdigest(),
+    }
+
+
+@pytest.mark.parametrize("name", ["../evil.txt", "a/../../evil.txt", "/etc/evil"])
+def test_extract_rejects_paths_outside_of_target(name: str) -> None:
+    target = _target()
+
+    with pytest.raises(ValueError, match="Invalid entry"):
+        Archive.extract(_archive({name: b"evil"}), target)
+
+    assert not (target.parent / "evil.txt").exists()
+
+
+def test_extract_rejects_links() -> None:
+    target = _target()
+
+    with pytest.raises(ValueError, match="Links are not supported"):
+        Archive.extract(_archive({}, links={"passwd": "/etc/passwd"}), target)
+
+    assert not (target / "passwd").exists()
+
+
+def test_extract_rejects_zip_bombs() -> None:
+    size = Config.Server.Push.chunk_size_in_bytes * 2
+
+    with pytest.raises(ValueError, match="compression ratio"):
+        Archive.extract(_archive({"zeros": bytes(size)}), _target())
+
+
+def _save_form(fields: Dict[str, object], expected: List[str] = []) -> Dict[str, str]:
+    body, content_type = encode_multipart_formdata(fields)
+
+    async def source() -> AsyncIterator[bytes]:
+        for i in range(0, len(body), 1000):
+            yield body[i : i + 1000]
+
+    files = {"blobs": _target()}
+    return asyncio.run(Archive.save_form(source(), content_type, files, expected))
+
+
+def test_save_form_writes_files_and_returns_fields() -> None:
+    fields = _save_form(
+        {"manifest": "{}", "blobs": ("blobs.zip", b"zip" * 1000)}, ["manifest"]
+    )
+
+    assert fields == {"manifest": "{}"}
+
+
+def test_save_form_rejects_unexpected_fields() -> None:
+    with pytest.raises(ValueError, match="Unexpected form field `other`"):
+        _save_form({"other": ("blobs.zip", bytes(range(256)))})
+
+
+def test_save_form_limits_field_size() -> None:
+    size = Config.Server.Push.max_field_size_in_bytes + 1
+
+    with pytest.raises(ValueError, match="exceeds maximum size"):
+        _save_form({"manifest": "x" * size}, ["manifest"])
+
+
+def test_save_form_rejects_binary_fields() -> None:
+    with pytest.raises(ValueError, match="not UTF-8 text"):
+        _save_form(
+            {"manifest": bytes(range(256)), "blobs": ("blobs.zip", b"")}, ["manifest"]
+        )
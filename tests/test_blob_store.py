@@ -0,0 +1,74 @@
+import hashlib
+import io
+import os
+import time
+import uuid
+from pathlib import Path
+
+import pytest
+
+from mq.config import Config
+from mq.deployment.BlobStore import BlobStore
+
+
+def _add(content: bytes) -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    BlobStore.add(digest, io.BytesIO(content))
+
+    return digest
+
+
+def _target() -> Path:
+    return Config.Server.working_directory / str(uuid.uuid4())
+
+
+def test_add_verifies_digest() -> None:
+    digest = hashlib.sha256(b"expected").hexdigest()
+
+    with pytest.raises(ValueError, match="does not match"):
+        BlobStore.add(digest, io.BytesIO(b"tampered"))
+
+    assert BlobStore.missing([digest]) == [digest]
+    assert list(BlobStore.path(digest).parent.glob("*.tmp")) == []
+
+
+def test_path_rejects_invalid_digests() -> None:
+    with pytest.raises(ValueError, match="not a valid SHA-256 digest"):
+        BlobStore.path("../../etc/passwd")
+
+
+def test_materialize_copies_blobs() -> None:
+    digest = _add(b"hello")
+    target = _target()
+
+    BlobStore.materialize({"a/b.txt": digest}, target)
+
+    assert (target / "a" / "b.txt").read_bytes() == b"hello"
+
+
+@pytest.mark.parametrize(
+    "name", ["../evil.txt", "a/../../evil.txt", "/tmp/evil.txt", "."]
+)
+def test_materialize_rejects_paths_outside_of_target(name: str) -> None:
+    digest = _add(b"evil")
+    target = _target()
+
+    with pytest.raises(ValueError, match="Invalid file path"):
+        BlobStore.materialize({name: digest}, target)
+
+    assert not (target.parent / "evil.txt").exists()
+
+
+def test_materialize_requires_all_blobs() -> None:
+    digest = hashlib.sha256(str(uuid.uuid4()).encode()).hexdigest()
+
+    with pytest.raises(ValueError, match="not available"):
+        BlobStore.materialize({"a.txt": digest}, _target())
+
+
+def test_missing_refreshes_contained_blobs() -> None:
+    digest = _add(b"used")
+    os.utime(BlobStore.path(digest), (0, 0))
+
+    assert BlobStore.missing([digest]) == []
+    assert BlobStore.path(digest).stat().st_mtime > time.time() - 60
@@ -0,0 +1,50 @@
+import time
+import uuid
+
+from loguru import logger
+
+from mq.deployment.Deployment import Deployment
+
+
+def _log_call_seconds(calls: int = 2000, repeats: int = 5) -> float:
+    """
+    Returns the fastest average duration of a log call of the deployment monitor over a few repeats.
+    """
+
+    best = float("inf")
+
+    for _ in range(repeats):
+        started = time.perf_counter()
+
+        for _ in range(calls):
+            logger.info("Waiting for deployments.")
+
+        best = min(best, (time.perf_counter() - started) / calls)
+
+    return best
+
+
+def _deploy() -> None:
+    deployment = Deployment(f"test-{uuid.uuid4()}")
+    deployment.log.info("Started deployment {}", deployment.id)
+    deployment.close_log()
+
+
+def test_log_call_cost_does_not_grow_with_deployments() -> None:
+    logger.remove()
+    sink = logger.add(lambda message: None, level="INFO")
+
+    try:
+        _deploy()
+        single = _log_call_seconds()
+
+        for _ in range(5000):
+            _deploy()
+
+        many = _log_call_seconds()
+    finally:
+        logger.remove(sink)
+
+    # Leaked sinks made each log call check the filter of every deployment, a call took about ten times as long after
+    # 1000 deployments already.
+    assert many < single * 2
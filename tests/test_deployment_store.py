@@ -0,0 +1,81 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from mq.deployment.DeploymentInfo import DeploymentStatus
+from mq.deployment.DeploymentStore import DeploymentStore
+
+
+def _scheduled() -> str:
+    deployment_id = str(uuid.uuid4())
+    DeploymentStore.create(deployment_id)
+    DeploymentStore.transition(deployment_id, DeploymentStatus.scheduled)
+
+    return deployment_id
+
+
+def _claim(deployment_id: str) -> bool:
+    return DeploymentStore.transition(
+        deployment_id, DeploymentStatus.running, [DeploymentStatus.scheduled]
+    )
+
+
+def test_transition_claims_deployment_once() -> None:
+    deployment_id = _scheduled()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        claimed = list(executor.map(_claim, [deployment_id] * 8))
+
+    assert claimed.count(True) == 1
+    assert DeploymentStore.status(deployment_id) == DeploymentStatus.running
+
+
+def test_transition_checks_expected_status() -> None:
+    deployment_id = str(uuid.uuid4())
+    DeploymentStore.create(deployment_id)
+
+    assert not _claim(deployment_id)
+    assert DeploymentStore.status(deployment_id) == DeploymentStatus.extracting
+
+
+def test_transition_records_phase_times() -> None:
+    deployment_id = _scheduled()
+    _claim(deployment_id)
+    DeploymentStore.transition(deployment_id, DeploymentStatus.succeeded)
+
+    info = DeploymentStore.get(deployment_id)
+
+    assert info is not None
+    assert info.started_at is not None
+    assert info.finished_at is not None
+
+
+def test_set_active_deployments() -> None:
+    application = f"app-{uuid.uuid4()}"
+
+    DeploymentStore.set_active_deployments({application: "1"})
+    DeploymentStore.set_active_deployments({application: "2"})
+    assert DeploymentStore.active_deployments()[application] == "2"
+
+    DeploymentStore.set_active_deployments({application: None})
+    assert application not in DeploymentStore.active_deployments()
+
+
+def test_list_orders_by_creation_time() -> None:
+    application = f"app-{uuid.uuid4()}"
+    prefix = str(uuid.uuid4())
+
+    # Ids which do not sort by time, like the ids of older versions.
+    ids = [f"{prefix}-{suffix}" for suffix in ["c", "b", "a"]]
+
+    for deployment_id in ids:
+        DeploymentStore.create(deployment_id)
+        DeploymentStore.set_applications(deployment_id, {application: "tag"})
+        time.sleep(0.01)
+
+    first = DeploymentStore.list(limit=2, application=application)
+    second = DeploymentStore.list(
+        limit=2, before=DeploymentStore.cursor(first[-1]), application=application
+    )
+
+    assert [d.id for d in first + second] == list(reversed(ids))
@@ -0,0 +1,49 @@
+import hashlib
+import io
+import os
+import shutil
+import uuid
+
+import pytest
+
+from mq.config import Config
+from mq.deployment.BlobStore import BlobStore
+from mq.deployment.GarbageCollector import GarbageCollector
+
+
+def _add() -> str:
+    content = str(uuid.uuid4()).encode()
+    digest = hashlib.sha256(content).hexdigest()
+    BlobStore.add(digest, io.BytesIO(content))
+
+    return digest
+
+
+def test_remove_blobs_keeps_recently_used_blobs() -> None:
+    unused = _add()
+    used = _add()
+    os.utime(BlobStore.path(unused), (0, 0))
+    os.utime(BlobStore.path(used), (0, 0))
+
+    # A push asks for the blob, thus it is used again.
+    BlobStore.missing([used])
+
+    assert GarbageCollector._remove_blobs() >= 1
+    assert BlobStore.missing([unused, used]) == [unused]
+
+
+def test_remove_tree_ignores_entries_removed_concurrently(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    directory = Config.Server.working_directory / str(uuid.uuid4())
+    (directory / "a").mkdir(parents=True)
+    (directory / "a" / "file.txt").write_text("content")
+
+    # Another collector removes the tree after this collector listed it.
+    listing = list(os.walk(directory, topdown=False))
+    shutil.rmtree(directory)
+    monkeypatch.setattr(os, "walk", lambda *args, **kwargs: iter(listing))
+
+    GarbageCollector._remove_tree(directory)
+
+    assert not directory.exists()